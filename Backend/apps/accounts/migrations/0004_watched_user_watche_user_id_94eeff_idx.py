@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_user_subscription'),
+        ('movies', '0010_movieviewcountershard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='watched',
+            index=models.Index(fields=['user', 'finished', '-watched_at'], name='user_watche_user_id_94eeff_idx'),
+        ),
+    ]
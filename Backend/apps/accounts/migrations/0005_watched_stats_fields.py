@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_watched_user_watche_user_id_94eeff_idx'),
+        ('movies', '0012_statswatermark_moviedailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watched',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='watched',
+            name='stats_counted_on',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='watched',
+            index=models.Index(fields=['watched_at'], name='user_watche_watched_94add7_idx'),
+        ),
+    ]
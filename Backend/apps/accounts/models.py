@@ -98,6 +98,9 @@ class Watched(models.Model):
     duration_sec = models.PositiveIntegerField(default=0)  # длительность фильма
     progress_percent = models.PositiveSmallIntegerField(default=0)  # 0–100
     finished = models.BooleanField(default=True)    
+    finished_at = models.DateTimeField(null=True, blank=True)  # когда досмотрел (для дневной статистики)
+    # День, за который пользователь уже учтён в MovieDailyStats.unique_viewers
+    stats_counted_on = models.DateField(null=True, blank=True, editable=False)
 
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -108,6 +111,12 @@ class Watched(models.Model):
         db_table = 'user_watched'
         unique_together = ('user', 'movie')  # один активный запись на фильм
         ordering = ['-watched_at']
+        # «Продолжить просмотр»: WHERE user = ? AND finished = false ORDER BY watched_at DESC
+        indexes = [
+            models.Index(fields=['user', 'finished', '-watched_at']),
+            # Инкрементальная дневная статистика: WHERE watched_at > <watermark>
+            models.Index(fields=['watched_at']),
+        ]
 
     def __str__(self):
         return f'{self.user} watched {self.movie} ({self.progress_percent}%)'
\ No newline at end of file
@@ -1,19 +1,22 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import Movie, Genre, Author, Actor, MovieCharacter, Casting
-from .tasks import compute_movie_duration, bulk_recompute_durations
+from .models import (
+    Movie, MovieMediaInfo, MovieHlsPackage, MovieRendition, MovieTrickplay,
+    Genre, Author, Actor, MovieCharacter, Casting,
+)
+from .tasks import build_trickplay, compute_movie_duration, bulk_recompute_durations, package_hls
 
 @admin.register(Genre)
 class GenreAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug")
+    list_display = ("name", "slug", "movies_count")
     search_fields = ("name",)
     prepopulated_fields = {"slug": ("name",)}  # автогенерация slug
 
 
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "created_at", "updated_at")
+    list_display = ("name", "slug", "movies_count", "created_at", "updated_at")
     search_fields = ("name", "bio")
     prepopulated_fields = {"slug": ("name",)}
     readonly_fields = ("created_at", "updated_at")
@@ -21,7 +24,7 @@ class AuthorAdmin(admin.ModelAdmin):
 
 @admin.register(Actor)
 class ActorAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "created_at", "updated_at")
+    list_display = ("name", "slug", "movies_count", "created_at", "updated_at")
     search_fields = ("name", "bio")
     prepopulated_fields = {"slug": ("name",)}
     readonly_fields = ("created_at", "updated_at")
@@ -29,7 +32,7 @@ class ActorAdmin(admin.ModelAdmin):
 
 @admin.register(MovieCharacter)
 class MovieCharacterAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug")
+    list_display = ("name", "slug", "appearances_count")
     search_fields = ("name",)
     prepopulated_fields = {"slug": ("name",)}
 
@@ -42,6 +45,20 @@ class CastingInline(admin.TabularInline):
     ordering = ("credit_order",)
 
 
+class MovieMediaInfoInline(admin.StackedInline):
+    """Медиаданные заполняет задача compute_movie_duration — только просмотр"""
+    model = MovieMediaInfo
+    can_delete = False
+    readonly_fields = (
+        'duration_sec', 'width', 'height', 'bitrate', 'video_codec', 'audio_codec',
+        'fps', 'container', 'file_size', 'etag', 'source', 'probed_at',
+    )
+    fields = readonly_fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
     list_display = (
@@ -55,7 +72,7 @@ class MovieAdmin(admin.ModelAdmin):
     autocomplete_fields = ('author',)
     readonly_fields = (
         'views', 'created_at', 'updated_at', 
-        'poster_preview',    
+        'poster_preview', 'faststart_status',
     )
 
     fieldsets = (
@@ -64,7 +81,7 @@ class MovieAdmin(admin.ModelAdmin):
         }),
         ('Медиа', {
             'fields': (
-                'poster', 'video', 'poster_preview'
+                'poster', 'video', 'poster_preview', 'faststart_status'
             ),
         }),
         ('Служебное', {
@@ -72,7 +89,7 @@ class MovieAdmin(admin.ModelAdmin):
         }),
     )
 
-    inlines = [CastingInline]
+    inlines = [CastingInline, MovieMediaInfoInline]
      
     def poster_preview(self, obj):
         if obj.poster:
@@ -82,4 +99,56 @@ class MovieAdmin(admin.ModelAdmin):
             )
         return "—"
     poster_preview.short_description = "Постер"
- 
\ No newline at end of file
+ 
+
+class MovieRenditionInline(admin.TabularInline):
+    model = MovieRendition
+    extra = 0
+    can_delete = False
+    readonly_fields = (
+        'name', 'width', 'height', 'video_bitrate', 'audio_bitrate', 'status',
+        'segments', 'segments_uploaded', 'playlist_key', 'error', 'updated_at',
+    )
+    fields = readonly_fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MovieHlsPackage)
+class MovieHlsPackageAdmin(admin.ModelAdmin):
+    """HLS-пакеты собирает задача package_hls — здесь только статус и перезапуск"""
+    list_display = ('movie', 'status', 'ready_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('movie__title',)
+    readonly_fields = ('movie', 'status', 'prefix', 'master_key', 'source_etag', 'error', 'ready_at', 'updated_at')
+    inlines = [MovieRenditionInline]
+    actions = ['resume_packaging', 'repackage']
+
+    @admin.action(description="Продолжить упаковку HLS")
+    def resume_packaging(self, request, queryset):
+        for movie_id in queryset.values_list('movie_id', flat=True):
+            package_hls.delay(movie_id)  # type: ignore
+
+    @admin.action(description="Пересобрать HLS с нуля")
+    def repackage(self, request, queryset):
+        for movie_id in queryset.values_list('movie_id', flat=True):
+            package_hls.delay(movie_id, force=True)  # type: ignore
+
+
+@admin.register(MovieTrickplay)
+class MovieTrickplayAdmin(admin.ModelAdmin):
+    """Превью перемотки собирает задача build_trickplay"""
+    list_display = ('movie', 'status', 'frames', 'ready_at')
+    list_filter = ('status',)
+    search_fields = ('movie__title',)
+    readonly_fields = (
+        'movie', 'status', 'prefix', 'vtt_key', 'source_etag', 'interval_sec', 'tile_width', 'tile_height',
+        'columns', 'rows', 'frames', 'sheets', 'error', 'ready_at', 'updated_at',
+    )
+    actions = ['rebuild']
+
+    @admin.action(description="Пересобрать превью")
+    def rebuild(self, request, queryset):
+        for movie_id in queryset.values_list('movie_id', flat=True):
+            build_trickplay.delay(movie_id, force=True)  # type: ignore
@@ -1,7 +1,9 @@
-from django.db.models import Count, Avg, Sum, Q
+from django.db.models import Count, Sum, Q, ExpressionWrapper, FloatField
+from django.db.models.functions import NullIf
 from django.utils import timezone
 from datetime import timedelta
-from .models import Movie
+from .models import Movie, MovieDailyStats
+from .services import als, hll, similarity
 from apps.accounts.models import Watched
 
 
@@ -10,28 +12,72 @@ class MovieAnalytics:
     
     @staticmethod
     def get_popular_movies(days=30, limit=10):
-        """Самые популярные фильмы за период"""
-        cutoff_date = timezone.now() - timedelta(days=days)
-        
+        """Самые популярные фильмы за период (по дневному rollup'у MovieDailyStats)"""
+        cutoff_date = timezone.localdate() - timedelta(days=days)
+        in_period = Q(daily_stats__date__gte=cutoff_date)
+
         return (
             Movie.objects
             .annotate(
-                recent_views=Count(
-                    'watchers',
-                    filter=Q(watched__watched_at__gte=cutoff_date)
+                recent_views=Sum('daily_stats__views_started', filter=in_period),
+                completion_rate=ExpressionWrapper(
+                    Sum('daily_stats__completion_sum', filter=in_period) * 1.0
+                    / NullIf(Sum('daily_stats__views_started', filter=in_period), 0),
+                    output_field=FloatField(),
                 ),
-                completion_rate=Avg(
-                    'watched__progress_percent',
-                    filter=Q(watched__watched_at__gte=cutoff_date)
-                )
             )
             .filter(recent_views__gt=0)
-            .order_by('-recent_views')[:limit]
+            .order_by('-recent_views', 'id')[:limit]
+        )
+
+    @staticmethod
+    def get_daily_totals(days=30, movie=None):
+        """Сумма по всем фильмам (или по одному) за каждый день периода"""
+        cutoff_date = timezone.localdate() - timedelta(days=days)
+        stats = MovieDailyStats.objects.filter(date__gte=cutoff_date)
+        if movie is not None:
+            stats = stats.filter(movie=movie)
+        return (
+            stats
+            .values('date')
+            .annotate(
+                views_started=Sum('views_started'),
+                views_finished=Sum('views_finished'),
+                unique_viewers=Sum('unique_viewers'),
+                completion_sum=Sum('completion_sum'),
+            )
+            .order_by('date')
         )
     
     @staticmethod
-    def get_user_recommendations(user, limit=10):
-        """Рекомендации на основе истории просмотров"""
+    def get_unique_viewers(days=30, movie=None):
+        """
+        Оценка уникальных зрителей за период: слияние дневных HyperLogLog-скетчей
+        (одного фильма или всего каталога), без чтения Watched.
+        """
+        cutoff_date = timezone.localdate() - timedelta(days=days)
+        stats = MovieDailyStats.objects.filter(date__gte=cutoff_date).exclude(viewers_hll=b'')
+        if movie is not None:
+            stats = stats.filter(movie=movie)
+        registers = hll.empty()
+        for sketch in stats.values_list('viewers_hll', flat=True).iterator(chunk_size=2000):
+            registers = hll.merge(registers, hll.from_bytes(sketch))
+        return hll.count(registers)
+
+    @staticmethod
+    def get_user_recommendations(user, limit=10, queryset=None):
+        """
+        Рекомендации на основе истории просмотров:
+        1. implicit ALS (services/als.py) — персональный скоринг;
+        2. item-item соседи (services/similarity.py), если модели ещё нет;
+        3. при холодном старте (нет истории) — по жанрам.
+        """
+        queryset = queryset if queryset is not None else Movie.objects.all()
+        for source in (als, similarity):
+            recommended = source.recommend(user, queryset, limit=limit)
+            if recommended:
+                return recommended
+
         # Получаем жанры просмотренных фильмов
         watched_genres = (
             user.watched_movies.all()
@@ -41,10 +87,10 @@ class MovieAnalytics:
         
         # Ищем похожие фильмы
         return (
-            Movie.objects
+            queryset
             .filter(genres__id__in=watched_genres)
             .exclude(id__in=user.watched_movies.values_list('id', flat=True))
-            .annotate(views_count=Count('watchers'))
-            .order_by('-views_count', '-created_at')
+            .annotate(watchers_count=Count('watchers'))  # views_count — свойство модели
+            .order_by('-watchers_count', '-created_at')
             .distinct()[:limit]
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,67 @@
+import shutil
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.movies.utils import mp4_header
+from apps.movies.utils.video_meta import probe_video_metadata
+
+EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the pure-Python MP4 header parser against ffprobe on a directory of local sample files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus', help='Directory with sample .mp4/.m4v/.mov files')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _time(self, func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return (time.perf_counter() - started) / repeat * 1000, result
+
+    def handle(self, *args, **options):
+        files = sorted(p for p in Path(options['corpus']).rglob('*') if p.suffix.lower() in EXTENSIONS)
+        if not files:
+            raise CommandError(f"No sample files in {options['corpus']}")
+
+        repeat = options['repeat']
+        has_ffprobe = shutil.which('ffprobe') is not None
+        if not has_ffprobe:
+            self.stdout.write(self.style.WARNING("ffprobe not found: only the header parser is measured"))
+
+        totals = {'header': 0.0, 'ffprobe': 0.0}
+        mismatches = 0
+        for path in files:
+            def parse():
+                reader = mp4_header.FileReader(str(path))
+                try:
+                    return mp4_header.read_metadata(reader)
+                finally:
+                    reader.close()
+
+            try:
+                header_ms, header = self._time(parse, repeat)
+            except mp4_header.Mp4Error as e:
+                self.stdout.write(self.style.WARNING(f"{path.name}: header parser skipped ({e})"))
+                continue
+            totals['header'] += header_ms
+            line = f"{path.name}: header {header_ms:.2f} ms"
+
+            if has_ffprobe:
+                ffprobe_ms, probed = self._time(lambda: probe_video_metadata(str(path)), repeat)
+                totals['ffprobe'] += ffprobe_ms
+                line += f", ffprobe {ffprobe_ms:.1f} ms"
+                if probed and probed['duration_sec'] != header['duration_sec']:
+                    mismatches += 1
+                    line += f" (duration {header['duration_sec']} vs {probed['duration_sec']})"
+            self.stdout.write(line)
+
+        summary = f"Total over {len(files)} files: header {totals['header']:.1f} ms"
+        if has_ffprobe:
+            speedup = totals['ffprobe'] / totals['header'] if totals['header'] else 0
+            summary += f", ffprobe {totals['ffprobe']:.1f} ms (×{speedup:.0f}), duration mismatches: {mismatches}"
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,58 @@
+import random
+import time
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from apps.movies.services import trending
+
+
+class Command(BaseCommand):
+    help = 'Benchmark trending: event cost, refresh over N titles and top-N read (isolated LocMem cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--titles', type=int, default=100_000)
+        parser.add_argument('--events', type=int, default=200_000)
+        parser.add_argument('--hours', type=int, default=24, help='Hours of history to spread events over')
+        parser.add_argument('--reads', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        titles, events, hours = options['titles'], options['events'], options['hours']
+        # Отдельный кэш: боевые ключи трендов не трогаем
+        bench_cache = LocMemCache('bench-trending', {'OPTIONS': {'MAX_ENTRIES': 10_000_000}})
+        rng = random.Random(0)
+        start_hour = trending.current_hour() - hours + 1
+
+        with mock.patch.object(trending, 'cache', bench_cache):
+            # Первые titles событий покрывают весь каталог, остальные — с перекосом к популярным
+            movie_ids = list(range(1, titles + 1))
+            stream = movie_ids + [int(rng.paretovariate(1.2)) % titles + 1 for _ in range(max(0, events - titles))]
+
+            elapsed_record = 0.0
+            elapsed_refresh = []
+            per_hour = len(stream) // hours + 1
+            for h in range(hours):
+                now = (start_hour + h) * 3600 + 1800
+                chunk = stream[h * per_hour:(h + 1) * per_hour]
+                started = time.perf_counter()
+                for movie_id in chunk:
+                    trending.record(movie_id, 'finish' if rng.random() < 0.3 else 'start', now=now)
+                elapsed_record += time.perf_counter() - started
+
+                started = time.perf_counter()
+                summary = trending.refresh(now=now)
+                elapsed_refresh.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for _ in range(options['reads']):
+                trending.top(20)
+            elapsed_read = time.perf_counter() - started
+
+        self.stdout.write(f"Titles in window: {summary['movies']}, events: {len(stream)}")
+        self.stdout.write(f"record(): {elapsed_record / len(stream) * 1e6:.1f} µs/event")
+        self.stdout.write(
+            f"refresh(): last {elapsed_refresh[-1] * 1000:.0f} ms, "
+            f"max {max(elapsed_refresh) * 1000:.0f} ms over {hours} hourly runs"
+        )
+        self.stdout.write(self.style.SUCCESS(f"top(20): {elapsed_read / options['reads'] * 1e6:.1f} µs/read"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.movies.services import similarity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild item-item movie similarity (top-K neighbours) from watch history and likes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=None,
+            help='Neighbours stored per movie (default: settings.SIMILARITY_TOP_K)',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        pairs = similarity.build_similarity(options['top_k'])
+        self.stdout.write(
+            self.style.SUCCESS(f"✓ Stored {pairs} neighbour pairs in {time.monotonic() - started:.2f}s")
+        )
@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from apps.movies.models import Movie
+from apps.movies.services import media_info
 from apps.movies.tasks import compute_movie_duration, bulk_recompute_durations
-import time
 
 
 class Command(BaseCommand):
@@ -11,7 +12,7 @@ class Command(BaseCommand):
         parser.add_argument(
             '--all',
             action='store_true',
-            help='Recompute duration for ALL movies (even with existing duration)',
+            help='Recheck ALL movies (unchanged files are skipped by ETag)',
         )
         parser.add_argument(
             '--movie-id',
@@ -23,6 +24,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Execute synchronously instead of using Celery',
         )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.MEDIA_PROBE_CONCURRENCY,
+            help='Parallel ffprobe processes for --sync (default: MEDIA_PROBE_CONCURRENCY)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=settings.MEDIA_PROBE_TIMEOUT,
+            help='Per-movie ffprobe timeout in seconds',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Probe even if the file ETag and size are unchanged',
+        )
         parser.add_argument(
             '--limit',
             type=int,
@@ -36,13 +54,12 @@ class Command(BaseCommand):
             movie_id = options['movie_id']
             
             if options['sync']:
-                from apps.movies.tasks import compute_movie_duration
-                result = compute_movie_duration(movie_id)
+                result = compute_movie_duration(movie_id, force=options['force'])
                 self.stdout.write(
                     self.style.SUCCESS(f"✓ Result: {result}")
                 )
             else:
-                compute_movie_duration.delay(movie_id)# type: ignore
+                compute_movie_duration.delay(movie_id, force=options['force'])# type: ignore
                 self.stdout.write(
                     self.style.SUCCESS(f"✓ Queued movie {movie_id}")
                 )
@@ -56,9 +73,9 @@ class Command(BaseCommand):
         else:
             queryset = Movie.objects.filter(
                 video__isnull=False,
-                duration__isnull=True
+                media_info__isnull=True
             )
-            self.stdout.write("Processing movies without duration...")
+            self.stdout.write("Processing movies without media info...")
         
         limit = options['limit']
         movie_ids = list(queryset.values_list('id', flat=True)[:limit])
@@ -72,39 +89,28 @@ class Command(BaseCommand):
         self.stdout.write(f"Found {len(movie_ids)} movies to process.")
         
         if options['sync']:
-            # Синхронное выполнение
-            for i, movie_id in enumerate(movie_ids, 1):
-                self.stdout.write(f"[{i}/{len(movie_ids)}] Processing movie {movie_id}...")
-                
-                try:
-                    result = compute_movie_duration(movie_id) # type: ignore
-                    
-                    if result.get('success'):
-                        duration = result.get('duration')
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"  ✓ Duration: {duration}s"
-                            )
-                        )
-                    elif result.get('skipped'):
-                        self.stdout.write(
-                            self.style.WARNING("  ⏭ Skipped (already has duration)")
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.ERROR(f"  ✗ Error: {result.get('error')}")
-                        )
-                except Exception as e:
-                    self.stdout.write(
-                        self.style.ERROR(f"  ✗ Exception: {e}")
-                    )
-                
-                # Небольшая задержка между запросами
-                if i < len(movie_ids):
-                    time.sleep(0.5)
+            # Синхронно, но параллельно: пул потоков с ffprobe, запись в БД в этом потоке
+            def report(done, total, movie, outcome):
+                status = outcome['status']
+                if status == 'failed':
+                    line = self.style.ERROR(f"  ✗ {movie.pk}: {outcome.get('error')}")
+                elif status == 'skipped':
+                    line = self.style.WARNING(f"  ⏭ {movie.pk}: unchanged")
+                else:
+                    line = self.style.SUCCESS(f"  ✓ {movie.pk}: {outcome['metadata'].get('duration_sec')}s ({status})")
+                self.stdout.write(f"[{done}/{total}] {line}")
+
+            summary = media_info.probe_many(
+                movie_ids,
+                concurrency=options['concurrency'],
+                timeout=options['timeout'],
+                force=options['force'],
+                progress=report,
+            )
+            self.stdout.write(f"Summary: {summary}")
         else:
             # Асинхронное выполнение через Celery
-            bulk_recompute_durations.delay(movie_ids)
+            bulk_recompute_durations.delay(movie_ids, force=options['force'])
             
             self.stdout.write(
                 self.style.SUCCESS(
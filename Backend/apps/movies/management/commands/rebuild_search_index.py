@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from apps.movies.services import search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the in-process catalog search index and publish its snapshot to the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-publish',
+            action='store_true',
+            help='Only build the index (useful to measure build time), do not publish the snapshot',
+        )
+
+    def handle(self, *args, **options):
+        index = search_index.rebuild_index(publish=not options['no_publish'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Indexed {len(index)} documents "
+                f"({len(index.postings)} terms), catalog version {index.version}"
+            )
+        )
+        if not options['no_publish']:
+            self.stdout.write("Snapshot published: web workers will pick it up on the next query.")
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.movies.services.counters import COUNTERS, refresh_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized movies_count / appearances_count in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of rows updated per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        for model, (field, _) in COUNTERS.items():
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            self.stdout.write(f"{model.__name__}.{field}: {len(ids)} rows")
+
+            updated = 0
+            for start in range(0, len(ids), chunk_size):
+                # Каждая пачка — отдельная короткая транзакция, таблица не блокируется надолго
+                with transaction.atomic():
+                    updated += refresh_counters(model, ids[start:start + chunk_size])
+
+            self.stdout.write(self.style.SUCCESS(f"  ✓ Updated {updated} rows"))
+
+        self.stdout.write(self.style.SUCCESS("\n✅ Done!"))
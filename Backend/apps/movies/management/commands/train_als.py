@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.movies.services import als
+
+
+class Command(BaseCommand):
+    help = 'Train the implicit ALS model for the personalized feed and publish new factor files'
+
+    def handle(self, *args, **options):
+        result = als.train_and_publish()
+        if result.get('skipped'):
+            self.stdout.write(self.style.WARNING("No interactions yet, nothing to train"))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Version {result['version']}: {result['users']} users × {result['movies']} movies "
+                f"in {result['seconds']}s"
+            )
+        )
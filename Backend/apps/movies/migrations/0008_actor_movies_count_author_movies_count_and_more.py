@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset, group_field, count_expr):
+    subquery = (
+        queryset
+        .filter(**{group_field: OuterRef("pk")})
+        .order_by()
+        .values(group_field)
+        .annotate(c=count_expr)
+        .values("c")
+    )
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    Movie = apps.get_model("movies", "Movie")
+    Casting = apps.get_model("movies", "Casting")
+
+    apps.get_model("movies", "Genre").objects.update(
+        movies_count=_count(Movie.genres.through.objects.all(), "genre_id", Count("pk"))
+    )
+    apps.get_model("movies", "Author").objects.update(
+        movies_count=_count(Movie.objects.all(), "author_id", Count("pk"))
+    )
+    apps.get_model("movies", "Actor").objects.update(
+        movies_count=_count(Casting.objects.all(), "actor_id", Count("movie_id", distinct=True))
+    )
+    apps.get_model("movies", "MovieCharacter").objects.update(
+        appearances_count=_count(Casting.objects.all(), "character_id", Count("pk"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_remove_movie_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actor',
+            name='movies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='movies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='genre',
+            name='movies_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='moviecharacter',
+            name='appearances_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_actor_movies_count_author_movies_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='actor',
+            index=models.Index(fields=['name', 'id'], name='actors_name_adeabf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['name', 'id'], name='authors_name_165cc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['year', 'id'], name='movies_year_e2a7e3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title', 'id'], name='movies_title_8dea0e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['views', 'id'], name='movies_views_22c20f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['created_at', 'id'], name='movies_created_223574_idx'),
+        ),
+    ]
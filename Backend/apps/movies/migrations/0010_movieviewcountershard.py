@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_actor_actors_name_adeabf_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieViewCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('delta', models.PositiveIntegerField(default=0)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_shards', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_view_counter_shards',
+                'unique_together': {('movie', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_movieviewcountershard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='movies.movie')),
+                ('neighbour', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_similarity',
+                'ordering': ['movie', '-score'],
+                'indexes': [models.Index(fields=['movie', '-score'], name='movie_simil_movie_i_09508a_idx')],
+                'unique_together': {('movie', 'neighbour')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_moviesimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'stats_watermarks',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('views_started', models.PositiveIntegerField(default=0)),
+                ('views_finished', models.PositiveIntegerField(default=0)),
+                ('unique_viewers', models.PositiveIntegerField(default=0)),
+                ('completion_sum', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_daily_stats',
+                'indexes': [models.Index(fields=['date', 'movie'], name='movie_daily_date_f953d6_idx')],
+                'unique_together': {('movie', 'date')},
+            },
+        ),
+    ]
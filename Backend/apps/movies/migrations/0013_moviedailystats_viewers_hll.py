@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_statswatermark_moviedailystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moviedailystats',
+            name='viewers_hll',
+            field=models.BinaryField(default=b''),
+        ),
+    ]
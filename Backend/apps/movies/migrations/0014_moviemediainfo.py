@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_moviedailystats_viewers_hll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieMediaInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('duration_sec', models.PositiveIntegerField(blank=True, null=True)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('bitrate', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('video_codec', models.CharField(blank=True, max_length=32)),
+                ('audio_codec', models.CharField(blank=True, max_length=32)),
+                ('fps', models.FloatField(blank=True, null=True)),
+                ('container', models.CharField(blank=True, max_length=64)),
+                ('file_size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('etag', models.CharField(blank=True, max_length=128)),
+                ('source', models.CharField(default='ffprobe', max_length=16)),
+                ('probed_at', models.DateTimeField(auto_now=True)),
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='media_info', to='movies.movie')),
+            ],
+            options={
+                'verbose_name': 'Media info',
+                'verbose_name_plural': 'Media info',
+                'db_table': 'movie_media_info',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_moviemediainfo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moviemediainfo',
+            name='seek_index',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_moviemediainfo_seek_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieHlsPackage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('prefix', models.CharField(blank=True, max_length=512)),
+                ('master_key', models.CharField(blank=True, max_length=512)),
+                ('source_etag', models.CharField(blank=True, max_length=128)),
+                ('error', models.TextField(blank=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='hls', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_hls_packages',
+            },
+        ),
+        migrations.CreateModel(
+            name='MovieRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField()),
+                ('video_bitrate', models.PositiveIntegerField()),
+                ('audio_bitrate', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('transcoding', 'Transcoding'), ('uploading', 'Uploading'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('segments', models.PositiveIntegerField(default=0)),
+                ('segments_uploaded', models.PositiveIntegerField(default=0)),
+                ('playlist_key', models.CharField(blank=True, max_length=512)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='movies.moviehlspackage')),
+            ],
+            options={
+                'db_table': 'movie_renditions',
+                'ordering': ['-height'],
+                'unique_together': {('package', 'name')},
+            },
+        ),
+    ]
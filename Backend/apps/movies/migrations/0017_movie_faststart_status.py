@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_hls_packages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='faststart_status',
+            field=models.CharField(blank=True, choices=[('', 'Unchecked'), ('ok', 'Already fast-start'), ('remuxed', 'Remuxed'), ('not_mp4', 'Not MP4/MOV'), ('failed', 'Failed')], default='', editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_movie_faststart_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieTrickplay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('prefix', models.CharField(blank=True, max_length=512)),
+                ('vtt_key', models.CharField(blank=True, max_length=512)),
+                ('source_etag', models.CharField(blank=True, max_length=128)),
+                ('interval_sec', models.PositiveIntegerField(default=10)),
+                ('tile_width', models.PositiveIntegerField(default=0)),
+                ('tile_height', models.PositiveIntegerField(default=0)),
+                ('columns', models.PositiveIntegerField(default=0)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('frames', models.PositiveIntegerField(default=0)),
+                ('sheets', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('ready_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trickplay', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_trickplay',
+            },
+        ),
+    ]
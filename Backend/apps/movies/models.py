@@ -3,13 +3,17 @@ from django.utils import timezone
 from django.db import models
 from django.urls import reverse
 from django.utils.text import slugify
-from django.db.models import F
+from django.db.models import F, Count, Sum, Exists, OuterRef, Subquery, Value, IntegerField, BooleanField
+from django.db.models.functions import Coalesce
 
 class Genre(models.Model):
     """Модель жанра фильма"""
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True)
 
+    # Денормализованный счётчик, поддерживается сигналами (services/counters.py)
+    movies_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         db_table = "genres"
         verbose_name = "Genre"
@@ -31,6 +35,7 @@ class Actor(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     bio = models.TextField(blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/actors/', blank=True, null=True)
+    movies_count = models.PositiveIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -40,6 +45,9 @@ class Actor(models.Model):
         verbose_name = "Actor"
         verbose_name_plural = "Actors"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=['name', 'id']),  # курсор по name
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -57,6 +65,7 @@ class Author(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     bio = models.TextField(blank=True, null=True)
     avatar = models.ImageField(upload_to='avatars/authors/', blank=True, null=True)
+    movies_count = models.PositiveIntegerField(default=0, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -66,6 +75,9 @@ class Author(models.Model):
         verbose_name = "Author"
         verbose_name_plural = "Authors"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=['name', 'id']),  # курсор по name
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -80,6 +92,7 @@ class Author(models.Model):
 class MovieCharacter(models.Model):
     name = models.CharField(max_length=100, unique=True)  
     slug = models.SlugField(max_length=100, unique=True, blank=True)
+    appearances_count = models.PositiveIntegerField(default=0, editable=False)
     # можно добавить "franchise" и т.п.
 
     class Meta:
@@ -108,7 +121,79 @@ class Casting(models.Model):
         unique_together = ('movie', 'character', 'actor')
         ordering = ['movie', 'credit_order']
 
-    
+
+
+class MovieQuerySet(models.QuerySet):
+
+    def with_likes(self, user=None):
+        """
+        Аннотирует likes_count и is_liked одним запросом
+        (подзапрос-агрегат + EXISTS) вместо двух запросов на каждый фильм.
+        """
+        from apps.accounts.models import Favorite
+
+        likes = (
+            Favorite.objects
+            .filter(movie=OuterRef('pk'))
+            .order_by()
+            .values('movie')
+            .annotate(c=Count('pk'))
+            .values('c')
+        )
+        qs = self.annotate(
+            likes_count=Coalesce(Subquery(likes, output_field=IntegerField()), 0)
+        )
+
+        if user is not None and user.is_authenticated:
+            return qs.annotate(
+                is_liked=Exists(Favorite.objects.filter(movie=OuterRef('pk'), user=user))
+            )
+        return qs.annotate(is_liked=Value(False, output_field=BooleanField()))
+
+    def with_live_views(self):
+        """
+        Аннотирует views_live = views + ещё не сброшенные инкременты
+        из MovieViewCounterShard (см. services/view_counter.py).
+        """
+        pending = (
+            MovieViewCounterShard.objects
+            .filter(movie=OuterRef('pk'))
+            .order_by()
+            .values('movie')
+            .annotate(total=Sum('delta'))
+            .values('total')
+        )
+        return self.annotate(
+            views_live=F('views') + Coalesce(Subquery(pending, output_field=IntegerField()), 0)
+        )
+
+    # Поля, которые не нужны карточкам в списках — откладываем, если их не запросили
+    HEAVY_COLUMNS = ('description', 'video')
+
+    def for_fields(self, fields, user=None):
+        """
+        Готовит queryset под набор полей представления (sparse fieldsets):
+        join'ы, prefetch'и и аннотации — только для реально запрошенных полей.
+        """
+        qs = self
+        if fields & {'author', 'author_info'}:
+            qs = qs.select_related('author')
+        if fields & {'genres', 'genres_info'}:
+            qs = qs.prefetch_related('genres')
+        if 'cast' in fields:
+            qs = qs.prefetch_related('cast__actor', 'cast__character')
+        if 'media_info' in fields:
+            qs = qs.select_related('media_info')
+        if 'likes' in fields:
+            qs = qs.with_likes(user)
+        if 'views' in fields:
+            qs = qs.with_live_views()
+
+        deferred = [name for name in self.HEAVY_COLUMNS if name not in fields]
+        if deferred:
+            qs = qs.defer(*deferred)
+        return qs
+
 
 class Movie(models.Model):
     """Модель фильма"""
@@ -156,11 +241,30 @@ class Movie(models.Model):
     last_meta_update = models.DateTimeField(null=True, blank=True)
     meta_dirty = models.BooleanField(default=False)
 
+    # Расположение moov (задача movies.ensure_faststart); пусто — ещё не проверяли этот файл
+    FASTSTART_CHOICES = [
+        ('', 'Unchecked'),
+        ('ok', 'Already fast-start'),
+        ('remuxed', 'Remuxed'),
+        ('not_mp4', 'Not MP4/MOV'),
+        ('failed', 'Failed'),
+    ]
+    faststart_status = models.CharField(max_length=16, choices=FASTSTART_CHOICES, blank=True, default='', editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
     class Meta:
         db_table = "movies"
         verbose_name = "Movie"
         verbose_name_plural = "Movies"
         ordering = ["author", "title"]
+        # Ключи курсорной пагинации: <поле сортировки>, id
+        indexes = [
+            models.Index(fields=['year', 'id']),
+            models.Index(fields=['title', 'id']),
+            models.Index(fields=['views', 'id']),
+            models.Index(fields=['created_at', 'id']),
+        ]
 
     def __str__(self):
         return self.title
@@ -176,9 +280,275 @@ class Movie(models.Model):
     
     @property
     def views_count(self):
-        return self.views
+        """Просмотры с учётом ещё не сброшенных в views инкрементов"""
+        live = getattr(self, 'views_live', None)
+        if live is not None:
+            return live
+        from .services import view_counter
+        return self.views + view_counter.pending([self.pk]).get(self.pk, 0)
     
 
     def increment_views(self):
-        """Метод для увеличения количества просмотров фильма"""
-        Movie.objects.filter(pk=self.pk).update(views=F('views') + 1)
+        """
+        Метод для увеличения количества просмотров фильма.
+        Пишем в полосатый счётчик, а не в строку movies: у популярных фильмов
+        она становится точкой конкуренции. В views попадает задачей flush_view_counters.
+        """
+        from .services import view_counter
+        view_counter.increment(self.pk)
+
+
+class MovieMediaInfo(models.Model):
+    """
+    Технические данные видеофайла фильма: заполняются одним вызовом ffprobe
+    (задача compute_movie_duration). etag/file_size — отпечаток файла, по которому
+    повторная проверка пропускается, если видео не менялось.
+    """
+    movie = models.OneToOneField('Movie', related_name='media_info', on_delete=models.CASCADE)
+
+    duration_sec = models.PositiveIntegerField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    bitrate = models.PositiveBigIntegerField(null=True, blank=True)  # бит/с
+    video_codec = models.CharField(max_length=32, blank=True)
+    audio_codec = models.CharField(max_length=32, blank=True)
+    fps = models.FloatField(null=True, blank=True)
+    container = models.CharField(max_length=64, blank=True)  # format_name ffprobe, напр. "mov,mp4,m4a,3gp,3g2,mj2"
+
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=128, blank=True)
+    source = models.CharField(max_length=16, default='ffprobe')  # header (свой разбор MP4) | ffprobe | filename
+    # Ключевые кадры «время -> байт» (utils/seek_index), только для MP4/MOV
+    seek_index = models.BinaryField(null=True, blank=True, editable=False)
+
+    probed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "movie_media_info"
+        verbose_name = "Media info"
+        verbose_name_plural = "Media info"
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.resolution or '?'} {self.video_codec}"  # type: ignore
+
+    @property
+    def duration(self):
+        return timedelta(seconds=self.duration_sec) if self.duration_sec is not None else None
+
+    @property
+    def resolution(self):
+        return f"{self.width}x{self.height}" if self.width and self.height else None
+
+    def seek(self, position_sec: float) -> dict | None:
+        """Точка входа для возобновления: ближайший ключевой кадр не позже позиции и его Range."""
+        if not self.seek_index:
+            return None
+        from .utils.seek_index import SeekIndex
+
+        index = SeekIndex.decode(self.seek_index)
+        hit = index.lookup(position_sec)
+        if hit is None:
+            return None
+        keyframe_sec, offset = hit
+        return {
+            'position_sec': position_sec,
+            'keyframe_sec': keyframe_sec,
+            'byte_offset': offset,
+            'range': f"bytes={offset}-",
+            # moov нужен плееру для декодирования; при faststart он уже в начале файла
+            'header_range': f"bytes={index.moov_offset}-{index.moov_offset + index.moov_size - 1}",
+        }
+
+    def is_current(self, etag, size) -> bool:
+        """Файл не менялся с последней проверки (ETag и размер совпадают)."""
+        return bool(etag) and self.etag == etag and self.file_size == size and self.source != 'filename'
+
+
+class MovieHlsPackage(models.Model):
+    """
+    HLS-упаковка видео фильма (services/hls, задача movies.package_hls):
+    лесенка битрейтов + master-плейлист в хранилище под префиксом видео.
+    source_etag — ETag исходника, из которого собрано; при замене видео пакет пересобирается.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    movie = models.OneToOneField('Movie', related_name='hls', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    prefix = models.CharField(max_length=512, blank=True)       # movies/videos/<имя>/hls/<etag>/
+    master_key = models.CharField(max_length=512, blank=True)   # <prefix>master.m3u8, пока не ready — пусто
+    source_etag = models.CharField(max_length=128, blank=True)
+    error = models.TextField(blank=True)
+
+    ready_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "movie_hls_packages"
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.status}"  # type: ignore
+
+    @property
+    def is_ready(self):
+        return self.status == 'ready' and bool(self.master_key)
+
+
+class MovieRendition(models.Model):
+    """Одна ступень лесенки: отдельный прогресс нужен, чтобы прерванная упаковка продолжалась с места"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('transcoding', 'Transcoding'),
+        ('uploading', 'Uploading'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    package = models.ForeignKey(MovieHlsPackage, related_name='renditions', on_delete=models.CASCADE)
+    name = models.CharField(max_length=16)  # '720p'
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField()
+    video_bitrate = models.PositiveIntegerField()  # кбит/с
+    audio_bitrate = models.PositiveIntegerField()  # кбит/с
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    segments = models.PositiveIntegerField(default=0)
+    segments_uploaded = models.PositiveIntegerField(default=0)
+    playlist_key = models.CharField(max_length=512, blank=True)
+    error = models.TextField(blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "movie_renditions"
+        unique_together = ('package', 'name')
+        ordering = ['-height']
+
+    def __str__(self):
+        return f"{self.package_id}/{self.name}: {self.status}"  # type: ignore
+
+    @property
+    def bandwidth(self):
+        """BANDWIDTH для master-плейлиста: пиковый битрейт (maxrate видео + аудио), бит/с"""
+        return int((self.video_bitrate * 1.07 + self.audio_bitrate) * 1000)
+
+
+class MovieTrickplay(models.Model):
+    """
+    Превью для перемотки (services/trickplay, задача movies.build_trickplay):
+    листы JPEG/WebP с кадрами через interval_sec и WebVTT-индекс к ним.
+    Собирается один раз на версию видео (source_etag).
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    movie = models.OneToOneField('Movie', related_name='trickplay', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    prefix = models.CharField(max_length=512, blank=True)   # movies/videos/<имя>/trickplay/<etag>/
+    vtt_key = models.CharField(max_length=512, blank=True)
+    source_etag = models.CharField(max_length=128, blank=True)
+
+    interval_sec = models.PositiveIntegerField(default=10)
+    tile_width = models.PositiveIntegerField(default=0)
+    tile_height = models.PositiveIntegerField(default=0)
+    columns = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0)
+    frames = models.PositiveIntegerField(default=0)
+    sheets = models.JSONField(default=list, blank=True)   # имена листов по порядку
+
+    error = models.TextField(blank=True)
+    ready_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "movie_trickplay"
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.status}"  # type: ignore
+
+    @property
+    def is_ready(self):
+        return self.status == 'ready' and bool(self.vtt_key)
+
+
+class MovieViewCounterShard(models.Model):
+    """Одна из SHARDS «полос» счётчика просмотров фильма (накопленный, ещё не сброшенный delta)"""
+    SHARDS = 8
+
+    movie = models.ForeignKey('Movie', related_name='view_shards', on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    delta = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "movie_view_counter_shards"
+        unique_together = ('movie', 'shard')
+
+
+class MovieSimilarity(models.Model):
+    """
+    Предрасчитанные соседи фильма (item-item косинус по просмотрам и лайкам).
+    Пересчитывается целиком задачей build_similarity, на чтении — один запрос по индексу.
+    """
+    movie = models.ForeignKey('Movie', related_name='neighbours', on_delete=models.CASCADE)
+    neighbour = models.ForeignKey('Movie', related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        db_table = "movie_similarity"
+        unique_together = ('movie', 'neighbour')
+        ordering = ['movie', '-score']
+        indexes = [
+            models.Index(fields=['movie', '-score']),
+        ]
+
+
+class MovieDailyStats(models.Model):
+    """
+    Дневной rollup просмотров фильма (поддерживается задачей refresh_daily_stats).
+    Аналитика читает только эту таблицу, а не Watched.
+    """
+    movie = models.ForeignKey('Movie', related_name='daily_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+
+    views_started = models.PositiveIntegerField(default=0)   # Watched, созданные в этот день
+    views_finished = models.PositiveIntegerField(default=0)  # досмотренные в этот день
+    unique_viewers = models.PositiveIntegerField(default=0)  # разные пользователи, смотревшие в этот день
+    completion_sum = models.PositiveBigIntegerField(default=0)  # сумма progress_percent начатых просмотров
+    # HyperLogLog зрителей дня (services/hll): сливается по дням для «уникальных за N дней»
+    viewers_hll = models.BinaryField(default=b'', editable=False)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "movie_daily_stats"
+        unique_together = ('movie', 'date')
+        indexes = [
+            models.Index(fields=['date', 'movie']),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} @ {self.date}"  # type: ignore
+
+    @property
+    def avg_completion(self):
+        return round(self.completion_sum / self.views_started, 1) if self.views_started else None
+
+
+class StatsWatermark(models.Model):
+    """До какого момента инкрементальная задача уже обработала исходные данные"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "stats_watermarks"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
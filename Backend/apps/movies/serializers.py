@@ -1,54 +1,74 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.utils.text import slugify
-from .models import Movie, Genre, Author, Actor, MovieCharacter, Casting
+from .models import Movie, MovieMediaInfo, Genre, Author, Actor, MovieCharacter, Casting
 from apps.accounts.models import Watched
+from .services import progress_buffer
+
+
+# ===== Sparse fieldsets =====
+
+def _parse_csv(value) -> set:
+    return {item.strip() for item in (value or '').split(',') if item.strip()}
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets для read-сериализаторов:
+    - ?fields=id,title,slug — отдать только перечисленные поля;
+    - ?expand=user_progress — включить тяжёлые поля из Meta.expandable_fields,
+      которые по умолчанию не отдаются.
+    Вьюхи используют get_requested_fields(), чтобы не тянуть из БД лишнее.
+    """
+
+    @classmethod
+    def get_requested_fields(cls, request) -> set:
+        declared = set(cls.Meta.fields)  # type: ignore
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))  # type: ignore
+        if request is None:
+            return declared - expandable
+
+        fields = _parse_csv(request.query_params.get('fields')) & declared
+        expand = _parse_csv(request.query_params.get('expand')) & expandable
+        return (fields or declared - expandable) | expand
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.get_requested_fields(self.context.get('request'))  # type: ignore
+        for name in set(self.fields) - requested:  # type: ignore
+            self.fields.pop(name)  # type: ignore
 
 
 # ===== Base =====
 
 class GenreSerializer(serializers.ModelSerializer):
-    movies_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Genre
         fields = ['id', 'name', 'slug', 'movies_count']
         read_only_fields = ['slug', 'movies_count']
 
-    def get_movies_count(self, obj):
-        return obj.movies.count()
-
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['name'])
         return super().create(validated_data)
 
 
 class AuthorSerializer(serializers.ModelSerializer):
-    movies_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Author
         fields = ['id', 'name', 'slug', 'bio', 'created_at', 'updated_at', 'movies_count']
         read_only_fields = ['slug', 'created_at', 'updated_at', 'movies_count']
 
-    def get_movies_count(self, obj):
-        return obj.movies.count()
-
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['name'])
         return super().create(validated_data)
 
 
 class ActorSerializer(serializers.ModelSerializer):
-    movies_count = serializers.SerializerMethodField()
-
     class Meta:
         model = Actor
         fields = ['id', 'name', 'slug', 'bio', 'avatar', 'created_at', 'updated_at', 'movies_count']
         read_only_fields = ['slug', 'created_at', 'updated_at', 'movies_count']
 
-    def get_movies_count(self, obj):
-        return obj.movies.count()
-
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['name'])
         return super().create(validated_data)
@@ -57,16 +77,11 @@ class ActorSerializer(serializers.ModelSerializer):
 # ===== Characters & Cast =====
 
 class MovieCharacterSerializer(serializers.ModelSerializer):
-    appearances_count = serializers.SerializerMethodField()
-
     class Meta:
         model = MovieCharacter
         fields = ['id', 'name', 'slug', 'appearances_count']
         read_only_fields = ['slug', 'appearances_count']
 
-    def get_appearances_count(self, obj):
-        return obj.appearances.count()
-
     def create(self, validated_data):
         validated_data['slug'] = slugify(validated_data['name'])
         return super().create(validated_data)
@@ -106,24 +121,40 @@ class CastingCreateSerializer(serializers.ModelSerializer):
 
 # ===== Movies =====
 
-class MovieSerializer(serializers.ModelSerializer):
+class MovieMediaInfoSerializer(serializers.ModelSerializer):
+    resolution = serializers.ReadOnlyField()
+
+    class Meta:
+        model = MovieMediaInfo
+        fields = [
+            'duration_sec', 'width', 'height', 'resolution', 'bitrate',
+            'video_codec', 'audio_codec', 'fps', 'container', 'file_size', 'probed_at',
+        ]
+
+
+class MovieSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = serializers.StringRelatedField()
     genres = serializers.StringRelatedField(many=True)
     likes = serializers.SerializerMethodField()
-    views = serializers.ReadOnlyField()
+    views = serializers.IntegerField(source='views_count', read_only=True)  # + несброшенные инкременты
     cast = CastingSerializer(many=True, read_only=True)  # <-- добавили состав
+    media_info = MovieMediaInfoSerializer(read_only=True)
     
     class Meta:
         model = Movie
         fields = [
             'id', 'title', 'slug', 'description', 
             'year', 'poster', 'video', 'likes',
-            'views', 'author', 'genres', 'cast'
+            'views', 'author', 'genres', 'cast', 'media_info',
         ]
         read_only_fields = ['slug', 'author', 'likes', 'views',]
 
  
     def get_likes(self, obj):
+        # Быстрый путь: значения уже посчитаны в основном запросе (Movie.objects.with_likes)
+        if hasattr(obj, 'likes_count'):
+            return {'count': obj.likes_count, 'is_liked': bool(getattr(obj, 'is_liked', False))}
+
         request = self.context.get('request')
         count = getattr(obj, 'favorite_set', None).count() if hasattr(obj, 'favorite_set') else 0 # type: ignore
         is_liked = False
@@ -140,8 +171,13 @@ class MovieSerializer(serializers.ModelSerializer):
             .only('last_position_sec', 'duration_sec', 'progress_percent', 'finished')
             .first()
         )
-        if not w:
+        # Heartbeat'ы могут ещё лежать в write-behind буфере
+        entry = progress_buffer.peek(user.pk, obj.pk) if settings.PROGRESS_WRITE_BEHIND else None
+        if not w and not entry:
             return None
+        if not w:
+            w = Watched(finished=entry.get('finished', False))  # type: ignore
+        progress_buffer.merge(w, entry)
         return {
             'position_sec': w.last_position_sec,
             'duration_sec': w.duration_sec,
@@ -150,12 +186,14 @@ class MovieSerializer(serializers.ModelSerializer):
         }
 
 
-class MovieDetailSerializer(serializers.ModelSerializer):
+class MovieDetailSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author_info = serializers.SerializerMethodField()
     genres_info = serializers.SerializerMethodField()
-    likes = serializers.ReadOnlyField()
-    views = serializers.ReadOnlyField()
+    likes = serializers.SerializerMethodField()
+    views = serializers.IntegerField(source='views_count', read_only=True)  # + несброшенные инкременты
     cast = CastingSerializer(many=True, read_only=True)  # <-- cast и здесь
+    user_progress = serializers.SerializerMethodField()
+    media_info = MovieMediaInfoSerializer(read_only=True)  # None, пока видео не обработано
     
     class Meta:
         model = Movie
@@ -163,9 +201,15 @@ class MovieDetailSerializer(serializers.ModelSerializer):
             'id', 'title', 'slug', 'description',
             'year', 'poster', 'video', 'likes',
             'views', 'author', 'author_info', 'genres', 'genres_info',
-            'cast',
+            'cast', 'user_progress', 'media_info',
         ]
         read_only_fields = ['slug', 'author', 'likes', 'views']
+        # Прогресс текущего пользователя — по ?expand=user_progress (плеер, «продолжить»)
+        expandable_fields = ['user_progress']
+
+    # Та же логика, что в MovieSerializer (аннотация with_likes, write-behind буфер)
+    get_likes = MovieSerializer.get_likes
+    get_user_progress = MovieSerializer.get_user_progress
 
     def get_author_info(self, obj):
         author = obj.author
@@ -177,7 +221,7 @@ class MovieDetailSerializer(serializers.ModelSerializer):
             'slug': author.slug,
             'bio': author.bio,
             'avatar': author.avatar.url if author.avatar else None,
-            'movies_count': author.movies.count()
+            'movies_count': author.movies_count
         }
 
     def get_genres_info(self, obj):
@@ -187,7 +231,7 @@ class MovieDetailSerializer(serializers.ModelSerializer):
                     'id': genre.id,
                     'name': genre.name,
                     'slug': genre.slug,
-                    'movies_count': genre.movies.count()
+                    'movies_count': genre.movies_count
                 } for genre in obj.genres.all()
             ]
         return []
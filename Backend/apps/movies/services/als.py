@@ -0,0 +1,268 @@
+# apps/movies/services/als.py
+"""
+Персональная лента: implicit ALS (Hu, Koren, Volinsky) по матрице пользователь × фильм.
+
+Обучение (задача movies.train_als на Celery-воркере):
+    r_ui = доля просмотра + бонус за досмотр + бонус за лайк
+    c_ui = 1 + ALS_ALPHA · r_ui, p_ui = 1
+Факторы сохраняются в ALS_MODEL_DIR/<версия>/*.npy (float32), текущая версия —
+в файле CURRENT (подменяется атомарно). Веб-воркеры открывают массивы через
+np.load(mmap_mode='r'): страницы общие в page cache, копии в памяти процесса нет.
+
+Запрос: вектор пользователя (из обучения или fold-in для новых) · item_factors,
+затем argpartition top-K без досмотренных фильмов.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from .similarity import in_order
+
+logger = logging.getLogger(__name__)
+
+POINTER_FILE = "CURRENT"
+KEEP_VERSIONS = 2
+# Как часто веб-воркер проверяет, не появилась ли новая версия модели
+RELOAD_CHECK_SECONDS = 60
+
+FINISHED_BONUS = 0.5
+FAVORITE_BONUS = 1.0
+
+
+# ===== Данные =====
+
+def interaction_matrix():
+    """CSR-матрица r_ui (пользователь × фильм) и массивы id строк/столбцов."""
+    from apps.accounts.models import Favorite, Watched
+
+    watched = np.array(
+        list(Watched.objects.values_list('user_id', 'movie_id', 'progress_percent', 'finished')),
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    favorites = np.array(
+        list(Favorite.objects.values_list('user_id', 'movie_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    user_ids, user_index = np.unique(np.concatenate([watched[:, 0], favorites[:, 0]]), return_inverse=True)
+    movie_ids, movie_index = np.unique(np.concatenate([watched[:, 1], favorites[:, 1]]), return_inverse=True)
+
+    values = np.concatenate([
+        watched[:, 2] / 100.0 + FINISHED_BONUS * watched[:, 3],
+        np.full(len(favorites), FAVORITE_BONUS),
+    ])
+    # Просмотр и лайк одного фильма складываются (coo -> csr суммирует дубликаты)
+    matrix = sparse.coo_matrix(
+        (values, (user_index, movie_index)), shape=(len(user_ids), len(movie_ids))
+    ).tocsr()
+    return matrix, user_ids, movie_ids
+
+
+# ===== Обучение =====
+
+def _solve_side(ratings, fixed, gram, alpha, regularization):
+    """
+    Один полушаг ALS: для каждой строки ratings решаем
+    (YᵀY + Yᵀ(Cu − I)Y + λI) x = Yᵀ Cu p(u), где Y — fixed.
+    """
+    factors = fixed.shape[1]
+    reg = regularization * np.eye(factors)
+    out = np.zeros((ratings.shape[0], factors), dtype=np.float64)
+    for row in range(ratings.shape[0]):
+        lo, hi = ratings.indptr[row], ratings.indptr[row + 1]
+        if lo == hi:
+            continue
+        out[row] = _fold_in(fixed, gram, ratings.indices[lo:hi], ratings.data[lo:hi], alpha, reg)
+    return out
+
+
+def _fold_in(item_factors, gram, indices, values, alpha, reg):
+    y = np.asarray(item_factors[indices], dtype=np.float64)
+    confidence = alpha * values  # c − 1
+    a = gram + (y.T * confidence) @ y + reg
+    b = y.T @ (1.0 + confidence)
+    return np.linalg.solve(a, b)
+
+
+def train(matrix, *, factors: int, iterations: int, regularization: float, alpha: float, seed: int = 0):
+    """Возвращает (user_factors, item_factors) в float32."""
+    rng = np.random.default_rng(seed)
+    n_users, n_items = matrix.shape
+    users = rng.normal(0, 0.01, (n_users, factors))
+    items = rng.normal(0, 0.01, (n_items, factors))
+    by_item = matrix.T.tocsr()
+
+    for _ in range(iterations):
+        users = _solve_side(matrix, items, items.T @ items, alpha, regularization)
+        items = _solve_side(by_item, users, users.T @ users, alpha, regularization)
+    return users.astype(np.float32), items.astype(np.float32)
+
+
+def train_and_publish() -> dict:
+    """Обучает модель по текущим данным и публикует новую версию."""
+    matrix, user_ids, movie_ids = interaction_matrix()
+    if not matrix.nnz:
+        logger.info("ALS: no interactions, skipping")
+        return {'skipped': True}
+
+    started = time.monotonic()
+    user_factors, item_factors = train(
+        matrix,
+        factors=settings.ALS_FACTORS,
+        iterations=settings.ALS_ITERATIONS,
+        regularization=settings.ALS_REGULARIZATION,
+        alpha=settings.ALS_ALPHA,
+    )
+    version = publish(user_ids, movie_ids, user_factors, item_factors)
+    elapsed = time.monotonic() - started
+    logger.info(f"ALS trained: {matrix.shape[0]} users × {matrix.shape[1]} movies, version {version}, {elapsed:.1f}s")
+    return {'version': version, 'users': int(matrix.shape[0]), 'movies': int(matrix.shape[1]), 'seconds': round(elapsed, 2)}
+
+
+# ===== Хранение =====
+
+def _model_dir() -> Path:
+    return Path(settings.ALS_MODEL_DIR)
+
+
+def publish(user_ids, movie_ids, user_factors, item_factors) -> str:
+    """Пишет массивы в новый каталог версии и переключает на него CURRENT."""
+    root = _model_dir()
+    version = time.strftime('%Y%m%d%H%M%S') + f"-{os.getpid()}"
+    path = root / version
+    path.mkdir(parents=True)
+
+    np.save(path / 'user_ids.npy', np.asarray(user_ids, dtype=np.int64))
+    np.save(path / 'movie_ids.npy', np.asarray(movie_ids, dtype=np.int64))
+    np.save(path / 'user_factors.npy', user_factors)
+    np.save(path / 'item_factors.npy', item_factors)
+    item64 = item_factors.astype(np.float64)
+    np.save(path / 'gram.npy', item64.T @ item64)
+
+    tmp = root / f"{POINTER_FILE}.tmp"
+    tmp.write_text(version)
+    os.replace(tmp, root / POINTER_FILE)  # атомарно: читатели видят либо старую, либо новую версию
+
+    # Старые версии удаляем; уже открытые mmap у читателей остаются валидными
+    versions = sorted(p for p in root.iterdir() if p.is_dir())
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return version
+
+
+class AlsModel:
+    """Факторы одной версии, открытые через mmap."""
+
+    def __init__(self, path: Path, version: str):
+        self.version = version
+        self.user_ids = np.load(path / 'user_ids.npy')
+        self.movie_ids = np.load(path / 'movie_ids.npy')
+        self.user_factors = np.load(path / 'user_factors.npy', mmap_mode='r')
+        self.item_factors = np.load(path / 'item_factors.npy', mmap_mode='r')
+        self.gram = np.load(path / 'gram.npy')
+
+    def _positions(self, ids, values):
+        """Позиции значений values в отсортированном массиве ids (отсутствующие отбрасываются)."""
+        values = np.asarray(values, dtype=np.int64)
+        positions = np.searchsorted(ids, values)
+        positions = np.minimum(positions, len(ids) - 1)
+        found = ids[positions] == values
+        return positions[found], found
+
+    def user_vector(self, user_id, history):
+        """
+        Вектор пользователя: из обучения, а для новых пользователей —
+        fold-in по текущей истории (одно решение k×k при фиксированных item-факторах).
+        """
+        positions, _ = self._positions(self.user_ids, [user_id])
+        if len(positions):
+            return np.asarray(self.user_factors[positions[0]])
+
+        if not history:
+            return None
+        movie_ids, values = zip(*history.items())
+        columns, found = self._positions(self.movie_ids, movie_ids)
+        if not len(columns):
+            return None
+        reg = settings.ALS_REGULARIZATION * np.eye(self.item_factors.shape[1])
+        return _fold_in(
+            self.item_factors, self.gram, columns, np.asarray(values)[found], settings.ALS_ALPHA, reg
+        ).astype(np.float32)
+
+    def recommend(self, vector, *, exclude=(), limit: int = 20) -> list[int]:
+        scores = self.item_factors @ vector
+        excluded, _ = self._positions(self.movie_ids, list(exclude))
+        scores[excluded] = -np.inf
+
+        limit = min(limit, len(scores) - len(excluded))
+        if limit <= 0:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [int(movie_id) for movie_id in self.movie_ids[top]]
+
+
+_model = None
+_model_checked_at = 0.0
+_model_lock = threading.Lock()
+
+
+def get_model() -> AlsModel | None:
+    """Текущая модель процесса; CURRENT перечитывается не чаще RELOAD_CHECK_SECONDS."""
+    global _model, _model_checked_at
+    now = time.monotonic()
+    if _model is not None and now - _model_checked_at < RELOAD_CHECK_SECONDS:
+        return _model
+
+    with _model_lock:
+        _model_checked_at = now
+        pointer = _model_dir() / POINTER_FILE
+        try:
+            version = pointer.read_text().strip()
+        except FileNotFoundError:
+            _model = None
+            return None
+        if _model is None or _model.version != version:
+            _model = AlsModel(_model_dir() / version, version)
+        return _model
+
+
+# ===== Запрос =====
+
+def user_history(user) -> tuple[dict, set]:
+    """r_ui пользователя по фильмам (как при обучении) и множество досмотренных."""
+    from apps.accounts.models import Favorite, Watched
+
+    history, finished = {}, set()
+    for movie_id, percent, is_finished in Watched.objects.filter(user=user).values_list(
+        'movie_id', 'progress_percent', 'finished'
+    ):
+        history[movie_id] = percent / 100.0 + FINISHED_BONUS * is_finished
+        if is_finished:
+            finished.add(movie_id)
+    for movie_id in Favorite.objects.filter(user=user).values_list('movie_id', flat=True):
+        history[movie_id] = history.get(movie_id, 0.0) + FAVORITE_BONUS
+    return history, finished
+
+
+def recommend_ids(user, *, limit: int = 20) -> list[int]:
+    model = get_model()
+    if model is None:
+        return []
+
+    history, finished = user_history(user)
+    vector = model.user_vector(user.pk, history)
+    if vector is None:
+        return []
+    return model.recommend(vector, exclude=finished, limit=limit)
+
+
+def recommend(user, queryset, *, limit: int = 20) -> list:
+    return in_order(recommend_ids(user, limit=limit), queryset)
@@ -0,0 +1,86 @@
+# apps/movies/services/catalog_cache.py
+import hashlib
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "catalog:version"
+HITS_KEY = "catalog:stats:hits"
+MISSES_KEY = "catalog:stats:misses"
+
+
+def get_catalog_version() -> int:
+    """Текущая версия каталога (часть ключа кэша)."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # add() не перезапишет значение, если другой воркер успел раньше
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version() -> int:
+    """
+    Инвалидирует все закэшированные ответы каталога.
+    Старые ключи не удаляются — они просто перестают читаться и истекают по TTL.
+    """
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Ключа ещё нет (или он вытеснен) — начинаем с новой версии
+        cache.set(VERSION_KEY, 2, timeout=None)
+        return 2
+
+
+def make_cache_key(request, prefix: str = "movies:list") -> str:
+    """
+    Ключ кэша по нормализованной строке запроса:
+    параметры и их значения сортируются, пустые значения отбрасываются.
+    """
+    params = []
+    for name in sorted(request.query_params.keys()):
+        values = sorted(v for v in request.query_params.getlist(name) if v != "")
+        params.extend((name, v) for v in values)
+
+    digest = hashlib.md5(urlencode(params).encode("utf-8")).hexdigest()
+    return f"{prefix}:v{get_catalog_version()}:{digest}"
+
+
+def get_cached(key: str):
+    data = cache.get(key)
+    _count(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_cached(key: str, data) -> None:
+    cache.set(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_stats() -> dict:
+    """Счётчики попаданий/промахов — для подбора размера кэша."""
+    values = cache.get_many([HITS_KEY, MISSES_KEY, VERSION_KEY])
+    hits = values.get(HITS_KEY, 0)
+    misses = values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+        "version": values.get(VERSION_KEY, 1),
+    }
+
+
+def reset_stats() -> None:
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def _count(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
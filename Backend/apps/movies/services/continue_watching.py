@@ -0,0 +1,88 @@
+# apps/movies/services/continue_watching.py
+"""
+«Продолжить просмотр»: недосмотренные фильмы пользователя, свежие сверху.
+
+Один запрос (Watched + JOIN movies) по индексу (user, finished, watched_at).
+Результат кэшируется на пользователя целиком (MAX_ITEMS строк), ключ
+сбрасывается при записи прогресса; вместе со списком хранится версия каталога,
+чтобы изменения фильмов (название, постер) не жили в кэше до TTL.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import progress_buffer
+from .catalog_cache import get_catalog_version
+
+CACHE_KEY = "continue:{user_id}"
+CACHE_TIMEOUT = 60 * 10
+MAX_ITEMS = 50
+
+MOVIE_FIELDS = ('id', 'title', 'slug', 'poster', 'year')
+
+
+def _cache_key(user_id) -> str:
+    return CACHE_KEY.format(user_id=user_id)
+
+
+def invalidate(*user_ids) -> None:
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def _load(user_id) -> list[dict]:
+    from apps.accounts.models import Watched
+
+    rows = (
+        Watched.objects
+        .filter(user_id=user_id, finished=False)
+        .select_related('movie')
+        .only(
+            'movie_id', 'last_position_sec', 'duration_sec', 'progress_percent', 'watched_at',
+            *(f'movie__{field}' for field in MOVIE_FIELDS),
+        )
+        .order_by('-watched_at')[:MAX_ITEMS]
+    )
+    return [
+        {
+            'movie': {
+                'id': w.movie.pk,
+                'title': w.movie.title,
+                'slug': w.movie.slug,
+                'poster': w.movie.poster.url if w.movie.poster else None,
+                'year': w.movie.year,
+            },
+            'position_sec': w.last_position_sec,
+            'duration_sec': w.duration_sec,
+            'progress_percent': w.progress_percent,
+            'watched_at': w.watched_at.isoformat(),
+        }
+        for w in rows
+    ]
+
+
+def get_items(user_id, *, limit: int = 20) -> list[dict]:
+    version = get_catalog_version()
+    key = _cache_key(user_id)
+    cached = cache.get(key)
+    if cached and cached['catalog_version'] == version:
+        items = cached['items']
+    else:
+        items = _load(user_id)
+        cache.set(key, {'catalog_version': version, 'items': items}, timeout=CACHE_TIMEOUT)
+
+    items = items[:limit]
+    if settings.PROGRESS_WRITE_BEHIND:
+        # Позиции, ещё не сброшенные из write-behind буфера
+        entries = progress_buffer.peek_many(user_id, [item['movie']['id'] for item in items])
+        items = [_with_buffered(item, entries.get(item['movie']['id'])) for item in items]
+    return items
+
+
+def _with_buffered(item: dict, entry: dict | None) -> dict:
+    if not entry:
+        return item
+    return {
+        **item,
+        'position_sec': max(item['position_sec'], entry['last_position_sec']),
+        'duration_sec': max(item['duration_sec'], entry['duration_sec']),
+        'progress_percent': max(item['progress_percent'], entry['progress_percent']),
+    }
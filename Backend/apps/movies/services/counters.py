@@ -0,0 +1,70 @@
+# apps/movies/services/counters.py
+from django.db.models import Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce
+
+from ..models import Movie, Genre, Author, Actor, MovieCharacter, Casting
+
+
+def _count_subquery(queryset, group_field: str, count_expr):
+    """SELECT COUNT(...) FROM <queryset> WHERE <group_field> = outer.pk"""
+    subquery = (
+        queryset
+        .filter(**{group_field: OuterRef('pk')})
+        .order_by()
+        .values(group_field)
+        .annotate(c=count_expr)
+        .values('c')
+    )
+    return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+
+def _genre_count():
+    return _count_subquery(Movie.genres.through.objects.all(), 'genre_id', Count('pk'))
+
+
+def _author_count():
+    return _count_subquery(Movie.objects.all(), 'author_id', Count('pk'))
+
+
+def _actor_count():
+    return _count_subquery(Casting.objects.all(), 'actor_id', Count('movie_id', distinct=True))
+
+
+def _character_count():
+    return _count_subquery(Casting.objects.all(), 'character_id', Count('pk'))
+
+
+COUNTERS = {
+    Genre: ('movies_count', _genre_count),
+    Author: ('movies_count', _author_count),
+    Actor: ('movies_count', _actor_count),
+    MovieCharacter: ('appearances_count', _character_count),
+}
+
+
+def refresh_counters(model, ids) -> int:
+    """
+    Пересчитывает счётчик для указанных строк одним UPDATE ... SET = (подзапрос).
+    Пересчёт от источника идемпотентен, поэтому гонки сигналов не копят ошибку.
+    """
+    ids = {pk for pk in ids if pk is not None}
+    if not ids:
+        return 0
+    field, expression = COUNTERS[model]
+    return model.objects.filter(pk__in=ids).update(**{field: expression()})
+
+
+def refresh_genres(ids) -> int:
+    return refresh_counters(Genre, ids)
+
+
+def refresh_authors(ids) -> int:
+    return refresh_counters(Author, ids)
+
+
+def refresh_actors(ids) -> int:
+    return refresh_counters(Actor, ids)
+
+
+def refresh_characters(ids) -> int:
+    return refresh_counters(MovieCharacter, ids)
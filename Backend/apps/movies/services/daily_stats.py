@@ -0,0 +1,165 @@
+# apps/movies/services/daily_stats.py
+"""
+Инкрементальное обновление MovieDailyStats.
+
+Задача берёт только строки Watched, изменённые после водяного знака
+(с небольшим перекрытием на поздние commit'ы), и:
+  - views_started / completion_sum — пересчитывает из источника для затронутых
+    (фильм, день создания): повторная обработка ничего не удваивает;
+  - views_finished — так же по (фильм, день finished_at);
+  - unique_viewers — прибавляет пользователя к (фильм, день последней активности),
+    если он ещё не учтён за этот день (Watched.stats_counted_on); тот же
+    пользователь добавляется в HyperLogLog-скетч дня viewers_hll.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import hll
+
+logger = logging.getLogger(__name__)
+
+WATERMARK = "movie_daily_stats"
+# Перекрытие окна: строки, закоммиченные позже, чем проставлен их watched_at
+OVERLAP = timedelta(minutes=5)
+CHUNK_SIZE = 5000
+LOCK_KEY = "stats:daily:lock"
+LOCK_TIMEOUT = 60 * 30
+
+
+def _day(value):
+    return timezone.localdate(value) if value else None
+
+
+def _recount(date_field: str, pairs: set, **aggregates) -> dict:
+    """(movie_id, день) -> агрегаты по Watched, сгруппированные по дню date_field."""
+    from apps.accounts.models import Watched
+
+    if not pairs:
+        return {}
+    movie_ids = {movie_id for movie_id, _ in pairs}
+    days = {day for _, day in pairs}
+    rows = (
+        Watched.objects
+        .filter(movie_id__in=movie_ids, **{f'{date_field}__date__in': days})
+        .annotate(day=TruncDate(date_field))
+        .values('movie_id', 'day')
+        .annotate(**aggregates)
+        .order_by()
+    )
+    return {
+        (row['movie_id'], row['day']): row for row in rows
+        if (row['movie_id'], row['day']) in pairs
+    }
+
+
+def refresh(now=None) -> dict:
+    """Обрабатывает изменения Watched после водяного знака. Возвращает сводку."""
+    if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        return {'skipped': True}  # предыдущий запуск ещё идёт
+    try:
+        return _refresh(now or timezone.now())
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _refresh(now) -> dict:
+    from apps.accounts.models import Watched
+    from ..models import MovieDailyStats, StatsWatermark
+
+    watermark, _ = StatsWatermark.objects.get_or_create(name=WATERMARK)
+
+    changed = Watched.objects.filter(watched_at__lte=now)
+    if watermark.value is not None:
+        changed = changed.filter(watched_at__gt=watermark.value - OVERLAP)
+
+    started, finished = set(), set()
+    new_viewers = defaultdict(list)  # (movie_id, день) -> id строк Watched
+    viewer_ids = defaultdict(list)   # (movie_id, день) -> id пользователей
+    rows = changed.values_list(
+        'pk', 'movie_id', 'user_id', 'created_at', 'finished_at', 'watched_at', 'stats_counted_on'
+    )
+    for pk, movie_id, user_id, created_at, finished_at, watched_at, counted_on in rows.iterator(chunk_size=CHUNK_SIZE):
+        started.add((movie_id, _day(created_at)))
+        if finished_at:
+            finished.add((movie_id, _day(finished_at)))
+        active_day = _day(watched_at)
+        if counted_on != active_day:
+            new_viewers[(movie_id, active_day)].append(pk)
+            viewer_ids[(movie_id, active_day)].append(user_id)
+
+    started_counts = _recount('created_at', started, views_started=Count('pk'), completion_sum=Sum('progress_percent'))
+    finished_counts = _recount('finished_at', finished, views_finished=Count('pk'))
+
+    with transaction.atomic():
+        # Строки под прибавку зрителей (UPDATE ниже не создаёт отсутствующие)
+        MovieDailyStats.objects.bulk_create(
+            [MovieDailyStats(movie_id=movie_id, date=day) for movie_id, day in new_viewers],
+            ignore_conflicts=True,
+        )
+        MovieDailyStats.objects.bulk_create(
+            [
+                MovieDailyStats(
+                    movie_id=movie_id, date=day,
+                    views_started=started_counts.get((movie_id, day), {}).get('views_started', 0),
+                    completion_sum=started_counts.get((movie_id, day), {}).get('completion_sum') or 0,
+                )
+                for movie_id, day in started
+            ],
+            update_conflicts=True,
+            unique_fields=['movie', 'date'],
+            update_fields=['views_started', 'completion_sum'],
+        )
+        MovieDailyStats.objects.bulk_create(
+            [
+                MovieDailyStats(
+                    movie_id=movie_id, date=day,
+                    views_finished=finished_counts.get((movie_id, day), {}).get('views_finished', 0),
+                )
+                for movie_id, day in finished
+            ],
+            update_conflicts=True,
+            unique_fields=['movie', 'date'],
+            update_fields=['views_finished'],
+        )
+
+        by_day = defaultdict(dict)
+        for (movie_id, day), ids in new_viewers.items():
+            by_day[day][movie_id] = len(ids)
+        for day, increments in by_day.items():
+            MovieDailyStats.objects.filter(date=day, movie_id__in=increments).update(
+                unique_viewers=F('unique_viewers') + Case(
+                    *[When(movie_id=movie_id, then=Value(n)) for movie_id, n in increments.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            ids = [pk for movie_id in increments for pk in new_viewers[(movie_id, day)]]
+            for start in range(0, len(ids), CHUNK_SIZE):
+                Watched.objects.filter(pk__in=ids[start:start + CHUNK_SIZE]).update(stats_counted_on=day)
+
+            sketches = list(
+                MovieDailyStats.objects.filter(date=day, movie_id__in=increments).only('pk', 'movie_id', 'viewers_hll')
+            )
+            for stats in sketches:
+                registers = hll.add(hll.from_bytes(stats.viewers_hll), viewer_ids[(stats.movie_id, day)])
+                stats.viewers_hll = hll.to_bytes(registers)
+            MovieDailyStats.objects.bulk_update(sketches, ['viewers_hll'], batch_size=500)
+
+        watermark.value = now
+        watermark.save(update_fields=['value', 'updated_at'])
+
+    summary = {
+        'started_days': len(started),
+        'finished_days': len(finished),
+        'new_viewers': sum(len(ids) for ids in new_viewers.values()),
+        'watermark': now.isoformat(),
+    }
+    logger.info(f"Daily stats refreshed: {summary}")
+    return summary
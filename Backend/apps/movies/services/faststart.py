@@ -0,0 +1,128 @@
+# apps/movies/services/faststart.py
+"""
+Перенос moov в начало MP4 (первая стадия ingest, задача movies.ensure_faststart).
+
+Если moov лежит после mdat, браузер перед первым кадром тянет хвост
+многогигабайтного blob'а. Проверка читает только заголовки боксов верхнего
+уровня (utils/mp4_header.is_faststart); при необходимости ffmpeg делает
+-c copy -movflags +faststart (без перекодирования) во временный файл.
+
+Замена атомарная: результат заливается под новым ключом, и Movie.video
+переключается одним UPDATE (только если видео за это время не заменили).
+Старый blob удаляется позже — после истечения уже выданных на него ссылок.
+Movie.faststart_status отмечает проверенный файл: повторно он не проверяется.
+"""
+import logging
+import os
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+from ..utils import mp4_header
+from ..utils.video_meta import get_video_url_for_processing
+
+logger = logging.getLogger(__name__)
+
+DONE = ('ok', 'remuxed', 'not_mp4')
+
+
+class FaststartError(Exception):
+    pass
+
+
+def needs_remux(file_field) -> bool | None:
+    """True — moov после mdat; None — не MP4/MOV (ремукс не применим)."""
+    reader = mp4_header.open_reader(file_field)
+    try:
+        return not mp4_header.is_faststart(reader)
+    except mp4_header.Mp4Error as e:
+        logger.info(f"Faststart check skipped {file_field.name}: {e}")
+        return None
+    finally:
+        reader.close()
+
+
+def remux(source: str, out_path: str, *, timeout: int | None = None):
+    """Копия всех потоков с moov в начале файла."""
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+        '-i', source, '-map', '0', '-c', 'copy', '-movflags', '+faststart', '-f', 'mp4', out_path,
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout or settings.FASTSTART_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise FaststartError("ffmpeg remux timed out")
+    if result.returncode != 0:
+        raise FaststartError(f"ffmpeg remux failed: {(result.stderr or '').strip()[-500:]}")
+
+    # Проверяем результат до замены: moov спереди и заголовок разбирается
+    reader = mp4_header.FileReader(out_path)
+    try:
+        if not mp4_header.is_faststart(reader):
+            raise FaststartError("Remuxed file still has moov after mdat")
+        return mp4_header.read_metadata(reader)
+    except mp4_header.Mp4Error as e:
+        raise FaststartError(f"Remuxed file is unreadable: {e}")
+    finally:
+        reader.close()
+
+
+def _mark(movie, status: str):
+    from ..models import Movie
+
+    Movie.objects.filter(pk=movie.pk).update(faststart_status=status)
+    movie.faststart_status = status
+
+
+def ensure(movie, *, force: bool = False) -> dict:
+    """{'status': 'skipped' | 'ok' | 'remuxed' | 'not_mp4' | 'replaced', ...}; FaststartError — если ремукс не удался."""
+    from ..models import Movie
+    from ..tasks import delete_stale_video
+    from .catalog_cache import bump_catalog_version
+
+    if not movie.video:
+        raise FaststartError("No video file")
+    if movie.faststart_status in DONE and not force:
+        return {'status': 'skipped'}
+
+    remux_needed = needs_remux(movie.video)
+    if remux_needed is None:
+        _mark(movie, 'not_mp4')
+        return {'status': 'not_mp4'}
+    if not remux_needed:
+        _mark(movie, 'ok')
+        return {'status': 'ok'}
+
+    source = get_video_url_for_processing(movie.video, expires_in=settings.FASTSTART_TIMEOUT)
+    if not source:
+        raise FaststartError("Unable to get video URL")
+
+    old_name = movie.video.name
+    storage = movie.video.storage
+    os.makedirs(settings.FASTSTART_WORK_DIR, exist_ok=True)
+    try:
+        with tempfile.TemporaryDirectory(dir=settings.FASTSTART_WORK_DIR) as work_dir:
+            out_path = os.path.join(work_dir, 'faststart.mp4')
+            metadata = remux(source, out_path)
+            base, ext = os.path.splitext(old_name)
+            with open(out_path, 'rb') as f:
+                new_name = storage.save(f"{base}.faststart{ext or '.mp4'}", File(f))
+    except FaststartError:
+        _mark(movie, 'failed')
+        raise
+
+    # Переключение — одним UPDATE и только если видео не заменили во время ремукса
+    swapped = Movie.objects.filter(pk=movie.pk, video=old_name).update(
+        video=new_name, faststart_status='remuxed', meta_dirty=True,
+    )
+    if not swapped:
+        storage.delete(new_name)
+        return {'status': 'replaced'}
+
+    movie.video.name, movie.faststart_status, movie.meta_dirty = new_name, 'remuxed', True
+    bump_catalog_version()  # в кэше списка фильмов ссылка на старый файл
+    delete_stale_video.apply_async(args=[old_name], countdown=settings.STREAM_URL_EXP_SECONDS + 60)  # type: ignore
+    logger.info(f"Movie {movie.pk} remuxed to fast-start: {old_name} -> {new_name}")
+    return {'status': 'remuxed', 'video': new_name, 'duration_sec': metadata['duration_sec']}
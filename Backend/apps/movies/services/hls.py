@@ -0,0 +1,303 @@
+# apps/movies/services/hls.py
+"""
+HLS-лесенка битрейтов для загруженного видео (задача movies.package_hls).
+
+Каждая ступень settings.HLS_LADDER кодируется локальным ffmpeg в сегменты
+по HLS_SEGMENT_SECONDS с ключевыми кадрами на границах сегментов (ступени
+взаимозаменяемы посегментно), затем сегменты заливаются в хранилище пулом
+потоков (utils/probe_engine), плейлист ступени — последним. master.m3u8
+пишется, когда готовы все ступени, и только тогда пакет становится ready.
+
+Продолжение с места:
+  - ступени в статусе ready пропускаются;
+  - рабочий каталог (HLS_WORK_DIR/<фильм>-<etag>) переживает падение задачи:
+    если ffmpeg уже дописал плейлист (#EXT-X-ENDLIST), повторно не кодируем;
+  - при заливке из того же каталога сегменты, уже лежащие в хранилище
+    с тем же размером, пропускаются.
+
+Пакет привязан к ETag исходника: prefix содержит etag, при замене видео
+собирается новый пакет под новым префиксом.
+"""
+import logging
+import os
+import re
+import shutil
+import subprocess
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from ..utils import probe_engine
+from ..utils.video_meta import get_video_fingerprint, get_video_url_for_processing
+
+logger = logging.getLogger(__name__)
+
+MASTER = 'master.m3u8'
+PLAYLIST = 'index.m3u8'
+PLAYLIST_CACHE_KEY = "hls:playlist:{key}"
+LOCK_KEY = "hls:lock:{movie_id}"
+# h264 High@4.0 + AAC-LC: для всех ступеней одинаково
+CODECS = 'avc1.640028,mp4a.40.2'
+
+
+class HlsError(Exception):
+    pass
+
+
+def ladder_for(source_height: int | None) -> list[dict]:
+    """Ступени не выше исходника (апскейл не нужен); хотя бы одна — самая низкая."""
+    ladder = [
+        {'name': name, 'height': height, 'video_bitrate': video, 'audio_bitrate': audio}
+        for name, height, video, audio in settings.HLS_LADDER
+    ]
+    ladder.sort(key=lambda rung: rung['height'], reverse=True)
+    if not source_height:
+        return ladder
+    return [rung for rung in ladder if rung['height'] <= source_height] or ladder[-1:]
+
+
+def package_prefix(video_name: str, etag: str | None) -> str:
+    """movies/videos/film.mp4 + "0x8DC…" -> movies/videos/film/hls/0x8DC…/"""
+    base, _ = os.path.splitext(video_name)
+    tag = re.sub(r'[^0-9A-Za-z]', '', etag or '')[:24] or 'noetag'
+    return f"{base}/hls/{tag}/"
+
+
+# ===== Плейлисты =====
+
+def playlist_uris(text: str) -> list[str]:
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.startswith('#')]
+
+
+def is_complete(playlist_path: str) -> bool:
+    """ffmpeg дописал VOD-плейлист до конца"""
+    try:
+        with open(playlist_path, encoding='utf-8') as f:
+            return '#EXT-X-ENDLIST' in f.read()
+    except OSError:
+        return False
+
+
+def build_master(renditions) -> str:
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in renditions:
+        attrs = f"BANDWIDTH={rendition.bandwidth},AVERAGE-BANDWIDTH={(rendition.video_bitrate + rendition.audio_bitrate) * 1000}"
+        if rendition.width:
+            attrs += f",RESOLUTION={rendition.width}x{rendition.height}"
+        attrs += f',CODECS="{CODECS}"'
+        lines += [f"#EXT-X-STREAM-INF:{attrs}", f"{rendition.name}/{PLAYLIST}"]
+    return '\n'.join(lines) + '\n'
+
+
+_URI_ATTR = re.compile(r'URI="([^"]+)"')
+
+
+def rewrite_playlist(text: str, *, playlist, segment) -> str:
+    """
+    Подменяет ссылки плейлиста: вложенные плейлисты — playlist(uri), сегменты
+    (и URI="…" в тегах вроде EXT-X-MAP) — segment(uri).
+    """
+    def resolve(uri):
+        return playlist(uri) if uri.split('?', 1)[0].endswith('.m3u8') else segment(uri)
+
+    out = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('#'):
+            out.append(_URI_ATTR.sub(lambda m: f'URI="{resolve(m.group(1))}"', stripped))
+        else:
+            out.append(resolve(stripped))
+    return '\n'.join(out) + '\n'
+
+
+def read_playlist(key: str) -> str:
+    """Плейлист (или VTT превью) из хранилища; файлы неизменяемы (etag в префиксе) — кэшируем надолго."""
+    cache_key = PLAYLIST_CACHE_KEY.format(key=key)
+    text = cache.get(cache_key)
+    if text is None:
+        with default_storage.open(key, 'rb') as f:
+            text = f.read().decode('utf-8')
+        cache.set(cache_key, text, timeout=60 * 60 * 24)
+    return text
+
+
+# ===== Кодирование и заливка =====
+
+def transcode(source: str, out_dir: str, rung: dict, *, timeout: int | None = None) -> str:
+    """Одна ступень в out_dir/index.m3u8 + seg_NNNNN.ts. Возвращает путь к плейлисту."""
+    os.makedirs(out_dir, exist_ok=True)
+    seconds = settings.HLS_SEGMENT_SECONDS
+    video = rung['video_bitrate']
+    playlist = os.path.join(out_dir, PLAYLIST)
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostdin', '-y', '-loglevel', 'error',
+        '-i', source,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f"scale=-2:{rung['height']}",
+        '-c:v', 'libx264', '-preset', settings.HLS_X264_PRESET, '-profile:v', 'high', '-pix_fmt', 'yuv420p',
+        '-b:v', f"{video}k", '-maxrate', f"{int(video * 1.07)}k", '-bufsize', f"{video * 2}k",
+        # Ключевой кадр ровно на границе сегмента — переключение ступеней без разрывов
+        '-force_key_frames', f"expr:gte(t,n_forced*{seconds})", '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', f"{rung['audio_bitrate']}k", '-ac', '2',
+        '-f', 'hls', '-hls_time', str(seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(out_dir, 'seg_%05d.ts'),
+        playlist,
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=timeout or settings.HLS_TRANSCODE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        raise HlsError(f"ffmpeg timed out on {rung['name']}")
+    if result.returncode != 0 or not is_complete(playlist):
+        raise HlsError(f"ffmpeg failed on {rung['name']}: {(result.stderr or '').strip()[-500:]}")
+    return playlist
+
+
+def _upload_one(local_path: str, key: str, overwrite: bool) -> bool:
+    """True — файл залит, False — такой уже лежит в хранилище."""
+    size = os.path.getsize(local_path)
+    if default_storage.exists(key):
+        if not overwrite and default_storage.size(key) == size:
+            return False
+        default_storage.delete(key)
+    with open(local_path, 'rb') as f:
+        saved = default_storage.save(key, File(f))
+    if saved != key:
+        raise HlsError(f"Storage renamed {key} to {saved}")
+    return True
+
+
+def upload(local_dir: str, prefix: str, names: list[str], *, overwrite: bool, progress=None) -> int:
+    """Параллельная заливка файлов local_dir/<name> в <prefix><name>. Возвращает число залитых."""
+    uploaded, failed = 0, []
+    outcomes = probe_engine.run(
+        names,
+        lambda name: _upload_one(os.path.join(local_dir, name), prefix + name, overwrite),
+        concurrency=settings.HLS_UPLOAD_CONCURRENCY,
+    )
+    for done, outcome in enumerate(outcomes, 1):
+        if not outcome.ok:
+            failed.append(outcome.item)
+        elif outcome.result:
+            uploaded += 1
+        if progress:
+            progress(done)
+    if failed:
+        raise HlsError(f"{len(failed)} uploads failed under {prefix}, e.g. {failed[0]}")
+    return uploaded
+
+
+def _scaled_width(rung_height: int, info) -> int | None:
+    if not info or not info.width or not info.height:
+        return None
+    return int(round(info.width * rung_height / info.height / 2)) * 2
+
+
+def _package_rendition(package, rendition, source: str, work_dir: str):
+    out_dir = os.path.join(work_dir, rendition.name)
+    playlist = os.path.join(out_dir, PLAYLIST)
+    # Сегменты нового кодирования не должны смешиваться с залитыми от прошлого
+    overwrite = not is_complete(playlist)
+    if overwrite:
+        rendition.status = 'transcoding'
+        rendition.save(update_fields=['status', 'updated_at'])
+        transcode(source, out_dir, {
+            'name': rendition.name, 'height': rendition.height,
+            'video_bitrate': rendition.video_bitrate, 'audio_bitrate': rendition.audio_bitrate,
+        })
+
+    with open(playlist, encoding='utf-8') as f:
+        segments = playlist_uris(f.read())
+    rendition.status, rendition.segments, rendition.segments_uploaded = 'uploading', len(segments), 0
+    rendition.save(update_fields=['status', 'segments', 'segments_uploaded', 'updated_at'])
+
+    prefix = f"{package.prefix}{rendition.name}/"
+
+    def progress(done):
+        if done % 25 == 0:
+            rendition.segments_uploaded = done
+            rendition.save(update_fields=['segments_uploaded', 'updated_at'])
+
+    upload(out_dir, prefix, segments, overwrite=overwrite, progress=progress)
+    # Плейлист — после всех сегментов: ступень в хранилище либо полная, либо без плейлиста
+    upload(out_dir, prefix, [PLAYLIST], overwrite=True)
+
+    rendition.status, rendition.segments_uploaded = 'ready', len(segments)
+    rendition.playlist_key, rendition.error = prefix + PLAYLIST, ''
+    rendition.save(update_fields=['status', 'segments_uploaded', 'playlist_key', 'error', 'updated_at'])
+
+
+def package(movie, *, force: bool = False) -> dict:
+    """
+    Собирает (или продолжает собирать) HLS-пакет фильма.
+    {'status': 'ready' | 'skipped' | 'locked', 'renditions': [...]}; HlsError — если ступень не удалась.
+    """
+    from ..models import MovieHlsPackage, MovieMediaInfo, MovieRendition
+
+    if not movie.video:
+        raise HlsError("No video file")
+    if shutil.which('ffmpeg') is None:
+        raise HlsError("ffmpeg not found")
+
+    lock = LOCK_KEY.format(movie_id=movie.pk)
+    if not cache.add(lock, 1, timeout=settings.HLS_TRANSCODE_TIMEOUT):
+        return {'status': 'locked'}  # этот фильм уже пакуется другим воркером
+    try:
+        etag, _ = get_video_fingerprint(movie.video)
+        pkg, _ = MovieHlsPackage.objects.get_or_create(movie=movie)
+        if pkg.is_ready and pkg.source_etag == (etag or '') and not force:
+            return {'status': 'skipped'}
+
+        prefix = package_prefix(movie.video.name, etag)
+        if force or pkg.prefix != prefix:
+            # Новый исходник — прогресс по старому не годится
+            pkg.renditions.all().delete()
+        pkg.prefix, pkg.source_etag = prefix, etag or ''
+        pkg.status, pkg.master_key, pkg.error, pkg.ready_at = 'processing', '', '', None
+        pkg.save()
+
+        info = MovieMediaInfo.objects.filter(movie=movie).first()
+        for rung in ladder_for(info.height if info else None):
+            MovieRendition.objects.get_or_create(
+                package=pkg, name=rung['name'],
+                defaults={**rung, 'width': _scaled_width(rung['height'], info)},
+            )
+        renditions = list(pkg.renditions.all())
+
+        # SAS живёт весь таймаут кодирования, а не 5 минут как для ffprobe
+        source = get_video_url_for_processing(movie.video, expires_in=settings.HLS_TRANSCODE_TIMEOUT)
+        if not source:
+            raise HlsError("Unable to get video URL")
+        work_dir = os.path.join(settings.HLS_WORK_DIR, f"{movie.pk}-{re.sub(r'[^0-9A-Za-z]', '', etag or '')[:24]}")
+        for rendition in renditions:
+            if rendition.status == 'ready':
+                continue
+            cache.set(lock, 1, timeout=settings.HLS_TRANSCODE_TIMEOUT)  # продлеваем на ступень
+            try:
+                _package_rendition(pkg, rendition, source, work_dir)
+            except Exception as e:
+                rendition.status, rendition.error = 'failed', str(e)
+                rendition.save(update_fields=['status', 'error', 'updated_at'])
+                pkg.status, pkg.error = 'failed', f"{rendition.name}: {e}"
+                pkg.save(update_fields=['status', 'error', 'updated_at'])
+                raise HlsError(pkg.error) from e
+
+        master_dir = os.path.join(work_dir, 'master')
+        os.makedirs(master_dir, exist_ok=True)
+        with open(os.path.join(master_dir, MASTER), 'w', encoding='utf-8') as f:
+            f.write(build_master(renditions))
+        upload(master_dir, prefix, [MASTER], overwrite=True)
+
+        pkg.status, pkg.master_key, pkg.ready_at = 'ready', prefix + MASTER, timezone.now()
+        pkg.save(update_fields=['status', 'master_key', 'ready_at', 'updated_at'])
+        shutil.rmtree(work_dir, ignore_errors=True)
+        logger.info(f"HLS package ready for movie {movie.pk}: {[r.name for r in renditions]}")
+        return {'status': 'ready', 'renditions': [r.name for r in renditions]}
+    finally:
+        cache.delete(lock)
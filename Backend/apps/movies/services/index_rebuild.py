@@ -0,0 +1,43 @@
+# apps/movies/services/index_rebuild.py
+"""
+Фоновая пересборка индексов процесса (поиск, подсказки, похожие фильмы).
+
+Устаревший индекс продолжает отвечать на запросы, пока в отдельном потоке
+собирается новый; готовый подменяется одним присваиванием. Синхронно индекс
+строится только при первом обращении, когда отдавать ещё нечего.
+"""
+import logging
+import threading
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_running: set[str] = set()
+
+
+def schedule(name: str, rebuild) -> bool:
+    """Запускает rebuild() в фоне; False — пересборка name уже идёт."""
+    with _lock:
+        if name in _running:
+            return False
+        _running.add(name)
+    threading.Thread(target=_run, args=(name, rebuild), name=f"rebuild-{name}", daemon=True).start()
+    return True
+
+
+def is_running(name: str) -> bool:
+    with _lock:
+        return name in _running
+
+
+def _run(name: str, rebuild):
+    try:
+        rebuild()
+    except Exception:
+        logger.exception(f"Background rebuild of {name} index failed")
+    finally:
+        connection.close()  # у потока своё соединение с БД
+        with _lock:
+            _running.discard(name)
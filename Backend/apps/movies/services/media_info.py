@@ -0,0 +1,119 @@
+# apps/movies/services/media_info.py
+"""
+Заполнение MovieMediaInfo.
+
+Проба разделена на две части:
+  probe(movie)        — только ввод-вывод (ETag/размер blob'а, разбор заголовка MP4 или ffprobe), без БД;
+  apply(movie, ...)   — запись результата в БД.
+Поэтому задача на один фильм и пакетная обработка (probe_many: пул потоков
+utils/probe_engine) используют один и тот же код, а потоки пула не держат
+соединений с БД.
+"""
+import logging
+
+from django.conf import settings
+from django.utils.timezone import now as dateNow
+
+from ..utils import mp4_header, probe_engine
+from ..utils.video_meta import (
+    extract_duration_from_filename,
+    get_video_fingerprint,
+    get_video_url_for_processing,
+    probe_video_metadata,
+)
+
+logger = logging.getLogger(__name__)
+
+FIELDS = (
+    'duration_sec', 'width', 'height', 'bitrate', 'video_codec', 'audio_codec', 'fps', 'container', 'file_size',
+)
+
+
+def probe(movie, *, force: bool = False, timeout: int | None = None) -> dict:
+    """
+    {'status': 'skipped' | 'header' | 'ffprobe' | 'filename' | 'failed', 'metadata', 'etag', 'size', 'error'}.
+    movie должен быть загружен с select_related('media_info').
+    """
+    if not movie.video:
+        return {'status': 'failed', 'error': 'No video file'}
+
+    # Менялся ли файл с прошлой проверки (HEAD к blob'у, без скачивания)
+    etag, size = get_video_fingerprint(movie.video)
+    info = getattr(movie, 'media_info', None)
+    if info is not None and not force and not movie.meta_dirty and info.is_current(etag, size):
+        return {'status': 'skipped', 'etag': etag, 'size': size}
+
+    # MP4/MOV: заголовок читаем сами (несколько Range-запросов), без запуска ffprobe
+    metadata = mp4_header.probe_file(movie.video)
+    if metadata and metadata.get('duration_sec'):
+        return {'status': 'header', 'metadata': metadata, 'etag': etag, 'size': size}
+
+    video_url = get_video_url_for_processing(movie.video)
+    if not video_url:
+        return {'status': 'failed', 'error': 'Unable to get video URL'}
+
+    metadata = probe_video_metadata(video_url, timeout=timeout or settings.MEDIA_PROBE_TIMEOUT)
+    if metadata and metadata.get('duration'):
+        return {'status': 'ffprobe', 'metadata': metadata, 'etag': etag, 'size': size}
+
+    duration = extract_duration_from_filename(movie.video.name)
+    if duration:
+        return {'status': 'filename', 'metadata': {'duration_sec': duration}, 'etag': etag, 'size': size}
+    return {'status': 'failed', 'error': 'Failed to extract duration'}
+
+
+def apply(movie, outcome: dict):
+    """Пишет результат probe() в БД. Возвращает MovieMediaInfo (или None для failed)."""
+    from ..models import Movie, MovieMediaInfo
+
+    if outcome['status'] == 'failed':
+        return None
+    if outcome['status'] == 'skipped':
+        # Отметка проверки — чтобы refresh_stale_movies не ставил фильм в очередь снова
+        Movie.objects.filter(pk=movie.pk).update(last_meta_update=dateNow())
+        return movie.media_info
+
+    metadata = outcome['metadata']
+    fields = {name: metadata.get(name) for name in FIELDS if metadata.get(name) is not None}
+    fields.update(etag=outcome['etag'] or '', source=outcome['status'], seek_index=metadata.get('seek_index'))
+    if fields.get('file_size') is None:
+        fields['file_size'] = outcome['size']
+    info, _ = MovieMediaInfo.objects.update_or_create(movie=movie, defaults=fields)
+
+    movie.last_meta_update = dateNow()
+    movie.meta_dirty = False
+    movie.save(update_fields=['last_meta_update', 'meta_dirty'])
+    return info
+
+
+def probe_many(movie_ids, *, concurrency: int | None = None, timeout: int | None = None,
+               force: bool = False, progress=None) -> dict:
+    """
+    Пакетная проба: до concurrency ffprobe одновременно, запись в БД — в текущем потоке.
+    progress(done, total, movie, outcome) — для вывода хода работы.
+    """
+    from ..models import Movie
+
+    movies = list(Movie.objects.select_related('media_info').filter(pk__in=movie_ids).order_by('pk'))
+    total = len(movies)
+    summary = {'total': total, 'skipped': 0, 'header': 0, 'ffprobe': 0, 'filename': 0, 'failed': 0}
+
+    outcomes = probe_engine.run(
+        movies,
+        lambda movie: probe(movie, force=force, timeout=timeout),
+        concurrency=concurrency or settings.MEDIA_PROBE_CONCURRENCY,
+    )
+    for done, result in enumerate(outcomes, 1):
+        movie = result.item
+        outcome = result.result if result.ok else {'status': 'failed', 'error': str(result.error)}
+        try:
+            apply(movie, outcome)
+        except Exception as e:
+            logger.exception(f"Unable to save media info for movie {movie.pk}: {e}")
+            outcome = {'status': 'failed', 'error': str(e)}
+        summary[outcome['status']] += 1
+        if progress:
+            progress(done, total, movie, outcome)
+
+    logger.info(f"Media probe batch finished: {summary}")
+    return summary
@@ -0,0 +1,192 @@
+# apps/movies/services/minhash_index.py
+"""
+«Похожие фильмы» по составу: MinHash + LSH в памяти процесса.
+
+Фильм — множество признаков: жанры (slug), актёры, персонажи, автор (id).
+Для множества считается MinHash-подпись из NUM_PERM хэшей, подпись режется на
+BANDS полос по ROWS значений; фильмы с совпавшей полосой попадают в одну корзину.
+Запрос: кандидаты из корзин фильма, ранжирование по точному Жаккару
+(множества признаков тоже в памяти). При BANDS=32, ROWS=2 кандидатом с
+вероятностью ≥ 0.5 становится пара с Жаккаром примерно от 0.15.
+
+Индекс обновляется точечно из тех же сигналов каталога, что и поиск;
+изменения из других процессов — пересборкой в фоне (services/index_rebuild).
+"""
+import logging
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from . import index_rebuild
+from .catalog_cache import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+BANDS = 32
+ROWS = 2
+NUM_PERM = BANDS * ROWS
+_PRIME = (1 << 31) - 1
+
+# Универсальное хэширование (a·x + b) mod p; a, b < 2^31, x < 2^32 — без переполнения uint64
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def signature(features) -> np.ndarray | None:
+    if not features:
+        return None
+    hashed = np.fromiter((zlib.crc32(f.encode()) for f in features), dtype=np.uint64, count=len(features))
+    return ((np.outer(_A, hashed) + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class MinHashIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self.features = {}   # movie_id -> frozenset признаков
+        self.bands = {}      # movie_id -> список ключей полос
+        self.buckets = [defaultdict(set) for _ in range(BANDS)]
+
+    def add(self, movie_id, features) -> None:
+        features = frozenset(features)
+        sig = signature(features)
+        with self._lock:
+            self._remove(movie_id)
+            if sig is None:
+                return
+            keys = [sig[i * ROWS:(i + 1) * ROWS].tobytes() for i in range(BANDS)]
+            for band, key in enumerate(keys):
+                self.buckets[band][key].add(movie_id)
+            self.features[movie_id] = features
+            self.bands[movie_id] = keys
+
+    def remove(self, movie_id) -> None:
+        with self._lock:
+            self._remove(movie_id)
+
+    def _remove(self, movie_id) -> None:
+        keys = self.bands.pop(movie_id, None)
+        self.features.pop(movie_id, None)
+        for band, key in enumerate(keys or ()):
+            bucket = self.buckets[band].get(key)
+            if bucket is not None:
+                bucket.discard(movie_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def similar(self, movie_id, *, limit: int = 12) -> list[tuple[int, float]]:
+        """[(movie_id, jaccard), ...] по убыванию близости."""
+        with self._lock:
+            keys = self.bands.get(movie_id)
+            if keys is None:
+                return []
+            candidates = set()
+            for band, key in enumerate(keys):
+                candidates |= self.buckets[band][key]
+            candidates.discard(movie_id)
+
+            features = self.features[movie_id]
+            scored = [(other, jaccard(features, self.features[other])) for other in candidates]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def __len__(self):
+        return len(self.features)
+
+
+# ===== Признаки из БД =====
+
+def load_features(movie_ids=None) -> dict:
+    """movie_id -> множество признаков; три запроса на любое число фильмов."""
+    from ..models import Casting, Movie
+
+    movies = Movie.objects.all() if movie_ids is None else Movie.objects.filter(pk__in=movie_ids)
+    features = defaultdict(set)
+    for pk, author_id in movies.values_list('pk', 'author_id'):
+        features[pk]  # фильм без признаков тоже известен — чтобы удалить его из индекса
+        if author_id:
+            features[pk].add(f"au:{author_id}")
+
+    genres = Movie.genres.through.objects.filter(movie_id__in=list(features)).values_list('movie_id', 'genre__slug')
+    for movie_id, slug in genres:
+        features[movie_id].add(f"g:{slug}")
+
+    cast = Casting.objects.filter(movie_id__in=list(features)).values_list('movie_id', 'actor_id', 'character_id')
+    for movie_id, actor_id, character_id in cast:
+        features[movie_id].update((f"a:{actor_id}", f"c:{character_id}"))
+    return features
+
+
+def build_index() -> MinHashIndex:
+    index = MinHashIndex()
+    index.version = get_catalog_version()
+    for movie_id, features in load_features().items():
+        index.add(movie_id, features)
+    logger.info(f"MinHash index built: {len(index)} movies")
+    return index
+
+
+# ===== Индекс процесса =====
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> MinHashIndex:
+    """Если каталог изменился в другом процессе, новый индекс собирается в фоне, а запрос обслуживает текущий."""
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+            return _index
+
+    if index.version != get_catalog_version():
+        index_rebuild.schedule('minhash', _rebuild)
+    return index
+
+
+def _rebuild() -> None:
+    global _index
+    index = build_index()
+    with _index_lock:
+        _index = index
+
+
+def similar(movie_id, *, limit: int = 12) -> list[tuple[int, float]]:
+    return get_index().similar(movie_id, limit=limit)
+
+
+def apply_changes(documents, version: int) -> None:
+    """Пересчитывает подписи затронутых фильмов (каст, жанры, автор)."""
+    from ..models import Movie
+
+    index = _index
+    if index is None:
+        return
+
+    movie_ids = {pk for kind, pk in documents if kind == 'movie'}
+    genre_ids = [pk for kind, pk in documents if kind == 'genre']
+    if genre_ids:
+        # Сменился slug жанра — он входит в признаки его фильмов
+        movie_ids.update(Movie.objects.filter(genres__in=genre_ids).values_list('pk', flat=True))
+
+    if movie_ids:
+        features = load_features(movie_ids)
+        for movie_id in movie_ids:
+            if movie_id in features:
+                index.add(movie_id, features[movie_id])
+            else:
+                index.remove(movie_id)
+
+    with _index_lock:
+        if index.version == version - 1:
+            index.version = version
@@ -0,0 +1,188 @@
+# apps/movies/services/progress_buffer.py
+"""
+Write-behind буфер для heartbeat'ов прогресса просмотра.
+
+Плеер шлёт прогресс каждые несколько секунд. В режиме PROGRESS_WRITE_BEHIND
+heartbeat пишется только в кэш (Redis; без него — LocMemCache процесса):
+    progress:entry:<user>:<movie>  — накопленные максимумы позиции/длительности/процента
+    progress:pending:<user>:<movie> — маркер «есть незаписанные изменения»
+    progress:log:<n>               — журнал грязных пар (user, movie), n из cache.incr
+Периодическая задача flush() читает журнал от водяного знака и одним
+bulk_create/bulk_update переносит накопленное в Watched.
+
+Переход в finished (и +1 просмотр) буфер не делает — это остаётся за
+синхронной веткой с select_for_update, поэтому срабатывает ровно один раз.
+"""
+import logging
+import operator
+import time
+from datetime import datetime, timezone
+from functools import reduce
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from . import continue_watching
+
+logger = logging.getLogger(__name__)
+
+ENTRY_KEY = "progress:entry:{user_id}:{movie_id}"
+PENDING_KEY = "progress:pending:{user_id}:{movie_id}"
+LOG_KEY = "progress:log:{n}"
+SEQ_KEY = "progress:seq"
+WATERMARK_KEY = "progress:flushed"
+GAP_KEY = "progress:gap"
+FLUSH_LOCK_KEY = "progress:flush-lock"
+
+ENTRY_TIMEOUT = 60 * 60 * 24
+FLUSH_LOCK_TIMEOUT = 60 * 5
+
+# Поля Watched, которые копятся как максимум
+# Пар в одном SELECT ... FOR UPDATE (длинная цепочка OR упирается в лимит глубины выражения SQLite)
+LOCK_CHUNK = 200
+
+FIELDS = ('last_position_sec', 'duration_sec', 'progress_percent')
+
+
+def _entry_key(user_id, movie_id) -> str:
+    return ENTRY_KEY.format(user_id=user_id, movie_id=movie_id)
+
+
+def _pending_key(user_id, movie_id) -> str:
+    return PENDING_KEY.format(user_id=user_id, movie_id=movie_id)
+
+
+# ===== Запись и чтение =====
+
+def record(user_id, movie_id, *, finished: bool = False, **values) -> dict:
+    """
+    Принимает heartbeat: сливает значения с буфером по максимуму
+    и при первой грязной записи после flush кладёт пару в журнал.
+    """
+    key = _entry_key(user_id, movie_id)
+    entry = cache.get(key) or {field: 0 for field in FIELDS}
+    for field in FIELDS:
+        entry[field] = max(entry.get(field, 0), values.get(field, 0))
+    entry['finished'] = entry.get('finished', False) or finished
+    entry['ts'] = time.time()
+    cache.set(key, entry, timeout=ENTRY_TIMEOUT)
+
+    if cache.add(_pending_key(user_id, movie_id), 1, timeout=ENTRY_TIMEOUT):
+        cache.add(SEQ_KEY, 0, timeout=None)
+        n = cache.incr(SEQ_KEY)
+        cache.set(LOG_KEY.format(n=n), (user_id, movie_id), timeout=ENTRY_TIMEOUT)
+    return entry
+
+
+def peek(user_id, movie_id) -> dict | None:
+    """Последнее значение из буфера (ещё не записанное в БД или уже записанное)."""
+    return cache.get(_entry_key(user_id, movie_id))
+
+
+def peek_many(user_id, movie_ids) -> dict:
+    """peek() для нескольких фильмов одним обращением к кэшу: movie_id -> entry."""
+    keys = {_entry_key(user_id, movie_id): movie_id for movie_id in movie_ids}
+    return {keys[key]: entry for key, entry in cache.get_many(list(keys)).items()}
+
+
+def merge(watched, entry: dict | None) -> bool:
+    """Поднимает поля Watched до значений из буфера. True — если что-то изменилось."""
+    if not entry:
+        return False
+    changed = False
+    for field in FIELDS:
+        if entry.get(field, 0) > getattr(watched, field):
+            setattr(watched, field, entry[field])
+            changed = True
+    return changed
+
+
+# ===== Сброс в БД =====
+
+def _skip_gap(n: int) -> bool:
+    """
+    Пустой слот журнала: писатель успел сделать incr, но ещё не записал пару
+    (или упал между ними). В первый раз ждём следующего flush, во второй — пропускаем.
+    """
+    if cache.get(GAP_KEY) == n:
+        return True
+    cache.set(GAP_KEY, n, timeout=None)
+    return False
+
+
+def _write(pairs: list[tuple]) -> int:
+    from apps.accounts.models import Watched
+
+    pairs = list(dict.fromkeys(pairs))
+    # Маркеры снимаем до чтения значений: heartbeat, пришедший после этого,
+    # снова попадёт в журнал и не потеряется
+    cache.delete_many([_pending_key(*pair) for pair in pairs])
+    raw = cache.get_many([_entry_key(*pair) for pair in pairs])
+    entries = {pair: raw[_entry_key(*pair)] for pair in pairs if _entry_key(*pair) in raw}
+    if not entries:
+        return 0
+
+    with transaction.atomic():
+        Watched.objects.bulk_create(
+            [Watched(user_id=user_id, movie_id=movie_id, finished=False) for user_id, movie_id in entries],
+            ignore_conflicts=True,
+        )
+        # Ровно наши пары, а не декартово произведение users × movies: чужие строки
+        # не блокируются. Пары отсортированы — порядок блокировок одинаков у всех flush
+        ordered = sorted(entries)
+        rows = []
+        for i in range(0, len(ordered), LOCK_CHUNK):
+            exact = reduce(operator.or_, (Q(user_id=u, movie_id=m) for u, m in ordered[i:i + LOCK_CHUNK]))
+            rows.extend(Watched.objects.select_for_update().filter(exact).order_by('user_id', 'movie_id'))
+
+        changed = []
+        for row in rows:
+            entry = entries[(row.user_id, row.movie_id)]  # type: ignore
+            if merge(row, entry):
+                # bulk_update не трогает auto_now — время последнего heartbeat ставим сами
+                row.watched_at = datetime.fromtimestamp(entry['ts'], tz=timezone.utc)  # type: ignore
+                changed.append(row)
+
+        Watched.objects.bulk_update(changed, [*FIELDS, 'watched_at'], batch_size=500)
+
+    continue_watching.invalidate(*{row.user_id for row in changed})  # type: ignore
+    return len(changed)
+
+
+def flush(*, batch_size: int = 1000) -> int:
+    """Переносит журнал в БД пачками по batch_size. Возвращает число обновлённых строк."""
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=FLUSH_LOCK_TIMEOUT):
+        return 0  # flush уже идёт в другом воркере
+
+    written = 0
+    try:
+        while True:
+            start = cache.get(WATERMARK_KEY, 0)
+            end = min(cache.get(SEQ_KEY, 0), start + batch_size)
+            if end <= start:
+                break
+
+            logged = cache.get_many([LOG_KEY.format(n=n) for n in range(start + 1, end + 1)])
+            pairs, last = [], start
+            for n in range(start + 1, end + 1):
+                pair = logged.get(LOG_KEY.format(n=n))
+                if pair is None and not _skip_gap(n):
+                    break
+                if pair is not None:
+                    pairs.append(tuple(pair))
+                last = n
+
+            if pairs:
+                written += _write(pairs)
+            cache.set(WATERMARK_KEY, last, timeout=None)
+            cache.delete_many([LOG_KEY.format(n=n) for n in range(start + 1, last + 1)])
+
+            if last < end:
+                break
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+    if written:
+        logger.info(f"Progress buffer flushed: {written} rows")
+    return written
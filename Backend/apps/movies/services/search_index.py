@@ -0,0 +1,339 @@
+# apps/movies/services/search_index.py
+"""
+Полнотекстовый поиск по каталогу в памяти процесса.
+
+Инвертированный индекс (термин -> {документ: tf}) поверх фильмов, актёров,
+персонажей и авторов с ранжированием BM25. Индекс обновляется точечно из
+сигналов моделей; если каталог изменился в другом процессе (версия каталога
+ушла вперёд), индекс перечитывается из снимка в кэше или пересобирается
+в фоне (index_rebuild), а запросы тем временем обслуживает прежний.
+"""
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+from . import index_rebuild
+from .catalog_cache import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = "search:snapshot"
+SNAPSHOT_TIMEOUT = 60 * 60 * 24
+
+# Параметры BM25
+K1 = 1.2
+B = 0.75
+
+KINDS = ('movie', 'actor', 'character', 'author')
+
+# Веса полей: совпадение в названии важнее совпадения в описании
+MOVIE_FIELD_WEIGHTS = {'title': 3, 'author': 2, 'genres': 2, 'cast': 1, 'description': 1}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# ===== Токенизация =====
+
+def fold(text: str) -> str:
+    """
+    Нижний регистр + снятие диакритики: «Amélie» -> «amelie», «Ёлки» -> «елки».
+    Для кириллицы NFKD раскладывает «й» в «и» + бреве, поэтому «й» тоже
+    сворачивается в «и» — одинаково для документов и запросов.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> list[str]:
+    if not text:
+        return []
+    return [token for token in _TOKEN_RE.findall(fold(text)) if len(token) > 1 or token.isdigit()]
+
+
+# ===== Индекс =====
+
+class SearchIndex:
+    """Инвертированный индекс с BM25. Потокобезопасен (один RLock на индекс)."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self.postings = defaultdict(dict)  # term -> {doc_key: tf}
+        self.doc_terms = {}                # doc_key -> Counter(term -> tf)
+        self.doc_length = {}               # doc_key -> длина документа (с весами полей)
+        self.doc_meta = {}                 # doc_key -> данные для ответа
+        self.total_length = 0
+
+    # --- изменение ---
+
+    def add(self, key: tuple, fields: dict, meta: dict, weights: dict | None = None) -> None:
+        terms = Counter()
+        for name, text in fields.items():
+            weight = (weights or {}).get(name, 1)
+            for token in tokenize(text):
+                terms[token] += weight
+
+        with self._lock:
+            self._remove(key)
+            if not terms:
+                return
+            for term, tf in terms.items():
+                self.postings[term][key] = tf
+            self.doc_terms[key] = terms
+            self.doc_length[key] = sum(terms.values())
+            self.doc_meta[key] = meta
+            self.total_length += self.doc_length[key]
+
+    def remove(self, key: tuple) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: tuple) -> None:
+        terms = self.doc_terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(key, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_length.pop(key, 0)
+        self.doc_meta.pop(key, None)
+
+    # --- поиск ---
+
+    def search(self, query: str, *, kinds=None, limit: int = 20) -> list[dict]:
+        """
+        BM25 по терминам запроса. Стоимость — сумма длин posting-списков
+        терминов запроса, от размера каталога напрямую не зависит.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_docs = len(self.doc_terms)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs
+
+            scores = defaultdict(float)
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for key, tf in docs.items():
+                    if kinds and key[0] not in kinds:
+                        continue
+                    norm = K1 * (1 - B + B * self.doc_length[key] / avg_length)
+                    scores[key] += idf * tf * (K1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            return [
+                {'type': key[0], 'id': key[1], 'score': round(score, 4), **self.doc_meta[key]}
+                for key, score in best
+            ]
+
+    # --- снимок для других процессов ---
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'version': self.version,
+                'doc_terms': dict(self.doc_terms),
+                'doc_meta': dict(self.doc_meta),
+            }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> 'SearchIndex':
+        index = cls()
+        for key, terms in data['doc_terms'].items():
+            for term, tf in terms.items():
+                index.postings[term][key] = tf
+            index.doc_terms[key] = terms
+            index.doc_length[key] = sum(terms.values())
+            index.total_length += index.doc_length[key]
+        index.doc_meta = dict(data['doc_meta'])
+        index.version = data['version']
+        return index
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+
+# ===== Документы из моделей =====
+
+def _movie_document(movie):
+    cast = ' '.join(
+        f"{c.actor.name} {c.character.name}" for c in movie.cast.all()
+    )
+    fields = {
+        'title': movie.title,
+        'description': movie.description,
+        'author': movie.author.name if movie.author else '',
+        'genres': ' '.join(g.name for g in movie.genres.all()),
+        'cast': cast,
+    }
+    meta = {'slug': movie.slug, 'title': movie.title, 'year': movie.year}
+    return ('movie', movie.pk), fields, meta, MOVIE_FIELD_WEIGHTS
+
+
+def _person_document(kind, obj):
+    return (kind, obj.pk), {'name': obj.name}, {'slug': obj.slug, 'name': obj.name}, None
+
+
+def _movie_queryset():
+    from ..models import Movie
+    return (
+        Movie.objects
+        .select_related('author')
+        .prefetch_related('genres', 'cast__actor', 'cast__character')
+    )
+
+
+def _person_querysets():
+    from ..models import Actor, Author, MovieCharacter
+    return {
+        'actor': Actor.objects.only('id', 'name', 'slug'),
+        'character': MovieCharacter.objects.only('id', 'name', 'slug'),
+        'author': Author.objects.only('id', 'name', 'slug'),
+    }
+
+
+def build_index() -> SearchIndex:
+    """Полная сборка индекса из БД."""
+    index = SearchIndex()
+    # Версию фиксируем до чтения: изменения во время сборки приведут к пересборке
+    index.version = get_catalog_version()
+
+    for movie in _movie_queryset().iterator(chunk_size=500):
+        index.add(*_movie_document(movie))
+    for kind, queryset in _person_querysets().items():
+        for obj in queryset.iterator(chunk_size=2000):
+            index.add(*_person_document(kind, obj))
+
+    logger.info(f"Search index built: {len(index)} documents, version {index.version}")
+    return index
+
+
+def rebuild_index(*, publish: bool = True) -> SearchIndex:
+    """Пересобирает индекс процесса и (по умолчанию) публикует снимок в кэш."""
+    global _index
+    index = build_index()
+    with _index_lock:
+        _index = index
+    if publish:
+        cache.set(SNAPSHOT_KEY, index.snapshot(), timeout=SNAPSHOT_TIMEOUT)
+    return index
+
+
+# ===== Индекс процесса =====
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """
+    Индекс текущего процесса. Если версия каталога ушла вперёд
+    (изменения пришли из другого воркера), берём свежий снимок из кэша,
+    а если его нет — пересобираем из БД в фоне и пока отвечаем прежним.
+    Синхронно индекс строится только при первом обращении.
+    """
+    global _index
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        if _index is not None and _index.version == version:
+            return _index
+
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if snapshot and snapshot.get('version') == version:
+            _index = SearchIndex.from_snapshot(snapshot)
+            return _index
+        stale = _index
+
+    if stale is None:
+        return rebuild_index()
+    index_rebuild.schedule('search', rebuild_index)
+    return stale
+
+
+def search(query: str, *, kinds=None, limit: int = 20) -> list[dict]:
+    return get_index().search(query, kinds=kinds, limit=limit)
+
+
+# ===== Точечные обновления из сигналов =====
+
+def reindex(kind: str, pk) -> None:
+    """Переиндексирует один документ (или удаляет, если объекта больше нет)."""
+    index = _index
+    if index is None:
+        return  # индекс ещё не собирался — соберётся при первом запросе
+
+    if kind == 'movie':
+        obj = _movie_queryset().filter(pk=pk).first()
+        document = _movie_document(obj) if obj else None
+    else:
+        obj = _person_querysets()[kind].filter(pk=pk).first()
+        document = _person_document(kind, obj) if obj else None
+
+    if document is None:
+        index.remove((kind, pk))
+    else:
+        index.add(*document)
+
+
+def reindex_movies_of(kind: str, pk) -> None:
+    """Имя актёра/персонажа/автора и название жанра входят в документы фильмов."""
+    from ..models import Movie
+    lookups = {
+        'actor': 'cast__actor',
+        'character': 'cast__character',
+        'author': 'author',
+        'genre': 'genres',
+    }
+    movie_ids = Movie.objects.filter(**{lookups[kind]: pk}).values_list('pk', flat=True).distinct()
+    for movie_id in movie_ids:
+        reindex('movie', movie_id)
+
+
+def apply_changes(documents, version: int) -> None:
+    """
+    Точечно применяет изменения каталога (список (kind, pk)) после commit'а.
+
+    Версию индекса сдвигаем на новую, только если между нами и предыдущей
+    версией не было чужих изменений (из других процессов) — иначе индекс
+    остаётся устаревшим и будет перечитан при следующем запросе.
+    Сдвинутый индекс публикуется снимком, чтобы другие воркеры подхватили
+    его из кэша, а не пересобирали из БД.
+    """
+    index = _index
+    if index is None:
+        return
+
+    for kind, pk in documents:
+        if kind == 'genre':
+            reindex_movies_of(kind, pk)
+            continue
+        reindex(kind, pk)
+        if kind != 'movie':
+            reindex_movies_of(kind, pk)
+
+    with _index_lock:
+        advanced = index.version == version - 1
+        if advanced:
+            index.version = version
+    # Пока применяли, версия могла уйти дальше — такой снимок уже никому не нужен
+    if advanced and get_catalog_version() == version:
+        cache.set(SNAPSHOT_KEY, index.snapshot(), timeout=SNAPSHOT_TIMEOUT)
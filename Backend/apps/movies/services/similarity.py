@@ -0,0 +1,176 @@
+# apps/movies/services/similarity.py
+"""
+Item-item рекомендации «потому что вы смотрели».
+
+Офлайн (задача build_similarity): матрица пользователь × фильм из Watched
+(вес — доля просмотра) и Favorite (вес 1), косинусная близость столбцов
+X̂ᵀX̂ считается разреженно блоками по фильмам, для каждого фильма в
+MovieSimilarity сохраняются top-K соседей.
+
+Онлайн: соседи фильма — один запрос по индексу (movie, -score);
+рекомендации пользователю — сумма близостей от его последних SEED_LIMIT фильмов,
+т.е. не больше SEED_LIMIT × K строк независимо от размера каталога.
+"""
+import logging
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних фильмов пользователя берём «затравкой» для рекомендаций
+SEED_LIMIT = 20
+# Сколько фильмов-столбцов обрабатываем за одно умножение (ограничивает память)
+BLOCK_SIZE = 2048
+# Недосмотренное всё равно сигнал, но слабый
+MIN_WATCH_WEIGHT = 0.1
+FAVORITE_WEIGHT = 1.0
+
+
+# ===== Офлайн-расчёт =====
+
+def interaction_matrix():
+    """
+    CSR-матрица пользователь × фильм и массив id фильмов по столбцам.
+    Если фильм и досмотрен, и лайкнут — берётся больший вес.
+    """
+    from apps.accounts.models import Favorite, Watched
+
+    watched = np.array(
+        list(Watched.objects.values_list('user_id', 'movie_id', 'progress_percent')),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    favorites = np.array(
+        list(Favorite.objects.values_list('user_id', 'movie_id')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+    user_ids, user_index = np.unique(np.concatenate([watched[:, 0], favorites[:, 0]]), return_inverse=True)
+    movie_ids, movie_index = np.unique(np.concatenate([watched[:, 1], favorites[:, 1]]), return_inverse=True)
+    shape = (len(user_ids), len(movie_ids))
+    n = len(watched)
+
+    watch = sparse.csr_matrix(
+        (np.clip(watched[:, 2] / 100.0, MIN_WATCH_WEIGHT, 1.0), (user_index[:n], movie_index[:n])),
+        shape=shape,
+    )
+    like = sparse.csr_matrix(
+        (np.full(len(favorites), FAVORITE_WEIGHT), (user_index[n:], movie_index[n:])),
+        shape=shape,
+    )
+    return watch.maximum(like).tocsr(), movie_ids
+
+
+def top_k_neighbours(matrix, top_k: int):
+    """
+    Косинус между столбцами и top-K на фильм.
+    Возвращает массивы (row, col, score) в индексах столбцов matrix.
+    """
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    norms[norms == 0] = 1.0
+    normalized = (matrix @ sparse.diags(1.0 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    rows, cols, scores = [], [], []
+    n_items = matrix.shape[1]
+    for start in range(0, n_items, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_items)
+        block = (transposed[start:stop] @ normalized).tocsr()  # (block × items)
+        block.setdiag(0, k=start)
+        block.eliminate_zeros()
+
+        for i in range(block.shape[0]):
+            lo, hi = block.indptr[i], block.indptr[i + 1]
+            if lo == hi:
+                continue
+            data, indices = block.data[lo:hi], block.indices[lo:hi]
+            if hi - lo > top_k:
+                best = np.argpartition(-data, top_k)[:top_k]
+                data, indices = data[best], indices[best]
+            rows.append(np.full(len(data), start + i))
+            cols.append(indices)
+            scores.append(data)
+
+    if not rows:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, np.array([], dtype=np.float64)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(scores)
+
+
+def build_similarity(top_k: int | None = None) -> int:
+    """Полный пересчёт MovieSimilarity. Возвращает число сохранённых пар."""
+    from ..models import MovieSimilarity
+
+    top_k = top_k or settings.SIMILARITY_TOP_K
+    matrix, movie_ids = interaction_matrix()
+    if not matrix.nnz:
+        pairs = []
+    else:
+        rows, cols, scores = top_k_neighbours(matrix, top_k)
+        pairs = [
+            MovieSimilarity(movie_id=int(movie_ids[r]), neighbour_id=int(movie_ids[c]), score=float(s))
+            for r, c, s in zip(rows, cols, scores)
+        ]
+
+    with transaction.atomic():
+        MovieSimilarity.objects.all().delete()
+        MovieSimilarity.objects.bulk_create(pairs, batch_size=2000)
+
+    logger.info(f"Movie similarity rebuilt: {len(pairs)} pairs, top_k={top_k}")
+    return len(pairs)
+
+
+# ===== Чтение =====
+
+def in_order(movie_ids, queryset) -> list:
+    """Фильмы queryset в порядке movie_ids (одним запросом)."""
+    by_id = {movie.pk: movie for movie in queryset.filter(pk__in=movie_ids)}
+    return [by_id[pk] for pk in movie_ids if pk in by_id]
+
+
+def neighbours(movie, queryset, *, limit: int = 20) -> list:
+    """Похожие фильмы в порядке убывания близости (queryset задаёт поля/аннотации)."""
+    from ..models import MovieSimilarity
+
+    ids = list(
+        MovieSimilarity.objects
+        .filter(movie=movie)
+        .order_by('-score')
+        .values_list('neighbour_id', flat=True)[:limit]
+    )
+    return in_order(ids, queryset)
+
+
+def recommend_ids(user, *, limit: int = 20) -> list[int]:
+    """id рекомендованных фильмов: сумма близостей от последних просмотренных/лайкнутых."""
+    from apps.accounts.models import Favorite, Watched
+    from ..models import MovieSimilarity
+
+    seeds = set(
+        Watched.objects.filter(user=user).order_by('-watched_at')
+        .values_list('movie_id', flat=True)[:SEED_LIMIT]
+    )
+    seeds |= set(
+        Favorite.objects.filter(user=user).order_by('-created_at')
+        .values_list('movie_id', flat=True)[:SEED_LIMIT]
+    )
+    if not seeds:
+        return []
+
+    return list(
+        MovieSimilarity.objects
+        .filter(movie_id__in=seeds)
+        .exclude(neighbour__in=Watched.objects.filter(user=user).values('movie_id'))
+        .exclude(neighbour_id__in=seeds)
+        .values('neighbour_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'neighbour_id')
+        .values_list('neighbour_id', flat=True)[:limit]
+    )
+
+
+def recommend(user, queryset, *, limit: int = 20) -> list:
+    return in_order(recommend_ids(user, limit=limit), queryset)
@@ -0,0 +1,330 @@
+# apps/movies/services/suggest_index.py
+"""
+Подсказки для строки поиска (typeahead) по отсортированному массиву ключей.
+
+Каждое название раскладывается на «хвосты» от начала каждого слова
+(«темный рыцарь» -> «темный рыцарь», «рыцарь»), хвосты лежат в одном
+отсортированном списке; префиксный поиск — bisect по этому списку.
+Под короткие префиксы (до TOP_PREFIX_LENGTH символов) совпадений слишком
+много, для них держим записи по префиксу и лениво считаемый top-k по весу.
+
+Опечатки (одна замена/вставка/удаление/перестановка в последнем слове запроса)
+ищутся по словарю удалений, как в SymSpell: для префиксов каждого слова
+каталога храним варианты с одной удалённой буквой. Кандидаты из словаря
+проверяются точным расстоянием, затем исправленный запрос ищется как префикс.
+"""
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Sum
+
+from . import index_rebuild
+from .catalog_cache import get_catalog_version
+from .search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Префиксы до этой длины (вроде «с») отвечают из top-k по весу, а не сканом ключей
+TOP_PREFIX_LENGTH = 3
+TOP_K = 32  # не меньше SuggestView.MAX_LIMIT
+# Префиксы слов длиннее этого в словарь удалений не попадают
+MAX_FUZZY_PREFIX = 8
+MIN_FUZZY_LENGTH = 3
+
+
+def _deletes(word: str) -> set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Расстояние Дамерау–Левенштейна между a и b не больше 1."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    return any(b[:i] + b[i + 1:] == a for i in range(len(b)))
+
+
+def _prefix_within_one_edit(prefix: str, word: str) -> bool:
+    """Префикс запроса отличается от начала слова не больше чем на одну правку."""
+    return any(
+        _within_one_edit(prefix, word[:length])
+        for length in (len(prefix), len(prefix) - 1, len(prefix) + 1)
+        if 0 < length <= len(word)
+    )
+
+
+class SuggestIndex:
+    """Отсортированный массив (ключ, id записи) + словарь удалений для опечаток."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self.built_at = time.monotonic()
+        self.keys = []                    # отсортированный список (folded_key, entry_key)
+        self.entries = {}                 # entry_key -> {'type', 'id', 'slug', 'label', 'weight'}
+        self.entry_keys = {}              # entry_key -> список его ключей (для удаления)
+        self.words = Counter()            # слово -> в скольких записях встречается
+        self.variants = defaultdict(set)  # префикс слова или он без одной буквы -> слова
+        self.buckets = defaultdict(set)   # короткий префикс ключа -> entry_key
+        self.top = {}                     # короткий префикс -> top-k entry_key по весу (лениво)
+
+    @staticmethod
+    def _keys_for(label: str) -> list[str]:
+        words = tokenize(label)
+        return [' '.join(words[i:]) for i in range(len(words))]
+
+    @staticmethod
+    def _variants_of(word: str) -> set[str]:
+        variants = set()
+        for length in range(MIN_FUZZY_LENGTH - 1, min(len(word), MAX_FUZZY_PREFIX) + 1):
+            prefix = word[:length]
+            variants.add(prefix)
+            variants |= _deletes(prefix)
+        return variants
+
+    @staticmethod
+    def _short_prefixes(keys: list[str]) -> set[str]:
+        return {key[:n] for key in keys for n in range(1, min(len(key), TOP_PREFIX_LENGTH) + 1)}
+
+    # --- изменение ---
+
+    def _add_buckets(self, entry_key: tuple, keys: list[str]) -> None:
+        for prefix in self._short_prefixes(keys):
+            self.buckets[prefix].add(entry_key)
+            self.top.pop(prefix, None)
+
+    def _remove_buckets(self, entry_key: tuple, keys: list[str]) -> None:
+        for prefix in self._short_prefixes(keys):
+            bucket = self.buckets.get(prefix)
+            if bucket is not None:
+                bucket.discard(entry_key)
+                if not bucket:
+                    del self.buckets[prefix]
+            self.top.pop(prefix, None)
+
+    def _add_words(self, keys: list[str]) -> None:
+        for word in set(keys[0].split()) if keys else ():
+            self.words[word] += 1
+            if self.words[word] == 1:
+                for variant in self._variants_of(word):
+                    self.variants[variant].add(word)
+
+    def _remove_words(self, keys: list[str]) -> None:
+        for word in set(keys[0].split()) if keys else ():
+            self.words[word] -= 1
+            if self.words[word] > 0:
+                continue
+            del self.words[word]
+            for variant in self._variants_of(word):
+                words = self.variants.get(variant)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del self.variants[variant]
+
+    def add(self, entry: dict) -> None:
+        entry_key = (entry['type'], entry['id'])
+        with self._lock:
+            self._remove(entry_key)
+            keys = self._keys_for(entry['label'])
+            for key in keys:
+                bisect.insort(self.keys, (key, entry_key))
+            self._add_words(keys)
+            self._add_buckets(entry_key, keys)
+            self.entries[entry_key] = entry
+            self.entry_keys[entry_key] = keys
+
+    def bulk_load(self, entries) -> None:
+        """Загрузка с нуля: одна сортировка вместо insort на каждую запись."""
+        with self._lock:
+            pairs = []
+            for entry in entries:
+                entry_key = (entry['type'], entry['id'])
+                keys = self._keys_for(entry['label'])
+                self._add_words(keys)
+                self._add_buckets(entry_key, keys)
+                self.entries[entry_key] = entry
+                self.entry_keys[entry_key] = keys
+                pairs.extend((key, entry_key) for key in keys)
+            pairs.sort()
+            self.keys = pairs
+
+    def remove(self, entry_key: tuple) -> None:
+        with self._lock:
+            self._remove(entry_key)
+
+    def _remove(self, entry_key: tuple) -> None:
+        keys = self.entry_keys.pop(entry_key, ())
+        for key in keys:
+            i = bisect.bisect_left(self.keys, (key, entry_key))
+            if i < len(self.keys) and self.keys[i] == (key, entry_key):
+                del self.keys[i]
+        self._remove_words(list(keys))
+        self._remove_buckets(entry_key, list(keys))
+        self.entries.pop(entry_key, None)
+
+    # --- поиск ---
+
+    def _rank_key(self, entry_key: tuple):
+        entry = self.entries[entry_key]
+        return -entry['weight'], entry['label']
+
+    def _prefix_matches(self, prefix: str) -> set:
+        if len(prefix) <= TOP_PREFIX_LENGTH:
+            top = self.top.get(prefix)
+            if top is None:
+                top = self.top[prefix] = heapq.nsmallest(TOP_K, self.buckets.get(prefix, ()), key=self._rank_key)
+            return set(top)
+
+        found = set()
+        i = bisect.bisect_left(self.keys, (prefix,))
+        while i < len(self.keys) and self.keys[i][0].startswith(prefix):
+            found.add(self.keys[i][1])
+            i += 1
+        return found
+
+    def _corrections(self, word: str) -> set[str]:
+        """Слова каталога, начало которых отличается от word одной правкой."""
+        probe = word[:MAX_FUZZY_PREFIX]
+        candidates = set()
+        for variant in {probe} | _deletes(probe):
+            candidates |= self.variants.get(variant, set())
+        return {candidate for candidate in candidates if _prefix_within_one_edit(word, candidate)}
+
+    def suggest(self, query: str, *, limit: int = 8) -> list[dict]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        prefix = ' '.join(tokens)
+
+        with self._lock:
+            exact = self._prefix_matches(prefix)
+            fuzzy = set()
+            if len(exact) < limit and len(tokens[-1]) >= MIN_FUZZY_LENGTH:
+                head = ' '.join(tokens[:-1] + [''])
+                for word in self._corrections(tokens[-1]):
+                    fuzzy |= self._prefix_matches(head + word)
+                fuzzy -= exact
+
+            def rank(entry_keys):
+                return [self.entries[k] for k in sorted(entry_keys, key=self._rank_key)]
+
+            return (rank(exact) + rank(fuzzy))[:limit]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# ===== Записи из моделей =====
+
+def _movie_entries(queryset):
+    for movie in queryset.only('id', 'title', 'slug', 'views'):
+        yield {'type': 'movie', 'id': movie.pk, 'slug': movie.slug, 'label': movie.title, 'weight': movie.views}
+
+
+def _person_entries(kind, queryset):
+    for obj in queryset:
+        yield {'type': kind, 'id': obj.pk, 'slug': obj.slug, 'label': obj.name, 'weight': obj.weight or 0}
+
+
+def _person_querysets():
+    """Вес человека — суммарные просмотры его фильмов."""
+    from ..models import Actor, Author, MovieCharacter
+    return {
+        'actor': Actor.objects.annotate(weight=Sum('castings__movie__views')).only('id', 'name', 'slug'),
+        'character': MovieCharacter.objects.annotate(weight=Sum('appearances__movie__views')).only('id', 'name', 'slug'),
+        'author': Author.objects.annotate(weight=Sum('movies__views')).only('id', 'name', 'slug'),
+    }
+
+
+def build_index() -> SuggestIndex:
+    from ..models import Movie
+
+    index = SuggestIndex()
+    index.version = get_catalog_version()
+
+    entries = list(_movie_entries(Movie.objects.all()))
+    for kind, queryset in _person_querysets().items():
+        entries.extend(_person_entries(kind, queryset))
+    index.bulk_load(entries)
+
+    logger.info(f"Suggest index built: {len(index)} entries, {len(index.keys)} keys")
+    return index
+
+
+# ===== Индекс процесса =====
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> SuggestIndex:
+    """
+    Индекс процесса. Если каталог изменился в другом процессе или истёк
+    SUGGEST_REFRESH_SECONDS (веса — просмотры — меняются без сигналов),
+    новый собирается в фоне, а запрос обслуживает текущий.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+            return _index
+
+    if (
+        index.version != get_catalog_version()
+        or time.monotonic() - index.built_at >= settings.SUGGEST_REFRESH_SECONDS
+    ):
+        index_rebuild.schedule('suggest', _rebuild)
+    return index
+
+
+def _rebuild() -> None:
+    global _index
+    index = build_index()
+    with _index_lock:
+        _index = index
+
+
+def suggest(query: str, *, limit: int = 8) -> list[dict]:
+    return get_index().suggest(query, limit=limit)
+
+
+def apply_changes(documents, version: int) -> None:
+    """Точечное обновление по тем же изменениям каталога, что и у поискового индекса."""
+    from ..models import Movie
+
+    index = _index
+    if index is None:
+        return
+
+    for kind, pk in documents:
+        if kind == 'movie':
+            entries = list(_movie_entries(Movie.objects.filter(pk=pk)))
+        elif kind in ('actor', 'character', 'author'):
+            entries = list(_person_entries(kind, _person_querysets()[kind].filter(pk=pk)))
+        else:
+            continue  # жанры в подсказках не участвуют
+
+        if entries:
+            index.add(entries[0])
+        else:
+            index.remove((kind, pk))
+
+    with _index_lock:
+        if index.version == version - 1:
+            index.version = version
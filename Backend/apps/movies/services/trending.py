@@ -0,0 +1,188 @@
+# apps/movies/services/trending.py
+"""
+«Сейчас в тренде»: запуски и досмотры с экспоненциальным затуханием.
+
+Событие (record) — два атомарных обращения к кэшу:
+    trending:count:<час>:<movie>:<start|finish>  — счётчик за час (cache.incr)
+    trending:log:<n>                             — журнал пар (час, фильм), как в progress_buffer
+Задача movies.refresh_trending раз в несколько минут переносит счётчики в
+кольцевые буферы фильмов trending:ring:<movie> — TRENDING_WINDOW_HOURS ячеек
+по (запуски, досмотры) в uint32, ячейка = час % окно — и считает
+
+    score = Σ (START_WEIGHT · starts_h + FINISH_WEIGHT · finishes_h) · 0.5 ** (возраст_h / HALF_LIFE)
+
+Топ-N сохраняется одним ключом: выдача — одно чтение кэша.
+Кольца живут только в кэше; при его потере тренд набирается заново за окно.
+Счётчики пишут веб-процессы, а читает воркер Celery, поэтому кэш должен быть
+общим (Redis): с LocMemCache у каждого процесса свои ключи и тренд пуст.
+"""
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('start', 'finish')
+COUNT_KEY = "trending:count:{hour}:{movie_id}:{kind}"
+SEEN_KEY = "trending:seen:{hour}:{movie_id}"
+SESSION_KEY = "trending:session:{user_id}:{movie_id}"
+LOG_KEY = "trending:log:{n}"
+SEQ_KEY = "trending:seq"
+RING_KEY = "trending:ring:{movie_id}"
+STATE_KEY = "trending:state"
+TOP_KEY = "trending:top"
+LOCK_KEY = "trending:lock"
+LOCK_TIMEOUT = 60 * 10
+
+
+def current_hour(now: float | None = None) -> int:
+    return int((now if now is not None else time.time()) // 3600)
+
+
+def _window() -> int:
+    return settings.TRENDING_WINDOW_HOURS
+
+
+def _count_key(hour, movie_id, kind) -> str:
+    return COUNT_KEY.format(hour=hour, movie_id=movie_id, kind=kind)
+
+
+# ===== События =====
+
+def record(movie_id, kind: str, *, now: float | None = None) -> None:
+    """+1 запуск или досмотр фильма в текущем часе."""
+    hour = current_hour(now)
+    timeout = (_window() + 1) * 3600
+    key = _count_key(hour, movie_id, kind)
+    cache.add(key, 0, timeout=timeout)
+    cache.incr(key)
+
+    # Первое событие фильма в этом часе — в журнал для refresh()
+    if cache.add(SEEN_KEY.format(hour=hour, movie_id=movie_id), 1, timeout=timeout):
+        cache.add(SEQ_KEY, 0, timeout=None)
+        n = cache.incr(SEQ_KEY)
+        cache.set(LOG_KEY.format(n=n), (hour, movie_id), timeout=timeout)
+
+
+def record_play(user_id, movie_id, *, now: float | None = None) -> bool:
+    """
+    Heartbeat прогресса. Запуском считается первый heartbeat сессии: пауза
+    дольше TRENDING_SESSION_SECONDS начинает новую. True — если засчитан запуск.
+    """
+    key = SESSION_KEY.format(user_id=user_id, movie_id=movie_id)
+    if cache.add(key, 1, timeout=settings.TRENDING_SESSION_SECONDS):
+        record(movie_id, 'start', now=now)
+        return True
+    cache.touch(key, settings.TRENDING_SESSION_SECONDS)
+    return False
+
+
+# ===== Пересчёт =====
+
+def weights(hour: int) -> np.ndarray:
+    """Вес каждой ячейки кольца на час hour: (окно, 2) — запуски, досмотры."""
+    window = _window()
+    age = (hour - np.arange(window)) % window  # ячейка i хранит час ≡ i (mod окно)
+    decay = 0.5 ** (age / settings.TRENDING_HALF_LIFE_HOURS)
+    return np.stack([decay * settings.TRENDING_START_WEIGHT, decay * settings.TRENDING_FINISH_WEIGHT], axis=1)
+
+
+def _read_log(state) -> list[tuple]:
+    """Новые пары журнала от водяного знака. Пустой слот ждём один прогон, потом пропускаем."""
+    start, end = state['watermark'], cache.get(SEQ_KEY, 0)
+    logged = cache.get_many([LOG_KEY.format(n=n) for n in range(start + 1, end + 1)])
+    pairs, last = [], start
+    for n in range(start + 1, end + 1):
+        pair = logged.get(LOG_KEY.format(n=n))
+        if pair is None and state.get('gap') != n:
+            state['gap'] = n
+            break
+        if pair is not None:
+            pairs.append(tuple(pair))
+        last = n
+    cache.delete_many([LOG_KEY.format(n=n) for n in range(start + 1, last + 1)])
+    state['watermark'] = last
+    return pairs
+
+
+def refresh(*, now: float | None = None) -> dict:
+    if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        return {'skipped': True}
+    try:
+        return _refresh(current_hour(now))
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _refresh(hour: int) -> dict:
+    window = _window()
+    state = cache.get(STATE_KEY) or {'hour': None, 'movies': [], 'open': [], 'watermark': 0}
+
+    # Счётчики текущего часа ещё растут — их перечитываем, пока час не закончится
+    pairs = {
+        (h, movie_id) for h, movie_id in [*state['open'], *_read_log(state)]
+        if h > hour - window
+    }
+    movie_ids = list(dict.fromkeys([*state['movies'], *(movie_id for _, movie_id in pairs)]))
+    rows = {movie_id: row for row, movie_id in enumerate(movie_ids)}
+
+    rings = np.zeros((len(movie_ids), window, 2), dtype=np.uint32)
+    stored = cache.get_many([RING_KEY.format(movie_id=movie_id) for movie_id in movie_ids])
+    for movie_id, row in rows.items():
+        raw = stored.get(RING_KEY.format(movie_id=movie_id))
+        if raw is not None and len(raw) == rings[row].nbytes:
+            rings[row] = np.frombuffer(raw, dtype=np.uint32).reshape(window, 2)
+
+    # Сдвиг окна: ячейки часов, прошедших с прошлого прогона, обнуляем
+    changed = np.zeros(len(movie_ids), dtype=bool)
+    if state['hour'] is not None and hour > state['hour']:
+        slots = [h % window for h in range(max(state['hour'] + 1, hour - window + 1), hour + 1)]
+        changed |= rings[:, slots].any(axis=(1, 2))
+        rings[:, slots] = 0
+
+    keys = [_count_key(h, movie_id, kind) for h, movie_id in pairs for kind in KINDS]
+    counts = cache.get_many(keys)
+    for h, movie_id in pairs:
+        row = rows[movie_id]
+        rings[row, h % window] = [counts.get(_count_key(h, movie_id, kind), 0) for kind in KINDS]
+        changed[row] = True
+
+    alive = rings.any(axis=(1, 2))
+    scores = np.einsum('nwk,wk->n', rings, weights(hour))
+
+    cache.set_many(
+        {RING_KEY.format(movie_id=movie_ids[row]): rings[row].tobytes() for row in np.flatnonzero(changed & alive)},
+        timeout=None,
+    )
+    cache.delete_many([RING_KEY.format(movie_id=movie_ids[row]) for row in np.flatnonzero(~alive)])
+
+    top_n = min(settings.TRENDING_TOP_N, int(alive.sum()))
+    best = np.argpartition(-scores, top_n - 1)[:top_n] if top_n else []
+    best = sorted(best, key=lambda row: (-scores[row], movie_ids[row]))
+    cache.set(TOP_KEY, {
+        'hour': hour,
+        'generated_at': time.time(),
+        'items': [(int(movie_ids[row]), round(float(scores[row]), 3)) for row in best],
+    }, timeout=None)
+
+    state.update(
+        hour=hour,
+        movies=[movie_ids[row] for row in np.flatnonzero(alive)],
+        open=[(h, movie_id) for h, movie_id in pairs if h >= hour],
+    )
+    cache.set(STATE_KEY, state, timeout=None)
+
+    summary = {'movies': int(alive.sum()), 'updated': int((changed & alive).sum()), 'top': top_n}
+    logger.info(f"Trending refreshed: {summary}")
+    return summary
+
+
+# ===== Чтение =====
+
+def top(limit: int = 20) -> list[tuple[int, float]]:
+    """[(movie_id, score), ...] из последнего refresh()."""
+    payload = cache.get(TOP_KEY)
+    return payload['items'][:limit] if payload else []
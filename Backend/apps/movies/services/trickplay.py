@@ -0,0 +1,165 @@
+# apps/movies/services/trickplay.py
+"""
+Превью для перемотки (задача movies.build_trickplay).
+
+Один проход ffmpeg: fps=1/TRICKPLAY_INTERVAL -> scale -> tile=COLUMNS×ROWS,
+то есть кадры сразу складываются в листы (sheet_0001.jpg, …) без
+промежуточных файлов на каждый кадр. С TRICKPLAY_KEYFRAMES_ONLY декодируются
+только ключевые кадры (-skip_frame nokey): превью точно до длины GOP,
+зато проход в разы быстрее полного декодирования.
+
+Рядом с листами кладётся thumbnails.vtt — cue на каждый интервал с
+sheet_NNNN.jpg#xywh=x,y,w,h. Листы неизменяемы (etag в префиксе) и отдаются
+как обычные blob'ы по подписанным ссылкам; VTT — через прокси, который
+подставляет в него подписанные ссылки на листы.
+"""
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from .hls import upload
+from ..utils.video_meta import get_video_fingerprint, get_video_url_for_processing
+
+logger = logging.getLogger(__name__)
+
+VTT = 'thumbnails.vtt'
+_XYWH = re.compile(r'^(?P<uri>[^#\s]+)(?P<fragment>#xywh=\d+,\d+,\d+,\d+)$')
+
+
+class TrickplayError(Exception):
+    pass
+
+
+def trickplay_prefix(video_name: str, etag: str | None) -> str:
+    """movies/videos/film.mp4 -> movies/videos/film/trickplay/<etag>/"""
+    base, _ = os.path.splitext(video_name)
+    tag = re.sub(r'[^0-9A-Za-z]', '', etag or '')[:24] or 'noetag'
+    return f"{base}/trickplay/{tag}/"
+
+
+def tile_size(info) -> tuple[int, int]:
+    """Ширина из настроек, высота — по пропорциям видео (чётная; 16:9, если размер неизвестен)."""
+    width = settings.TRICKPLAY_WIDTH
+    if info and info.width and info.height:
+        return width, max(2, int(round(width * info.height / info.width / 2)) * 2)
+    return width, int(round(width * 9 / 16 / 2)) * 2
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{ms:03d}"
+
+
+def build_vtt(sheets: list[str], *, frames: int, interval: int, duration: float,
+              width: int, height: int, columns: int, rows: int) -> str:
+    per_sheet = columns * rows
+    lines = ['WEBVTT', '']
+    for i in range(frames):
+        sheet, cell = divmod(i, per_sheet)
+        x, y = (cell % columns) * width, (cell // columns) * height
+        start, end = i * interval, min((i + 1) * interval, duration)
+        lines += [
+            f"{_timestamp(start)} --> {_timestamp(end)}",
+            f"{sheets[sheet]}#xywh={x},{y},{width},{height}",
+            '',
+        ]
+    return '\n'.join(lines)
+
+
+def rewrite_vtt(text: str, sign) -> str:
+    """Подменяет ссылки на листы (строки вида sheet.jpg#xywh=…) на sign(uri), фрагмент сохраняется."""
+    out = []
+    for line in text.splitlines():
+        match = _XYWH.match(line.strip())
+        out.append(f"{sign(match['uri'])}{match['fragment']}" if match else line)
+    return '\n'.join(out) + '\n'
+
+
+def extract(source: str, out_dir: str, *, interval: int, width: int, height: int,
+            columns: int, rows: int, fmt: str, timeout: int | None = None) -> list[str]:
+    """Листы в out_dir за один проход ffmpeg. Возвращает их имена по порядку."""
+    codec = ['-c:v', 'libwebp', '-quality', '70'] if fmt == 'webp' else ['-q:v', '5']
+    cmd = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-loglevel', 'error']
+    if settings.TRICKPLAY_KEYFRAMES_ONLY:
+        cmd += ['-skip_frame', 'nokey']
+    cmd += [
+        '-i', source, '-an', '-sn', '-dn',
+        '-vf', f"fps=1/{interval},scale={width}:{height},tile={columns}x{rows}",
+        *codec, '-f', 'image2', os.path.join(out_dir, f"sheet_%04d.{fmt}"),
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout or settings.TRICKPLAY_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        raise TrickplayError("ffmpeg timed out")
+    sheets = sorted(name for name in os.listdir(out_dir) if name.startswith('sheet_'))
+    if result.returncode != 0 or not sheets:
+        raise TrickplayError(f"ffmpeg failed: {(result.stderr or '').strip()[-500:]}")
+    return sheets
+
+
+def build(movie, *, force: bool = False) -> dict:
+    """{'status': 'ready' | 'skipped', ...}; TrickplayError — если собрать не удалось."""
+    from ..models import MovieMediaInfo, MovieTrickplay
+
+    if not movie.video:
+        raise TrickplayError("No video file")
+    if shutil.which('ffmpeg') is None:
+        raise TrickplayError("ffmpeg not found")
+
+    etag, _ = get_video_fingerprint(movie.video)
+    trickplay, _ = MovieTrickplay.objects.get_or_create(movie=movie)
+    if trickplay.is_ready and trickplay.source_etag == (etag or '') and not force:
+        return {'status': 'skipped'}
+
+    info = MovieMediaInfo.objects.filter(movie=movie).first()
+    if not info or not info.duration_sec:
+        raise TrickplayError("Unknown duration: media info is not ready")
+
+    interval, columns, rows = settings.TRICKPLAY_INTERVAL, settings.TRICKPLAY_COLUMNS, settings.TRICKPLAY_ROWS
+    width, height = tile_size(info)
+    source = get_video_url_for_processing(movie.video, expires_in=settings.TRICKPLAY_TIMEOUT)
+    if not source:
+        raise TrickplayError("Unable to get video URL")
+
+    # После этой отметки любая ошибка переводит запись в failed
+    prefix = trickplay_prefix(movie.video.name, etag)
+    trickplay.status, trickplay.error, trickplay.prefix, trickplay.source_etag = 'processing', '', prefix, etag or ''
+    trickplay.save(update_fields=['status', 'error', 'prefix', 'source_etag', 'updated_at'])
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            sheets = extract(
+                source, work_dir, interval=interval, width=width, height=height,
+                columns=columns, rows=rows, fmt=settings.TRICKPLAY_FORMAT,
+            )
+            # Последний лист обычно заполнен не до конца: cue только на реальные кадры
+            frames = min(math.ceil(info.duration_sec / interval), len(sheets) * columns * rows)
+            with open(os.path.join(work_dir, VTT), 'w', encoding='utf-8') as f:
+                f.write(build_vtt(
+                    sheets, frames=frames, interval=interval, duration=info.duration_sec,
+                    width=width, height=height, columns=columns, rows=rows,
+                ))
+            upload(work_dir, prefix, sheets, overwrite=True)
+            upload(work_dir, prefix, [VTT], overwrite=True)  # индекс — после листов
+    except Exception as e:
+        trickplay.status, trickplay.error = 'failed', str(e)
+        trickplay.save(update_fields=['status', 'error', 'updated_at'])
+        if isinstance(e, TrickplayError):
+            raise
+        raise TrickplayError(str(e)) from e
+
+    trickplay.status, trickplay.vtt_key, trickplay.ready_at = 'ready', prefix + VTT, timezone.now()
+    trickplay.interval_sec, trickplay.tile_width, trickplay.tile_height = interval, width, height
+    trickplay.columns, trickplay.rows, trickplay.frames, trickplay.sheets = columns, rows, frames, sheets
+    trickplay.save()
+    logger.info(f"Trickplay ready for movie {movie.pk}: {frames} frames in {len(sheets)} sheets")
+    return {'status': 'ready', 'frames': frames, 'sheets': len(sheets)}
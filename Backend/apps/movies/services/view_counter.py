@@ -0,0 +1,85 @@
+# apps/movies/services/view_counter.py
+"""
+Счётчик просмотров без горячей строки.
+
+increment() пишет +1 в случайную из MovieViewCounterShard.SHARDS строк фильма,
+flush() периодически забирает накопленное одним
+UPDATE movies SET views = views + CASE id WHEN ... END на пачку фильмов
+и удаляет сброшенные строки. Читать «живое» значение — Movie.views_count
+или MovieQuerySet.with_live_views().
+"""
+import logging
+import random
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+logger = logging.getLogger(__name__)
+
+
+def increment(movie_id, amount: int = 1) -> None:
+    from ..models import MovieViewCounterShard
+
+    shard = random.randrange(MovieViewCounterShard.SHARDS)
+    rows = MovieViewCounterShard.objects.filter(movie_id=movie_id, shard=shard)
+    if rows.update(delta=F('delta') + amount):
+        return
+    try:
+        with transaction.atomic():
+            MovieViewCounterShard.objects.create(movie_id=movie_id, shard=shard, delta=amount)
+    except IntegrityError:
+        # Полосу параллельно создал другой запрос
+        rows.update(delta=F('delta') + amount)
+
+
+def pending(movie_ids) -> dict:
+    """Ещё не сброшенные инкременты: movie_id -> delta."""
+    from ..models import MovieViewCounterShard
+    return dict(
+        MovieViewCounterShard.objects
+        .filter(movie_id__in=movie_ids)
+        .order_by()
+        .values('movie_id')
+        .annotate(total=Sum('delta'))
+        .values_list('movie_id', 'total')
+    )
+
+
+def flush(*, batch_size: int = 500) -> int:
+    """Сбрасывает полосы в Movie.views пачками. Возвращает число обновлённых фильмов."""
+    from ..models import Movie, MovieViewCounterShard
+
+    flushed = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                MovieViewCounterShard.objects
+                .select_for_update()
+                .filter(delta__gt=0)
+                .order_by('pk')
+                .values_list('pk', 'movie_id', 'delta')[:batch_size]
+            )
+            if not rows:
+                break
+
+            totals = Counter()
+            for _, movie_id, delta in rows:
+                totals[movie_id] += delta
+
+            Movie.objects.filter(pk__in=totals).update(
+                views=F('views') + Case(
+                    *[When(pk=movie_id, then=Value(total)) for movie_id, total in totals.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            MovieViewCounterShard.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+            flushed += len(totals)
+
+        if len(rows) < batch_size:
+            break
+
+    if flushed:
+        logger.info(f"View counters flushed for {flushed} movies")
+    return flushed
@@ -1,48 +1,207 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.db import transaction
-from .models import Movie
-from .tasks import compute_movie_duration
+from .models import Movie, MovieMediaInfo, Genre, Author, Actor, MovieCharacter, Casting
+from .tasks import ingest_movie
+from .services.catalog_cache import bump_catalog_version
+from .services import counters, minhash_index, search_index, suggest_index
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=Movie)
-def schedule_duration_compute(sender, instance: Movie, created, **kwargs):
+def schedule_duration_compute(sender, instance: Movie, created, update_fields=None, **kwargs):
     """
-    Запускает задачу вычисления длительности при:
+    Запускает ingest (faststart -> медиаданные -> превью и HLS) при:
     1. Создании нового фильма с видео
-    2. Обновлении видео файла
-    3. Если duration=None и есть видео
+    2. Замене видео файла (отмечается в pre_save: здесь в БД уже новое значение)
+    3. Если у фильма с видео ещё нет MovieMediaInfo
     """
-    should_compute = False
-    
+    video_changed = instance.__dict__.pop('_video_changed', False)
+
+    # Служебные сохранения (счётчики, отметки задачи) видео не меняют
+    if update_fields is not None and 'video' not in update_fields:
+        return
+    if not instance.video:
+        return
+
     if created:
-        # Новый фильм с видео
-        if instance.video:
-            should_compute = True
-            logger.info(f"New movie {instance.id} created with video, scheduling duration compute")# type: ignore
+        logger.info(f"New movie {instance.id} created with video, scheduling ingest")# type: ignore
+    elif video_changed:
+        logger.info(f"Movie {instance.id} video file changed, scheduling ingest")# type: ignore
+    elif not MovieMediaInfo.objects.filter(movie_id=instance.pk).exists():
+        logger.info(f"Movie {instance.id} has video but no media info, scheduling ingest")# type: ignore
     else:
-        # Обновление существующего фильма
-        if instance.video and not instance.duration:
-            should_compute = True
-            logger.info(f"Movie {instance.id} has video but no duration, scheduling compute")# type: ignore
-        
-        # Проверяем, изменился ли видео файл
-        try:
-            old_instance = Movie.objects.only('video').get(pk=instance.pk)
-            if old_instance.video != instance.video and instance.video:
-                should_compute = True
-                logger.info(f"Movie {instance.id} video file changed, scheduling duration compute")# type: ignore
-        except Movie.DoesNotExist:
-            pass
-    
-    if should_compute:
-        # Запускаем задачу после commit'а транзакции
-        transaction.on_commit(
-            lambda: compute_movie_duration.apply_async(# type: ignore
-                args=[instance.pk],
-                countdown=5  # задержка 5 секунд для завершения загрузки в Azure
-            )
-        )
\ No newline at end of file
+        return
+
+    # После commit'а транзакции; задержка 5 секунд — на завершение загрузки в Azure
+    transaction.on_commit(lambda: ingest_movie(instance.pk, countdown=5))
+
+
+# ===== Инвалидация кэша каталога =====
+
+CATALOG_MODELS = (Movie, Genre, Author, Actor, MovieCharacter, Casting, MovieMediaInfo)
+
+# Служебные поля Movie: в ответах каталога их нет, версию кэша не поднимаем
+MOVIE_BOOKKEEPING_FIELDS = frozenset({'last_meta_update', 'meta_dirty', 'faststart_status', 'updated_at'})
+
+# Поля MovieMediaInfo, которые отдаёт список (resolution считается из width/height).
+# Повторный probe с теми же значениями (новые probed_at, seek_index) версию не поднимает
+MEDIA_INFO_CATALOG_FIELDS = (
+    'duration_sec', 'width', 'height', 'bitrate', 'video_codec', 'audio_codec', 'fps', 'container', 'file_size',
+)
+
+
+@receiver(pre_save, sender=MovieMediaInfo)
+def remember_media_info_change(sender, instance: MovieMediaInfo, **kwargs):
+    previous = (
+        MovieMediaInfo.objects.filter(pk=instance.pk).values_list(*MEDIA_INFO_CATALOG_FIELDS).first()
+        if instance.pk else None
+    )
+    instance._catalog_changed = previous != tuple(getattr(instance, field) for field in MEDIA_INFO_CATALOG_FIELDS)
+
+
+def _affected_documents(sender, instance, action=None, reverse=False, pk_set=None, deleted=False):
+    """
+    Какие документы поискового индекса затронуло изменение.
+    None — точечно не обновить, индекс будет перечитан целиком.
+    """
+    if sender is Movie.genres.through:
+        if not reverse:
+            return [('movie', instance.pk)]
+        if action == 'post_clear':
+            return None
+        return [('movie', pk) for pk in pk_set or ()]
+
+    if sender is Movie:
+        return [('movie', instance.pk)]
+    if sender is Casting:
+        return [('movie', instance.movie_id)]
+    if sender is MovieMediaInfo:
+        return []  # в индексах медиаданных нет, но они отдаются в списке
+    if sender is Genre:
+        # связи удалённого жанра уже не найти — пусть индекс перечитается
+        return None if deleted else [('genre', instance.pk)]
+
+    kinds = {Actor: 'actor', Author: 'author', MovieCharacter: 'character'}
+    return [(kinds[sender], instance.pk)]
+
+
+def invalidate_catalog(sender, instance, **kwargs):
+    """
+    Любое изменение каталога поднимает версию кэша и обновляет индексы поиска, подсказок и похожих фильмов.
+    Делаем это после commit'а, иначе параллельный запрос может
+    закэшировать ещё старые данные уже под новой версией.
+    """
+    action = kwargs.get('action')
+    if action and action.startswith('pre_'):
+        return  # m2m_changed: достаточно post_* событий
+    update_fields = kwargs.get('update_fields')
+    if sender is Movie and update_fields is not None and set(update_fields) <= MOVIE_BOOKKEEPING_FIELDS:
+        return
+    if sender is MovieMediaInfo and not instance.__dict__.pop('_catalog_changed', True):
+        return
+
+    documents = _affected_documents(
+        sender,
+        instance,
+        action=action,
+        reverse=kwargs.get('reverse', False),
+        pk_set=kwargs.get('pk_set'),
+        deleted=kwargs.get('signal') is post_delete,
+    )
+
+    def apply():
+        version = bump_catalog_version()
+        if documents is not None:
+            search_index.apply_changes(documents, version)
+            suggest_index.apply_changes(documents, version)
+            minhash_index.apply_changes(documents, version)
+
+    transaction.on_commit(apply)
+
+
+for _model in CATALOG_MODELS:
+    post_save.connect(invalidate_catalog, sender=_model, dispatch_uid=f"catalog-save-{_model.__name__}")
+    post_delete.connect(invalidate_catalog, sender=_model, dispatch_uid=f"catalog-delete-{_model.__name__}")
+
+m2m_changed.connect(invalidate_catalog, sender=Movie.genres.through, dispatch_uid="catalog-m2m-genres")
+
+
+# ===== Денормализованные счётчики (movies_count / appearances_count) =====
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def update_genre_counters(sender, instance, action, reverse, pk_set, **kwargs):
+    """Movie.genres: add/remove/clear с обеих сторон связи"""
+    if action == 'pre_clear':
+        # После clear() pk_set пустой — запоминаем, какие жанры затронуты
+        instance._cleared_genre_ids = (
+            [instance.pk] if reverse else list(instance.genres.values_list('pk', flat=True))
+        )
+        return
+
+    if action == 'post_clear':
+        counters.refresh_genres(getattr(instance, '_cleared_genre_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        counters.refresh_genres([instance.pk] if reverse else pk_set or [])
+
+
+@receiver(pre_save, sender=Movie)
+def remember_previous_author(sender, instance: Movie, **kwargs):
+    instance._previous_author_id = (
+        Movie.objects.filter(pk=instance.pk).values_list('author_id', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(pre_save, sender=Movie)
+def reset_faststart_on_video_change(sender, instance: Movie, update_fields=None, **kwargs):
+    """Новый файл ещё не проверен на расположение moov; ingest для него ставит schedule_duration_compute"""
+    if not instance.pk or (update_fields is not None and 'video' not in update_fields):
+        return
+    previous = Movie.objects.filter(pk=instance.pk).values_list('video', flat=True).first()
+    if (previous or '') != (instance.video.name or ''):
+        instance.faststart_status = ''
+        instance._video_changed = True
+
+
+@receiver(post_save, sender=Movie)
+def update_author_counters(sender, instance: Movie, created, **kwargs):
+    previous = getattr(instance, '_previous_author_id', None)
+    if created or previous != instance.author_id:  # type: ignore
+        counters.refresh_authors([previous, instance.author_id])  # type: ignore
+
+
+@receiver(pre_delete, sender=Movie)
+def remember_movie_relations(sender, instance: Movie, **kwargs):
+    # Строки m2m-таблицы жанров удаляются каскадом без m2m_changed
+    instance._deleted_genre_ids = list(instance.genres.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Movie)
+def update_counters_after_movie_delete(sender, instance: Movie, **kwargs):
+    counters.refresh_genres(getattr(instance, '_deleted_genre_ids', []))
+    counters.refresh_authors([instance.author_id])  # type: ignore
+
+
+@receiver(pre_save, sender=Casting)
+def remember_previous_casting(sender, instance: Casting, **kwargs):
+    previous = (
+        Casting.objects.filter(pk=instance.pk).values('actor_id', 'character_id').first()
+        if instance.pk else None
+    )
+    instance._previous_casting = previous or {}
+
+
+@receiver(post_save, sender=Casting)
+def update_casting_counters(sender, instance: Casting, **kwargs):
+    previous = getattr(instance, '_previous_casting', {})
+    counters.refresh_actors([instance.actor_id, previous.get('actor_id')])  # type: ignore
+    counters.refresh_characters([instance.character_id, previous.get('character_id')])  # type: ignore
+
+
+@receiver(post_delete, sender=Casting)
+def update_counters_after_casting_delete(sender, instance: Casting, **kwargs):
+    counters.refresh_actors([instance.actor_id])  # type: ignore
+    counters.refresh_characters([instance.character_id])  # type: ignore
@@ -1,13 +1,9 @@
-from celery import shared_task
+from celery import chain, group, shared_task
+from django.conf import settings
 from django.utils.timezone import now as dateNow
 from datetime import timedelta
 from .models import Movie
-from .utils.video_meta import (
-    probe_duration_seconds,
-    probe_video_metadata,
-    get_video_url_for_processing,
-    extract_duration_from_filename
-)
+from .services import media_info
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,13 +14,15 @@ logger = logging.getLogger(__name__)
     max_retries=3,
     default_retry_delay=60  # повторить через 60 секунд
 )
-def compute_movie_duration(self, movie_id: int):
+def compute_movie_duration(self, movie_id: int, force: bool = False):
     """
-    Вычисляет длительность видео с использованием ffprobe.
+    Заполняет MovieMediaInfo: для MP4/MOV — разбором заголовка (utils/mp4_header),
+    иначе одним вызовом ffprobe (все потоки + контейнер).
     Поддерживает Azure Storage и локальные файлы.
+    Если ETag и размер файла не изменились — ffprobe не запускается.
     """
     try:
-        movie = Movie.objects.get(pk=movie_id)
+        movie = Movie.objects.select_related('media_info').get(pk=movie_id)
     except Movie.DoesNotExist:
         logger.error(f"Movie {movie_id} not found")
         return {'error': 'Movie not found'}
@@ -33,86 +31,41 @@ def compute_movie_duration(self, movie_id: int):
         logger.warning(f"Movie {movie_id} has no video file")
         return {'error': 'No video file'}
     
-    # Проверяем, нужно ли обновлять длительность
-    if movie.duration and not movie.meta_dirty:
-        logger.info(f"Movie {movie_id} already has duration, skipping")
-        return {'skipped': True, 'duration': movie.duration}
-    
-    # Получаем URL для обработки
-    video_url = get_video_url_for_processing(movie.video)
-    
-    if not video_url:
-        logger.error(f"Unable to get video URL for movie {movie_id}")
-        return {'error': 'Unable to get video URL'}
-    
-    logger.info(f"Processing video for movie {movie_id}: {video_url[:100]}...")
+    logger.info(f"Processing video for movie {movie_id}: {movie.video.name}")
+    outcome = media_info.probe(movie, force=force)
+    info = media_info.apply(movie, outcome)
     
-    # Пытаемся извлечь полные метаданные
-    metadata = probe_video_metadata(video_url, timeout=120)
+    if outcome['status'] == 'skipped':
+        logger.info(f"Movie {movie_id} video unchanged (ETag {outcome['etag']}), skipping probe")
+        return {'skipped': True, 'movie_id': movie_id, 'duration': info.duration_sec}
     
-    if metadata and metadata.get('duration'):
-        # Успешно получили метаданные
-        movie.duration = metadata['duration_timedelta']
-        movie.last_meta_update = dateNow()
-        movie.meta_dirty = False
-        movie.save(update_fields=['duration', 'last_meta_update', 'meta_dirty'])
-        
+    if outcome['status'] in ('header', 'ffprobe'):
         logger.info(
-            f"Movie {movie_id} duration updated: {metadata['duration']}s "
-            f"({metadata.get('width')}x{metadata.get('height')}, "
-            f"{metadata.get('codec')}, {metadata.get('fps')} fps)"
+            f"Movie {movie_id} media info updated: {info.duration_sec}s "
+            f"({info.resolution}, {info.video_codec}/{info.audio_codec}, {info.fps} fps, via {outcome['status']})"
         )
-        
-        return {
-            'success': True,
-            'movie_id': movie_id,
-            'duration': metadata['duration'],
-            'metadata': metadata
-        }
-    
-    # Fallback 1: простое извлечение длительности
-    duration_sec = probe_duration_seconds(video_url, timeout=120)
-    
-    if duration_sec:
-        movie.duration = timedelta(seconds=duration_sec)
-        movie.last_meta_update = dateNow()
-        movie.meta_dirty = False
-        movie.save(update_fields=['duration', 'last_meta_update', 'meta_dirty'])
-        
-        logger.info(f"Movie {movie_id} duration updated (fallback): {duration_sec}s")
-        
         return {
             'success': True,
             'movie_id': movie_id,
-            'duration': duration_sec,
-            'method': 'fallback'
+            'duration': info.duration_sec,
+            'metadata': {name: getattr(info, name) for name in media_info.FIELDS},
         }
     
-    # Fallback 2: извлечение из имени файла
-    filename = movie.video.name
-    duration_from_filename = extract_duration_from_filename(filename)
-    
-    if duration_from_filename:
-        movie.duration = timedelta(seconds=duration_from_filename)
-        movie.last_meta_update = dateNow()
-        movie.meta_dirty = False
-        movie.save(update_fields=['duration', 'last_meta_update', 'meta_dirty'])
-        
+    if outcome['status'] == 'filename':
         logger.warning(
             f"Movie {movie_id} duration extracted from filename: "
-            f"{duration_from_filename}s (may be inaccurate)"
+            f"{info.duration_sec}s (may be inaccurate)"
         )
-        
         return {
             'success': True,
             'movie_id': movie_id,
-            'duration': duration_from_filename,
+            'duration': info.duration_sec,
             'method': 'filename',
             'warning': 'Duration extracted from filename, may be inaccurate'
         }
     
     # Если все методы не сработали - повторяем задачу
-    logger.error(f"Failed to extract duration for movie {movie_id}")
+    logger.error(f"Failed to extract duration for movie {movie_id}: {outcome.get('error')}")
     
     # Повторяем задачу (максимум 3 раза)
     try:
@@ -128,15 +81,15 @@ def compute_movie_duration(self, movie_id: int):
 @shared_task(name="movies.refresh_stale_movies")
 def refresh_stale_movies(ttl_minutes: int = 60, limit: int = 50):
     """
-    Находит фильмы без длительности или с устаревшими метаданными
-    и ставит их в очередь на обработку.
+    Находит фильмы без медиаданных или с устаревшими метаданными
+    и обрабатывает их пакетом.
     """
     qs = Movie.objects.filter(video__isnull=False)
     ids = []
     now = dateNow()
     
-    # Приоритет 1: фильмы без длительности
-    for movie in qs.filter(duration__isnull=True).only('id')[:limit]:
+    # Приоритет 1: фильмы без медиаданных
+    for movie in qs.filter(media_info__isnull=True).only('id')[:limit]:
         ids.append(movie.id)# type: ignore
     
     # Приоритет 2: фильмы с meta_dirty
@@ -146,7 +99,7 @@ def refresh_stale_movies(ttl_minutes: int = 60, limit: int = 50):
             if movie.id not in ids:# type: ignore
                 ids.append(movie.id)# type: ignore
     
-    # Приоритет 3: устаревшие метаданные
+    # Приоритет 3: устаревшие метаданные (неизменившиеся файлы задача пропустит по ETag)
     if len(ids) < limit:
         remaining = limit - len(ids)
         cutoff = now - timedelta(minutes=ttl_minutes)
@@ -154,37 +107,216 @@ def refresh_stale_movies(ttl_minutes: int = 60, limit: int = 50):
             if movie.id not in ids:# type: ignore
                 ids.append(movie.id)# type: ignore
     
-    # Запускаем задачи
-    for movie_id in ids:
-        compute_movie_duration.delay(movie_id)# type: ignore
+    # Пробуем пакетом в этом воркере (пул потоков), а не задачей на фильм
+    summary = media_info.probe_many(ids)
     
-    logger.info(f"Queued {len(ids)} movies for duration refresh")
+    logger.info(f"Refreshed media info for {len(ids)} movies: {summary}")
     
     return {
         'queued': len(ids),
+        'summary': summary,
         'checked_at': now.isoformat()
     }
 
 
 @shared_task
-def bulk_recompute_durations(movie_ids: list[int]):
+def bulk_recompute_durations(movie_ids: list[int] | None = None, force: bool = False):
     """
-    Массовый перерасчет длительности для списка фильмов.
+    Массовый перерасчет медиаданных для списка фильмов.
     Полезно для admin actions или management commands.
+    ffprobe запускаются параллельно (MEDIA_PROBE_CONCURRENCY) внутри одной задачи.
     """
     if movie_ids is None:
-        # Все фильмы без длительности
+        # Все фильмы без медиаданных
         movie_ids = list(
             Movie.objects.filter(
                 video__isnull=False,
-                duration__isnull=True
+                media_info__isnull=True
             ).values_list('id', flat=True)[:500]  # безопасный лимит
         )
     
-    for movie_id in movie_ids:
-        compute_movie_duration.delay(movie_id)# type: ignore
+    summary = media_info.probe_many(movie_ids, force=force)
     
     return {
         'queued': len(movie_ids),
-        'movie_ids': movie_ids
-    }
\ No newline at end of file
+        'movie_ids': movie_ids,
+        'summary': summary,
+    }
+
+
+@shared_task(name="movies.flush_progress")
+def flush_progress():
+    """Переносит накопленные heartbeat'ы прогресса из буфера в Watched."""
+    from .services import progress_buffer
+    return {'updated': progress_buffer.flush()}
+
+
+@shared_task(name="movies.flush_view_counters")
+def flush_view_counters():
+    """Сливает накопленные инкременты просмотров в Movie.views."""
+    from .services import view_counter
+    return {'movies': view_counter.flush()}
+
+
+@shared_task(name="movies.build_similarity")
+def build_similarity(top_k: int | None = None):
+    """Пересчитывает item-item соседей для «потому что вы смотрели»."""
+    from .services import similarity
+    return {'pairs': similarity.build_similarity(top_k)}
+
+
+@shared_task(name="movies.train_als")
+def train_als():
+    """Обучает implicit ALS для персональной ленты и публикует новую версию факторов."""
+    from .services import als
+    return als.train_and_publish()
+
+
+@shared_task(name="movies.refresh_daily_stats")
+def refresh_daily_stats():
+    """Доносит изменения Watched после водяного знака в MovieDailyStats."""
+    from .services import daily_stats
+    return daily_stats.refresh()
+
+
+@shared_task(name="movies.refresh_trending")
+def refresh_trending():
+    """Переносит часовые счётчики в кольца трендов и пересчитывает топ."""
+    from .services import trending
+    return trending.refresh()
+
+
+@shared_task(bind=True, name="movies.package_hls", max_retries=3, default_retry_delay=300)
+def package_hls(self, movie_id: int, force: bool = False):
+    """
+    Собирает HLS-лесенку битрейтов фильма (services/hls).
+    Повтор после сбоя продолжает с места: готовые ступени и залитые сегменты не трогаются.
+    """
+    from .services import hls
+
+    try:
+        movie = Movie.objects.get(pk=movie_id)
+    except Movie.DoesNotExist:
+        logger.error(f"Movie {movie_id} not found")
+        return {'error': 'Movie not found'}
+
+    try:
+        return {'movie_id': movie_id, **hls.package(movie, force=force)}
+    except hls.HlsError as e:
+        logger.error(f"HLS packaging failed for movie {movie_id}: {e}")
+        if str(e) in ("No video file", "ffmpeg not found"):
+            return {'error': str(e), 'movie_id': movie_id}
+        raise self.retry(exc=e, countdown=300 * (self.request.retries + 1))
+
+
+@shared_task(bind=True, name="movies.build_trickplay", max_retries=2, default_retry_delay=300)
+def build_trickplay(self, movie_id: int, force: bool = False):
+    """Листы превью для перемотки + WebVTT-индекс (services/trickplay)."""
+    from .services import trickplay
+
+    try:
+        movie = Movie.objects.get(pk=movie_id)
+    except Movie.DoesNotExist:
+        logger.error(f"Movie {movie_id} not found")
+        return {'error': 'Movie not found'}
+
+    try:
+        return {'movie_id': movie_id, **trickplay.build(movie, force=force)}
+    except trickplay.TrickplayError as e:
+        logger.error(f"Trickplay failed for movie {movie_id}: {e}")
+        if str(e) in ("No video file", "ffmpeg not found"):
+            return {'error': str(e), 'movie_id': movie_id}
+        raise self.retry(exc=e)
+
+
+@shared_task(name="movies.resume_hls")
+def resume_hls(limit: int = 20):
+    """
+    Ставит в очередь пакеты, прерванные падением воркера (застряли в pending/processing).
+    failed не трогаем — их перезапускают вручную (админка), чтобы битый исходник не кодировался по кругу.
+    """
+    from .models import MovieHlsPackage
+
+    stale = dateNow() - timedelta(minutes=settings.HLS_STALE_MINUTES)
+    movie_ids = list(
+        MovieHlsPackage.objects.filter(status__in=['pending', 'processing'], updated_at__lt=stale)
+        .values_list('movie_id', flat=True)[:limit]
+    )
+    for movie_id in movie_ids:
+        package_hls.delay(movie_id)  # type: ignore
+    return {'queued': movie_ids}
+
+
+@shared_task(bind=True, name="movies.ensure_faststart", max_retries=2, default_retry_delay=300)
+def ensure_faststart(self, movie_id: int, force: bool = False):
+    """Переносит moov в начало файла (services/faststart), если он после mdat."""
+    from .services import faststart
+
+    try:
+        movie = Movie.objects.get(pk=movie_id)
+    except Movie.DoesNotExist:
+        logger.error(f"Movie {movie_id} not found")
+        return {'error': 'Movie not found'}
+
+    try:
+        return {'movie_id': movie_id, **faststart.ensure(movie, force=force)}
+    except faststart.FaststartError as e:
+        logger.error(f"Faststart remux failed for movie {movie_id}: {e}")
+        try:
+            raise self.retry(exc=e)
+        except faststart.FaststartError:
+            # Цепочка ingest продолжается: исходный файл играет, просто медленнее стартует
+            return {'error': str(e), 'movie_id': movie_id}
+
+
+@shared_task(name="movies.resume_faststart")
+def resume_faststart(limit: int = 20):
+    """
+    Фильмы, чей файл ещё не проверен на faststart (замена видео, фильмы до появления проверки),
+    проходят ingest заново. Повторно в очередь фильм попадает не раньше чем через FASTSTART_TIMEOUT.
+    """
+    from django.core.cache import cache
+
+    if not settings.FASTSTART_ENABLED:
+        return {'queued': []}
+    candidates = (
+        Movie.objects.filter(faststart_status='').exclude(video='').exclude(video__isnull=True)
+        .order_by('pk').values_list('pk', flat=True)[:limit]
+    )
+    movie_ids = [
+        movie_id for movie_id in candidates
+        if cache.add(f"faststart:queued:{movie_id}", 1, timeout=settings.FASTSTART_TIMEOUT)
+    ]
+    for movie_id in movie_ids:
+        ingest_movie(movie_id, countdown=0)
+    return {'queued': movie_ids}
+
+
+@shared_task(name="movies.delete_stale_video")
+def delete_stale_video(name: str):
+    """Удаляет исходный blob после замены (ремукс), если на него больше не ссылается ни один фильм."""
+    from django.core.files.storage import default_storage
+
+    if Movie.objects.filter(video=name).exists():
+        return {'kept': name}
+    default_storage.delete(name)
+    return {'deleted': name}
+
+
+def ingest_movie(movie_id: int, *, countdown: int = 5):
+    """
+    Цепочка обработки загруженного видео: faststart -> медиаданные ->
+    (превью перемотки и HLS-лесенка параллельно — обоим нужны длительность и размер кадра).
+    """
+    steps = [compute_movie_duration.si(movie_id)]  # type: ignore
+    if settings.FASTSTART_ENABLED:
+        # До медиаданных: после ремукса меняются файл, ETag и смещения в seek_index
+        steps.insert(0, ensure_faststart.si(movie_id))  # type: ignore
+    outputs = []
+    if settings.TRICKPLAY_ENABLED:
+        outputs.append(build_trickplay.si(movie_id))  # type: ignore
+    if settings.HLS_ENABLED:
+        outputs.append(package_hls.si(movie_id))  # type: ignore
+    if outputs:
+        steps.append(group(*outputs) if len(outputs) > 1 else outputs[0])
+    return chain(*steps).apply_async(countdown=countdown)
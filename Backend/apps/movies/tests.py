@@ -1,3 +1,1445 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.accounts.models import Favorite, Watched
+from apps.subscribe.services.signed_urls import generate_signed_url_for_movie
+from .analytics import MovieAnalytics
+from .models import (
+    Movie, Genre, Author, Actor, MovieCharacter, Casting, MovieSimilarity, MovieDailyStats, MovieMediaInfo,
+    MovieHlsPackage, MovieTrickplay,
+)
+from .tasks import compute_movie_duration
+from .utils import mp4_header, probe_engine, seek_index
+from .services import (
+    als, catalog_cache, daily_stats, faststart, hll, hls, media_info, minhash_index, progress_buffer, search_index, similarity, suggest_index,
+    trending, trickplay, view_counter,
+)
+
+User = get_user_model()
+
+MOVIES_URL = "/api/v1/movies/movies/"
+WATCHED_URL = "/api/v1/movies/me/watched/"
+
+
+class CatalogCacheTest(TestCase):
+    """Кэш списка фильмов с версионированием каталога"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.genre = Genre.objects.create(name="Drama")
+        self.movie = Movie.objects.create(title="First", description="d", year=2020)
+        self.movie.genres.add(self.genre)
+
+    def test_second_anonymous_request_is_served_from_cache(self):
+        r1 = self.client.get(MOVIES_URL)
+        r2 = self.client.get(MOVIES_URL)
+
+        self.assertEqual(r1["X-Cache"], "MISS")
+        self.assertEqual(r2["X-Cache"], "HIT")
+        self.assertEqual(r1.json(), r2.json())
+        self.assertEqual(catalog_cache.get_stats()["hits"], 1)
+
+    def test_query_string_is_normalized(self):
+        self.client.get(MOVIES_URL, {"year": 2020, "ordering": "title"})
+        r = self.client.get(MOVIES_URL + "?ordering=title&year=2020")
+        self.assertEqual(r["X-Cache"], "HIT")
+
+    def test_catalog_change_invalidates_cache(self):
+        self.client.get(MOVIES_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Movie.objects.create(title="Second", description="d", year=2021)
+
+        r = self.client.get(MOVIES_URL)
+        self.assertEqual(r["X-Cache"], "MISS")
+        self.assertIn("Second", str(r.json()))
+
+    def test_genre_m2m_change_invalidates_cache(self):
+        self.client.get(MOVIES_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.genres.remove(self.genre)
+
+        self.assertEqual(self.client.get(MOVIES_URL)["X-Cache"], "MISS")
+
+    def test_bookkeeping_save_keeps_cache_and_media_info_invalidates(self):
+        self.client.get(MOVIES_URL)
+        version = catalog_cache.get_catalog_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movie.meta_dirty = True
+            self.movie.save(update_fields=['last_meta_update', 'meta_dirty'])
+        self.assertEqual(catalog_cache.get_catalog_version(), version)
+        self.assertEqual(self.client.get(MOVIES_URL)["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieMediaInfo.objects.create(movie=self.movie, duration_sec=60)
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 1)
+        self.assertEqual(self.client.get(MOVIES_URL)["X-Cache"], "MISS")
+
+        # Повторный probe с теми же значениями — кэш списка остаётся
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieMediaInfo.objects.update_or_create(
+                movie=self.movie, defaults={'duration_sec': 60, 'seek_index': b'\x00'},
+            )
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MovieMediaInfo.objects.update_or_create(movie=self.movie, defaults={'duration_sec': 61})
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 2)
+
+
+class MovieLikesQueryCountTest(TestCase):
+    """Лайки считаются в основном запросе, а не по запросу на фильм"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="u", email="u@u.u", password="p")
+        self.other = User.objects.create_user(username="o", email="o@o.o", password="p")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.genre = Genre.objects.create(name="Drama")
+        self.actor = Actor.objects.create(name="Actor")
+        self.character = MovieCharacter.objects.create(name="Hero")
+
+    def _add_movies(self, count):
+        for _ in range(count):
+            n = Movie.objects.count()
+            movie = Movie.objects.create(title=f"Movie {n}", description="d", year=2000 + n)
+            movie.genres.add(self.genre)
+            Casting.objects.create(movie=movie, actor=self.actor, character=self.character)
+            Favorite.objects.create(user=self.other, movie=movie)
+            Watched.objects.create(user=self.user, movie=movie)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        self._add_movies(2)
+        small, _ = self._count_queries(MOVIES_URL)
+
+        self._add_movies(8)
+        large, _ = self._count_queries(MOVIES_URL)
+
+        self.assertEqual(small, large)
+
+    def test_watched_query_count_does_not_depend_on_page_size(self):
+        self._add_movies(2)
+        small, _ = self._count_queries(WATCHED_URL)
+
+        self._add_movies(8)
+        large, _ = self._count_queries(WATCHED_URL)
+
+        self.assertEqual(small, large)
+
+    def test_annotated_likes(self):
+        self._add_movies(1)
+        movie = Movie.objects.get()
+        Favorite.objects.create(user=self.user, movie=movie)
+
+        _, response = self._count_queries(MOVIES_URL)
+        self.assertEqual(response.json()["results"][0]["likes"], {"count": 2, "is_liked": True})
+
+
+class DenormalizedCountersTest(TestCase):
+    """movies_count / appearances_count поддерживаются сигналами"""
+
+    def setUp(self):
+        self.drama = Genre.objects.create(name="Drama")
+        self.comedy = Genre.objects.create(name="Comedy")
+        self.author = Author.objects.create(name="Author", slug="author")
+        self.other_author = Author.objects.create(name="Other", slug="other")
+        self.actor = Actor.objects.create(name="Actor")
+        self.hero = MovieCharacter.objects.create(name="Hero")
+        self.villain = MovieCharacter.objects.create(name="Villain")
+        self.movie = Movie.objects.create(title="M", description="d", year=2000, author=self.author)
+
+    def _refresh(self, *objs):
+        for obj in objs:
+            obj.refresh_from_db()
+
+    def test_genre_m2m_changes(self):
+        self.movie.genres.add(self.drama, self.comedy)
+        self._refresh(self.drama, self.comedy)
+        self.assertEqual((self.drama.movies_count, self.comedy.movies_count), (1, 1))
+
+        self.movie.genres.remove(self.drama)
+        self.comedy.movies.clear()
+        self._refresh(self.drama, self.comedy)
+        self.assertEqual((self.drama.movies_count, self.comedy.movies_count), (0, 0))
+
+    def test_author_change_and_movie_delete(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.movies_count, 1)
+
+        self.movie.author = self.other_author
+        self.movie.save()
+        self._refresh(self.author, self.other_author)
+        self.assertEqual((self.author.movies_count, self.other_author.movies_count), (0, 1))
+
+        self.movie.genres.add(self.drama)
+        self.movie.delete()
+        self._refresh(self.other_author, self.drama)
+        self.assertEqual((self.other_author.movies_count, self.drama.movies_count), (0, 0))
+
+    def test_casting_create_and_delete(self):
+        Casting.objects.create(movie=self.movie, actor=self.actor, character=self.hero)
+        casting = Casting.objects.create(movie=self.movie, actor=self.actor, character=self.villain)
+        self._refresh(self.actor, self.hero, self.villain)
+        # Две роли в одном фильме — это один фильм актёра
+        self.assertEqual(self.actor.movies_count, 1)
+        self.assertEqual((self.hero.appearances_count, self.villain.appearances_count), (1, 1))
+
+        casting.delete()
+        self.villain.refresh_from_db()
+        self.assertEqual(self.villain.appearances_count, 0)
+
+    def test_detail_uses_stored_counts(self):
+        self.movie.genres.add(self.drama)
+        with self.assertNumQueries(3):  # фильм+автор, жанры, каст
+            response = APIClient().get(f"{MOVIES_URL}{self.movie.slug}/")
+        self.assertEqual(response.json()["genres_info"][0]["movies_count"], 1)
+        self.assertEqual(response.json()["author_info"]["movies_count"], 1)
+
+
+class CursorPaginationTest(TestCase):
+    """Курсорная пагинация: страницы стабильны при равных значениях сортировки"""
+
+    def setUp(self):
+        cache.clear()
+        for i in range(7):
+            Movie.objects.create(title=f"Movie {i}", description="d", year=2000 + i % 2)
+
+    def test_pages_cover_catalog_without_duplicates(self):
+        client = APIClient()
+        url, seen = f"{MOVIES_URL}?page_size=3&ordering=-year", []
+        while url:
+            data = client.get(url).json()
+            seen.extend(m["id"] for m in data["results"])
+            url = data["next"]
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(sorted(seen), sorted(Movie.objects.values_list("id", flat=True)))
+
+    def _walk(self, url, link="next"):
+        client, seen, queries = APIClient(), [], []
+        while url:
+            with CaptureQueriesContext(connection) as captured:
+                data = client.get(url).json()
+            queries.extend(q["sql"] for q in captured.captured_queries)
+            seen.extend(m["id"] for m in data["results"])
+            url = data[link]
+        return seen, queries
+
+    def test_keyset_cursor_on_field_and_id(self):
+        expected = list(Movie.objects.order_by("-year", "-id").values_list("id", flat=True))
+        seen, queries = self._walk(f"{MOVIES_URL}?page_size=2&ordering=-year&fields=id")
+        self.assertEqual(seen, expected)
+        self.assertFalse([sql for sql in queries if "OFFSET" in sql])
+
+        # Назад по previous — те же страницы в обратном порядке
+        last = APIClient().get(f"{MOVIES_URL}?page_size=2&ordering=-year&fields=id").json()
+        while last["next"]:
+            last = APIClient().get(last["next"]).json()
+        back, _ = self._walk(last["previous"], link="previous")
+        self.assertEqual(sorted(back), sorted(expected[:-len(last["results"])]))
+
+    def test_popular_ordering_uses_keyset_on_stored_views(self):
+        for i, movie in enumerate(Movie.objects.order_by("id")):
+            Movie.objects.filter(pk=movie.pk).update(views=i % 3)
+        expected = list(Movie.objects.order_by("-views", "-id").values_list("id", flat=True))
+        seen, queries = self._walk(f"{MOVIES_URL}?page_size=2&ordering=-views&fields=id")
+        self.assertEqual(seen, expected)
+        self.assertFalse([sql for sql in queries if "OFFSET" in sql or "COUNT(" in sql])
+
+    def test_multi_field_ordering_falls_back_to_offset(self):
+        response = APIClient().get(MOVIES_URL, {"ordering": "-views,title", "page_size": 3, "fields": "id"}).json()
+        self.assertEqual(response["count"], 7)
+        self.assertIn("offset=3", response["next"])
+        seen, _ = self._walk(response["next"])
+        self.assertEqual(len(set(seen) | {m["id"] for m in response["results"]}), 7)
+
+
+class SparseFieldsetsTest(TestCase):
+    """?fields= / ?expand= для списка и карточки фильма"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        movie = Movie.objects.create(title="M", description="d", year=2000)
+        movie.genres.add(Genre.objects.create(name="Drama"))
+        Casting.objects.create(
+            movie=movie,
+            actor=Actor.objects.create(name="Actor"),
+            character=MovieCharacter.objects.create(name="Hero"),
+        )
+
+    def test_list_keeps_default_fields_unless_narrowed(self):
+        item = self.client.get(MOVIES_URL).json()["results"][0]
+        self.assertEqual(item["cast"][0]["actor"]["name"], "Actor")
+        self.assertIn("media_info", item)
+
+        item = self.client.get(MOVIES_URL, {"fields": "id,likes"}).json()["results"][0]
+        self.assertEqual(set(item), {"id", "likes"})
+
+    def test_fields_prunes_representation_and_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(MOVIES_URL, {"fields": "id,title,slug,year"})
+        self.assertEqual(set(response.json()["results"][0]), {"id", "title", "slug", "year"})
+
+    def test_detail_fields(self):
+        response = self.client.get(f"{MOVIES_URL}m/", {"fields": "title,genres_info"})
+        self.assertEqual(set(response.json()), {"title", "genres_info"})
+
+    def test_detail_likes_come_from_annotation(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f"{MOVIES_URL}m/", {"fields": "id,likes"})
+        self.assertEqual(response.json()["likes"], {"count": 0, "is_liked": False})
+
+
+class SearchIndexTest(TestCase):
+    """Поиск BM25 по индексу в памяти, точечные обновления из сигналов"""
+
+    def setUp(self):
+        cache.clear()
+        search_index._index = None
+        self.client = APIClient()
+        self.author = Author.objects.create(name="Тимур Бекмамбетов", slug="bekmambetov")
+        self.movie = Movie.objects.create(
+            title="Ёлки", description="Новогодняя комедия", year=2010, author=self.author
+        )
+        Movie.objects.create(title="Amélie", description="A whimsical story about Paris", year=2001)
+
+    def _search(self, q, **params):
+        response = self.client.get("/api/v1/movies/search/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_accent_folding_and_ranking(self):
+        self.assertEqual(self._search("елки")[0]["slug"], self.movie.slug)
+        self.assertEqual(self._search("AMELIE")[0]["title"], "Amélie")
+
+    def test_people_are_indexed(self):
+        results = self._search("бекмамбетов")
+        self.assertEqual({r["type"] for r in results}, {"author", "movie"})
+        self.assertEqual(self._search("бекмамбетов", type="author")[0]["slug"], "bekmambetov")
+
+    def test_incremental_update_from_signals(self):
+        self._search("елки")  # собрать индекс
+        index = search_index.get_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            actor = Actor.objects.create(name="Иван Ургант")
+            Casting.objects.create(
+                movie=self.movie, actor=actor, character=MovieCharacter.objects.create(name="Борис")
+            )
+
+        self.assertEqual(self._search("ургант", type="movie")[0]["slug"], self.movie.slug)
+        self.assertIs(search_index.get_index(), index)  # без полной пересборки
+        # Другие воркеры подхватят изменения из снимка
+        snapshot = cache.get(search_index.SNAPSHOT_KEY)
+        self.assertEqual(snapshot["version"], index.version)
+        self.assertEqual(search_index.SearchIndex.from_snapshot(snapshot).search("ургант")[0]["slug"], self.movie.slug)
+
+    @mock.patch("apps.movies.services.index_rebuild.schedule")
+    def test_stale_index_is_served_while_rebuilding(self, schedule):
+        index = search_index.get_index()
+        cache.delete(search_index.SNAPSHOT_KEY)
+        catalog_cache.bump_catalog_version()  # изменение из другого процесса
+
+        self.assertIs(search_index.get_index(), index)
+        schedule.assert_called_once_with('search', search_index.rebuild_index)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get("/api/v1/movies/search/").status_code, 400)
+
+
+class SuggestIndexTest(TestCase):
+    """Подсказки: префикс по словам, опечатки, сортировка по просмотрам"""
+
+    def setUp(self):
+        cache.clear()
+        suggest_index._index = None
+        self.client = APIClient()
+        self.popular = Movie.objects.create(title="Тёмный рыцарь", slug="dark-knight", description="", year=2008, views=500)
+        self.rare = Movie.objects.create(title="Тёмная башня", slug="dark-tower", description="", year=2017, views=5)
+
+    def _suggest(self, q):
+        response = self.client.get("/api/v1/movies/suggest/", {"q": q})
+        self.assertEqual(response.status_code, 200)
+        return [r["label"] for r in response.json()["results"]]
+
+    def test_prefix_ranked_by_views(self):
+        self.assertEqual(self._suggest("тем"), ["Тёмный рыцарь", "Тёмная башня"])
+        self.assertEqual(self._suggest("рыц"), ["Тёмный рыцарь"])  # начало любого слова
+
+    def test_typo_tolerance(self):
+        self.assertEqual(self._suggest("рвцарь"), ["Тёмный рыцарь"])
+        self.assertEqual(self._suggest("баншя"), ["Тёмная башня"])  # перестановка
+
+    def test_incremental_update_from_signals(self):
+        self._suggest("тем")
+        index = suggest_index.get_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Actor.objects.create(name="Кристиан Бейл")
+            self.rare.delete()
+
+        self.assertEqual(self._suggest("бейл"), ["Кристиан Бейл"])
+        self.assertEqual(self._suggest("башн"), [])
+        self.assertIs(suggest_index.get_index(), index)
+
+    def test_empty_query(self):
+        self.assertEqual(self._suggest(""), [])
+
+    def test_short_prefix_ranked_by_weight_not_alphabet(self):
+        index = suggest_index.SuggestIndex()
+        index.bulk_load(
+            [{'type': 'movie', 'id': i, 'slug': '', 'label': f"ab{i:05d}", 'weight': 1} for i in range(3000)]
+            + [{'type': 'movie', 'id': 9999, 'slug': '', 'label': "abzz", 'weight': 100}]
+        )
+        self.assertEqual(index.suggest("ab", limit=1)[0]['label'], "abzz")
+
+        index.add({'type': 'movie', 'id': 5, 'slug': '', 'label': "ab00005", 'weight': 1000})
+        self.assertEqual([e['label'] for e in index.suggest("ab", limit=2)], ["ab00005", "abzz"])
+        index.remove(('movie', 5))
+        self.assertEqual(index.suggest("ab", limit=1)[0]['label'], "abzz")
+        self.assertEqual([e['label'] for e in index.suggest("ab0000", limit=9)], [f"ab0000{i}" for i in range(10) if i != 5])
+
+    @mock.patch("apps.movies.services.index_rebuild.schedule")
+    def test_stale_index_is_served_while_rebuilding(self, schedule):
+        index = suggest_index.get_index()
+        catalog_cache.bump_catalog_version()  # изменение из другого процесса
+
+        self.assertIs(suggest_index.get_index(), index)
+        schedule.assert_called_once_with('suggest', suggest_index._rebuild)
+
+        suggest_index._rebuild()
+        self.assertIsNot(suggest_index.get_index(), index)
+        self.assertEqual(suggest_index.get_index().version, catalog_cache.get_catalog_version())
+
+
+@override_settings(PROGRESS_WRITE_BEHIND=True)
+@mock.patch("apps.movies.views.can_user_watch_cached", return_value=(True, None, {}))
+class ProgressWriteBehindTest(TestCase):
+    """Heartbeat'ы копятся в буфере, finished и просмотр — ровно один раз"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="viewer@example.com", username="viewer", password="pass12345"
+        )
+        self.movie = Movie.objects.create(title="Buffered", description="", year=2020)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _beat(self, position, duration=1000):
+        return self.client.post(
+            f"/api/v1/movies/movies/{self.movie.slug}/progress/",
+            {"position_sec": position, "duration_sec": duration},
+            format="json",
+        )
+
+    def test_heartbeats_are_buffered_and_flushed(self, _access):
+        self._beat(300)
+        self._beat(120)  # перемотка назад — максимум сохраняется
+        self.assertFalse(Watched.objects.exists())
+
+        detail = self.client.get(f"/api/v1/movies/movies/{self.movie.slug}/", {"expand": "user_progress"})
+        self.assertEqual(detail.json()["user_progress"]["position_sec"], 300)
+
+        self.assertEqual(progress_buffer.flush(), 1)
+        watched = Watched.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual((watched.last_position_sec, watched.progress_percent), (300, 30))
+        self.assertFalse(watched.finished)
+
+        self._beat(500)
+        self.assertEqual(progress_buffer.flush(), 1)
+        watched.refresh_from_db()
+        self.assertEqual(watched.last_position_sec, 500)
+
+    def test_finish_counts_view_once(self, _access):
+        self._beat(600)
+        self.assertTrue(self._beat(950).json()["finished"])
+        self._beat(990)
+        self.assertTrue(self._beat(400).json()["finished"])
+        progress_buffer.flush()
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.views_count, 1)
+        watched = Watched.objects.get(user=self.user, movie=self.movie)
+        self.assertTrue(watched.finished)
+        self.assertEqual(watched.last_position_sec, 990)
+
+    def test_flush_locks_only_buffered_pairs(self, _access):
+        other_user = get_user_model().objects.create_user(email="o@example.com", username="o", password="x")
+        other_movie = Movie.objects.create(title="Other", description="", year=2020)
+        progress_buffer.record(self.user.pk, self.movie.pk, last_position_sec=10, duration_sec=100, progress_percent=10)
+        progress_buffer.record(other_user.pk, other_movie.pk, last_position_sec=20, duration_sec=100, progress_percent=20)
+        # Строки из произведения users × movies в flush не попадают
+        Watched.objects.create(user=self.user, movie=other_movie, last_position_sec=5)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(progress_buffer.flush(), 2)
+        selects = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('SELECT') and '"user_watched"' in q['sql']]
+        self.assertTrue(selects)
+        self.assertFalse([sql for sql in selects if '"user_watched"."movie_id" IN' in sql])
+        self.assertEqual(Watched.objects.get(user=self.user, movie=other_movie).last_position_sec, 5)
+
+
+class ViewCounterTest(TestCase):
+    """Просмотры копятся в полосах счётчика и сливаются одним UPDATE"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.hit = Movie.objects.create(title="Hit", description="", year=2020, views=10)
+        self.other = Movie.objects.create(title="Other", description="", year=2020, views=11)
+
+    def test_increments_are_visible_before_flush(self):
+        for _ in range(5):
+            self.hit.increment_views()
+
+        self.hit.refresh_from_db()
+        self.assertEqual((self.hit.views, self.hit.views_count), (10, 15))
+
+        # Счётчик в ответе живой, а порядок — по сброшенному столбцу views
+        response = self.client.get("/api/v1/movies/movies/", {"ordering": "-views", "fields": "slug,views"})
+        self.assertEqual(
+            [(m["slug"], m["views"]) for m in response.json()["results"]],
+            [("other", 11), ("hit", 15)],
+        )
+
+        view_counter.flush()
+        cache.clear()
+        response = self.client.get("/api/v1/movies/movies/", {"ordering": "-views", "fields": "slug,views"})
+        self.assertEqual(
+            [(m["slug"], m["views"]) for m in response.json()["results"]],
+            [("hit", 15), ("other", 11)],
+        )
+
+    def test_flush_moves_deltas_into_views(self):
+        for _ in range(3):
+            self.hit.increment_views()
+        self.other.increment_views()
+
+        with self.assertNumQueries(5):  # savepoint, select_for_update, UPDATE ... CASE, DELETE, release
+            self.assertEqual(view_counter.flush(), 2)
+
+        self.assertEqual(
+            dict(Movie.objects.values_list("slug", "views")), {"hit": 13, "other": 12}
+        )
+        self.assertEqual(view_counter.pending([self.hit.pk, self.other.pk]), {})
+
+
+@mock.patch("apps.movies.views.can_user_watch_cached", return_value=(True, None, {}))
+class ContinueWatchingTest(TestCase):
+    """me/continue/: недосмотренное, свежее сверху, один запрос, кэш на пользователя"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            email="resume@example.com", username="resume", password="pass12345"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.older = Movie.objects.create(title="Older", description="", year=2001)
+        self.newer = Movie.objects.create(title="Newer", description="", year=2002)
+        done = Movie.objects.create(title="Done", description="", year=2003)
+        Watched.objects.create(user=self.user, movie=self.older, last_position_sec=100, finished=False)
+        Watched.objects.create(user=self.user, movie=self.newer, last_position_sec=200, finished=False)
+        Watched.objects.create(user=self.user, movie=done, finished=True)
+
+    def _continue(self):
+        response = self.client.get("/api/v1/movies/me/continue/")
+        self.assertEqual(response.status_code, 200)
+        return [(item["movie"]["slug"], item["position_sec"]) for item in response.json()["results"]]
+
+    def test_unfinished_by_recency_in_one_query(self, _access):
+        with self.assertNumQueries(1):
+            self.assertEqual(self._continue(), [("newer", 200), ("older", 100)])
+        with self.assertNumQueries(0):
+            self._continue()
+
+    def test_progress_invalidates_cache(self, _access):
+        self._continue()
+        self.client.post(
+            f"/api/v1/movies/movies/{self.older.slug}/progress/",
+            {"position_sec": 150, "duration_sec": 1000},
+            format="json",
+        )
+        self.assertEqual(self._continue(), [("older", 150), ("newer", 200)])
+
+
+class SimilarityTest(TestCase):
+    """Item-item соседи по просмотрам и лайкам"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f"u{i}@example.com", username=f"u{i}", password="pass12345")
+            for i in range(4)
+        ]
+        self.a, self.b, self.c, self.d = (
+            Movie.objects.create(title=title, description="", year=2000) for title in "ABCD"
+        )
+        # A и B смотрят вместе, C — с A у одного пользователя, D — отдельно
+        for user in self.users[:3]:
+            Watched.objects.create(user=user, movie=self.a, progress_percent=100, finished=True)
+            Watched.objects.create(user=user, movie=self.b, progress_percent=90, finished=True)
+        Favorite.objects.create(user=self.users[0], movie=self.c)
+        Watched.objects.create(user=self.users[3], movie=self.d, progress_percent=50, finished=False)
+
+        self.client = APIClient()
+
+    def test_neighbours_ranked_by_cosine(self):
+        similarity.build_similarity(top_k=5)
+
+        response = self.client.get(f"/api/v1/movies/movies/{self.a.slug}/because-you-watched/", {"fields": "slug"})
+        self.assertEqual([m["slug"] for m in response.json()["results"]], ["b", "c"])
+        self.assertFalse(MovieSimilarity.objects.filter(movie=self.d).exists())
+
+    def test_user_recommendations_exclude_watched(self):
+        similarity.build_similarity(top_k=5)
+        newcomer = get_user_model().objects.create_user(
+            email="new@example.com", username="new", password="pass12345"
+        )
+        Watched.objects.create(user=newcomer, movie=self.b, progress_percent=100, finished=True)
+
+        self.client.force_authenticate(newcomer)
+        response = self.client.get("/api/v1/movies/me/recommendations/", {"fields": "slug"})
+        self.assertEqual([m["slug"] for m in response.json()["results"]], ["a", "c"])
+
+
+
+class AlsRecommendationsTest(TestCase):
+    """Implicit ALS: факторы в .npy через mmap, fold-in, без досмотренного"""
+
+    def setUp(self):
+        cache.clear()
+        als._model = None
+        self.addCleanup(setattr, als, '_model', None)
+        model_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(model_dir.cleanup)
+        self.settings_override = override_settings(ALS_MODEL_DIR=model_dir.name, ALS_FACTORS=4, ALS_ITERATIONS=5)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f"als{i}@example.com", username=f"als{i}", password="pass12345")
+            for i in range(6)
+        ]
+        self.movies = [Movie.objects.create(title=f"M{i}", description="", year=2000) for i in range(6)]
+        # Две «компании»: пользователи 0–2 смотрят фильмы 0–2, пользователи 3–5 — фильмы 3–5
+        for u, user in enumerate(self.users):
+            group = range(0, 3) if u < 3 else range(3, 6)
+            for m in group:
+                if m != u:  # каждому не хватает одного фильма своей группы
+                    Watched.objects.create(user=user, movie=self.movies[m], progress_percent=100, finished=True)
+
+    def test_trained_user_gets_own_cluster_first(self):
+        self.assertIn('version', als.train_and_publish())
+        model = als.get_model()
+        self.assertIsInstance(model.item_factors, np.memmap)
+
+        ids = als.recommend_ids(self.users[0], limit=3)
+        self.assertEqual(ids[0], self.movies[0].pk)
+        self.assertNotIn(self.movies[1].pk, ids)  # досмотренные исключены
+
+    def test_fold_in_for_new_user(self):
+        als.train_and_publish()
+        newcomer = get_user_model().objects.create_user(
+            email="fresh@example.com", username="fresh", password="pass12345"
+        )
+        Favorite.objects.create(user=newcomer, movie=self.movies[4])
+
+        self.assertIn(als.recommend_ids(newcomer, limit=2)[0], {self.movies[3].pk, self.movies[4].pk, self.movies[5].pk})
+
+
+
+class MinHashSimilarTest(TestCase):
+    """movies/<slug>/similar/: соседи по составу, точечные обновления из сигналов"""
+
+    def setUp(self):
+        cache.clear()
+        minhash_index._index = None
+        self.client = APIClient()
+        self.drama = Genre.objects.create(name="Drama", slug="drama")
+        self.author = Author.objects.create(name="Nolan", slug="nolan")
+        self.actor = Actor.objects.create(name="Bale", slug="bale")
+        self.hero = MovieCharacter.objects.create(name="Batman", slug="batman")
+
+        self.first = Movie.objects.create(title="First", description="", year=2005, author=self.author)
+        self.second = Movie.objects.create(title="Second", description="", year=2008, author=self.author)
+        self.other = Movie.objects.create(title="Other", description="", year=2010)
+        for movie in (self.first, self.second):
+            movie.genres.add(self.drama)
+            Casting.objects.create(movie=movie, actor=self.actor, character=self.hero)
+        self.other.genres.add(self.drama)
+
+    def _similar(self, movie):
+        response = self.client.get(f"/api/v1/movies/movies/{movie.slug}/similar/", {"fields": "slug"})
+        self.assertEqual(response.status_code, 200)
+        return [(m["slug"], m["similarity"]) for m in response.json()["results"]]
+
+    def test_ranked_by_jaccard(self):
+        self.assertEqual(self._similar(self.first)[0], ("second", 1.0))
+
+    def test_incremental_update_from_casting(self):
+        self._similar(self.first)
+        index = minhash_index.get_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Casting.objects.create(movie=self.other, actor=self.actor, character=self.hero)
+            self.other.genres.remove(self.drama)
+
+        self.assertIs(minhash_index.get_index(), index)
+        self.assertEqual(index.features[self.other.pk], frozenset({f"a:{self.actor.pk}", f"c:{self.hero.pk}"}))
+        self.assertIn("other", [slug for slug, _ in self._similar(self.first)])
+
+    @mock.patch("apps.movies.services.index_rebuild.schedule")
+    def test_stale_index_is_served_while_rebuilding(self, schedule):
+        index = minhash_index.get_index()
+        catalog_cache.bump_catalog_version()  # изменение из другого процесса
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._similar(self.first)[0], ("second", 1.0))
+        self.assertIs(minhash_index.get_index(), index)
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "casting"' in q['sql']])  # без build_index
+        schedule.assert_called_with('minhash', minhash_index._rebuild)
+
+        minhash_index._rebuild()
+        self.assertIsNot(minhash_index.get_index(), index)
+
+
+
+class DailyStatsTest(TestCase):
+    """MovieDailyStats: инкрементально от водяного знака, повторный запуск ничего не удваивает"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f"s{i}@example.com", username=f"s{i}", password="pass12345")
+            for i in range(3)
+        ]
+        self.movie = Movie.objects.create(title="Stats", description="", year=2020)
+        self.other = Movie.objects.create(title="Quiet", description="", year=2020)
+        now = timezone.now()
+        Watched.objects.create(user=self.users[0], movie=self.movie, progress_percent=100, finished=True, finished_at=now)
+        Watched.objects.create(user=self.users[1], movie=self.movie, progress_percent=40, finished=False)
+        Watched.objects.create(user=self.users[2], movie=self.other, progress_percent=10, finished=False)
+
+    def _stats(self, movie):
+        return MovieDailyStats.objects.get(movie=movie, date=timezone.localdate())
+
+    def test_rollup_is_incremental_and_idempotent(self):
+        daily_stats.refresh()
+        daily_stats.refresh()  # перекрытие окна: те же строки второй раз
+
+        stats = self._stats(self.movie)
+        self.assertEqual(
+            (stats.views_started, stats.views_finished, stats.unique_viewers, stats.avg_completion),
+            (2, 1, 2, 70.0),
+        )
+
+        watched = Watched.objects.get(user=self.users[1], movie=self.movie)
+        watched.progress_percent = 80
+        watched.save()
+        summary = daily_stats.refresh()
+
+        self.assertEqual(summary['new_viewers'], 0)
+        stats = self._stats(self.movie)
+        self.assertEqual((stats.views_started, stats.unique_viewers, stats.avg_completion), (2, 2, 90.0))
+
+    def test_unique_viewers_merge_daily_sketches(self):
+        daily_stats.refresh()
+        # Тот же зритель назавтра: +1 к дню, но не к уникальным за период
+        tomorrow = timezone.now() + timedelta(days=1)
+        Watched.objects.filter(user=self.users[0], movie=self.movie).update(watched_at=tomorrow)
+        daily_stats.refresh(now=tomorrow + timedelta(minutes=1))
+
+        self.assertEqual(
+            list(MovieDailyStats.objects.filter(movie=self.movie).order_by("date").values_list("unique_viewers", flat=True)),
+            [2, 1],
+        )
+        self.assertEqual(MovieAnalytics.get_unique_viewers(days=7, movie=self.movie), 2)
+        self.assertEqual(MovieAnalytics.get_unique_viewers(days=7), 3)
+
+        admin = get_user_model().objects.create_user(
+            email="admin@example.com", username="admin", password="pass12345", is_staff=True
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get(f"/api/v1/movies/analytics/unique-viewers/?movie={self.movie.slug}&days=7")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["unique_viewers"], 2)
+
+    def test_hll_estimate_is_within_error(self):
+        a, b = hll.empty(), hll.empty()
+        hll.add(a, range(0, 60_000))
+        hll.add(b, range(30_000, 90_000))
+        merged = hll.count(hll.merge(a, b))
+        self.assertLess(abs(merged - 90_000) / 90_000, 3 * hll.STANDARD_ERROR)
+        self.assertLess(len(hll.to_bytes(a)), hll.M)
+
+    def test_popular_reads_rollup_only(self):
+        daily_stats.refresh()
+        with CaptureQueriesContext(connection) as ctx:
+            popular = list(MovieAnalytics.get_popular_movies(days=7))
+        self.assertEqual([m.slug for m in popular], ["stats", "quiet"])
+        self.assertEqual(popular[0].completion_rate, 70.0)
+        self.assertNotIn("user_watched", ctx.captured_queries[0]["sql"])
+
+
+
+@mock.patch("apps.movies.views.can_user_watch_cached", return_value=(True, None, {}))
+@override_settings(TRENDING_WINDOW_HOURS=24, TRENDING_HALF_LIFE_HOURS=6.0, TRENDING_FINISH_WEIGHT=2.0)
+class TrendingTest(TestCase):
+    """Тренды: часовые кольца, затухание, топ одним чтением кэша"""
+
+    def setUp(self):
+        cache.clear()
+        self.hour = trending.current_hour()
+        self.fresh = Movie.objects.create(title="Fresh", slug="fresh", description="", year=2024)
+        self.old = Movie.objects.create(title="Old hit", slug="old-hit", description="", year=2010)
+
+    def _at(self, hours_ago):
+        return (self.hour - hours_ago) * 3600 + 60
+
+    def test_decay_and_window(self, _access):
+        for _ in range(4):
+            trending.record(self.old.pk, 'start', now=self._at(12))  # 4 · 0.25 = 1
+        trending.refresh(now=self._at(12))
+        trending.record(self.fresh.pk, 'start', now=self._at(0))
+        trending.record(self.fresh.pk, 'finish', now=self._at(0))  # 1 + 2 = 3
+        trending.refresh(now=self._at(0))
+
+        self.assertEqual(trending.top(), [(self.fresh.pk, 3.0), (self.old.pk, 1.0)])
+
+        # За окном кольцо обнуляется, а фильм выпадает из топа
+        trending.refresh(now=self._at(-12))
+        self.assertEqual(trending.top(), [(self.fresh.pk, 0.75)])
+        self.assertIsNone(cache.get(trending.RING_KEY.format(movie_id=self.old.pk)))
+
+    def test_progress_feeds_trending_endpoint(self, _access):
+        user = get_user_model().objects.create_user(email="tr@example.com", username="tr", password="pass12345")
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f"/api/v1/movies/movies/{self.old.slug}/progress/"
+        for position in (10, 20):  # один запуск за сессию
+            client.post(url, {"position_sec": position, "duration_sec": 1000}, format="json")
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.post(url, {"position_sec": 995, "duration_sec": 1000}, format="json")
+        trending.refresh()
+        self.assertEqual(trending.top(), [(self.old.pk, 1.0)])  # досмотр — только после commit'а
+
+        for callback in callbacks:
+            callback()
+        trending.refresh()
+
+        response = client.get("/api/v1/movies/movies/trending/?fields=slug")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [{"slug": "old-hit", "trending_score": 3.0}])
+
+
+
+class LocalMediaMixin:
+    """MEDIA_ROOT во временном каталоге и FileSystemStorage вместо Azure на время теста"""
+
+    def use_local_media(self, *work_dir_settings, **overrides) -> str:
+        """Настройки из work_dir_settings указывают на <tmp>/work. Возвращает MEDIA_ROOT."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.media_root = f"{root}/media"
+        os.makedirs(self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={"default": {"BACKEND": "django.core.files.storage.FileSystemStorage"}},
+            **{name: f"{root}/work" for name in work_dir_settings},
+            **overrides,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return self.media_root
+
+    def write_media(self, name: str, data: bytes) -> str:
+        path = f"{self.media_root}/{name}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return name
+
+
+FFPROBE_OUTPUT = {
+    "streams": [
+        {"codec_type": "audio", "codec_name": "aac"},
+        {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080, "avg_frame_rate": "24000/1001"},
+    ],
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "5400.4", "bit_rate": "4500000", "size": "3"},
+}
+
+
+class MediaInfoTest(LocalMediaMixin, TestCase):
+    """MovieMediaInfo: один вызов ffprobe, повторная проверка пропускается по ETag/размеру"""
+
+    def setUp(self):
+        self.use_local_media()
+        self.path = f"{self.media_root}/{self.write_media('film.mp4', b'abc')}"
+        self.movie = Movie.objects.create(title="Probe", slug="probe", description="", year=2020, video="film.mp4")
+
+    def _probe(self, **kwargs):
+        completed = mock.Mock(returncode=0, stdout=json.dumps(FFPROBE_OUTPUT), stderr="")
+        with mock.patch("apps.movies.utils.video_meta.subprocess.run", return_value=completed) as run:
+            result = compute_movie_duration(self.movie.pk, **kwargs)
+        return result, run
+
+    def test_single_probe_fills_media_info(self):
+        result, run = self._probe()
+
+        self.assertTrue(result["success"])
+        run.assert_called_once()
+        self.assertIn("-show_streams", run.call_args.args[0])
+        info = MovieMediaInfo.objects.get(movie=self.movie)
+        self.assertEqual(
+            (info.duration_sec, info.resolution, info.bitrate, info.video_codec, info.audio_codec, info.fps),
+            (5400, "1920x1080", 4_500_000, "h264", "aac", 23.976),
+        )
+        self.assertEqual(info.file_size, 3)
+        self.assertTrue(info.etag)
+
+        response = APIClient().get(f"{MOVIES_URL}{self.movie.slug}/?fields=slug,media_info")
+        self.assertEqual(response.json()["media_info"]["resolution"], "1920x1080")
+
+    def test_unchanged_file_is_not_probed_again(self):
+        self._probe()
+        result, run = self._probe()
+        self.assertTrue(result["skipped"])
+        run.assert_not_called()
+
+        with open(self.path, "ab") as f:
+            f.write(b"more")
+        result, run = self._probe()
+        run.assert_called_once()
+
+    def test_batch_probe_in_parallel(self):
+        for n in range(3):
+            Movie.objects.create(title=f"Batch {n}", slug=f"batch-{n}", description="", year=2020, video="film.mp4")
+        ids = list(Movie.objects.values_list("pk", flat=True))
+        seen = []
+
+        completed = mock.Mock(returncode=0, stdout=json.dumps(FFPROBE_OUTPUT), stderr="")
+        with mock.patch("apps.movies.utils.video_meta.subprocess.run", return_value=completed) as run:
+            summary = media_info.probe_many(ids, concurrency=2, progress=lambda done, total, *_: seen.append((done, total)))
+
+        self.assertEqual((summary["ffprobe"], summary["failed"]), (4, 0))
+        self.assertEqual(run.call_count, 4)
+        self.assertEqual(seen[-1], (4, 4))
+        self.assertEqual(MovieMediaInfo.objects.filter(duration_sec=5400).count(), 4)
+
+    def test_engine_caps_concurrency_and_isolates_errors(self):
+        lock, state = threading.Lock(), {"running": 0, "peak": 0}
+
+        def work(n):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+            if n == 3:
+                raise RuntimeError("boom")
+            return n * 2
+
+        outcomes = list(probe_engine.run(range(10), work, concurrency=3))
+        self.assertEqual(len(outcomes), 10)
+        self.assertLessEqual(state["peak"], 3)
+        self.assertEqual([o.item for o in outcomes if not o.ok], [3])
+        self.assertEqual(sorted(o.result for o in outcomes if o.ok), [n * 2 for n in range(10) if n != 3])
+
+
+
+# ===== Синтетический MP4 =====
+
+def _box(kind, *payload):
+    data = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(data), kind) + data
+
+
+def _full_box(kind, *payload, version=0):
+    return _box(kind, bytes([version, 0, 0, 0]), *payload)
+
+
+def build_mp4(*, frames=250, fps=25, gop=25, sample_size=1000, moov_at_end=True, width=1280, height=720):
+    """
+    MP4 с h264-дорожкой (frames кадров, ключевой каждые gop) и aac-дорожкой без сэмплов.
+    Чанк — gop сэмплов подряд; mdat идёт сразу за ftyp (или за moov, если moov_at_end=False).
+    """
+    timescale, delta = fps * 512, 512
+    duration = frames * delta
+    chunks = [list(range(start, min(start + gop, frames))) for start in range(0, frames, gop)]
+
+    def moov(mdat_payload_offset):
+        offsets = [mdat_payload_offset + chunk[0] * sample_size for chunk in chunks]
+        visual_entry = _box(
+            b"avc1", bytes(6), struct.pack(">H", 1), bytes(16), struct.pack(">HH", width, height), bytes(50)
+        )
+        video_stbl = _box(
+            b"stbl",
+            _full_box(b"stsd", struct.pack(">I", 1), visual_entry),
+            _full_box(b"stts", struct.pack(">III", 1, frames, delta)),
+            _full_box(b"stss", struct.pack(f">I{len(chunks)}I", len(chunks), *[c[0] + 1 for c in chunks])),
+            _full_box(b"stsz", struct.pack(f">II{frames}I", 0, frames, *[sample_size] * frames)),
+            _full_box(b"stsc", struct.pack(">IIII", 1, 1, gop, 1)),
+            _full_box(b"stco", struct.pack(f">I{len(offsets)}I", len(offsets), *offsets)),
+        )
+        audio_stbl = _box(b"stbl", _full_box(b"stsd", struct.pack(">I", 1), _box(b"mp4a", bytes(28))))
+
+        def trak(handler, stbl, track_width=0, track_height=0, track_timescale=timescale):
+            tkhd = _full_box(b"tkhd", bytes(72), struct.pack(">II", track_width << 16, track_height << 16))
+            mdhd = _full_box(b"mdhd", struct.pack(">IIII", 0, 0, track_timescale, duration), bytes(4))
+            hdlr = _full_box(b"hdlr", bytes(4), handler, bytes(13))
+            return _box(b"trak", tkhd, _box(b"mdia", mdhd, hdlr, _box(b"minf", stbl)))
+
+        mvhd = _full_box(b"mvhd", struct.pack(">IIII", 0, 0, timescale, duration), bytes(80))
+        return _box(b"moov", mvhd, trak(b"vide", video_stbl, width, height), trak(b"soun", audio_stbl))
+
+    ftyp = _box(b"ftyp", b"isom", struct.pack(">I", 512), b"isomiso2avc1mp41")
+    mdat_payload = bytes(frames * sample_size)
+    if moov_at_end:
+        return ftyp + _box(b"mdat", mdat_payload) + moov(len(ftyp) + 8)
+    header_size = len(moov(0))
+    return ftyp + moov(len(ftyp) + header_size + 8) + _box(b"mdat", mdat_payload)
+
+
+class CountingReader(mp4_header.FileReader):
+    def __init__(self, path):
+        super().__init__(path)
+        self.requests, self.bytes_read = 0, 0
+
+    def read(self, offset, length):
+        data = super().read(offset, length)
+        self.requests += 1
+        self.bytes_read += len(data)
+        return data
+
+
+class Mp4HeaderTest(TestCase):
+    """Разбор заголовка MP4 без ffprobe: читаются только начало файла и moov"""
+
+    def _write(self, data):
+        handle = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+        handle.write(data)
+        handle.close()
+        self.addCleanup(lambda: os.unlink(handle.name))
+        return handle.name
+
+    def test_moov_after_mdat_is_found_with_few_reads(self):
+        path = self._write(build_mp4(frames=250, sample_size=1000, moov_at_end=True))
+        reader = CountingReader(path)
+        try:
+            metadata = mp4_header.read_metadata(reader)
+        finally:
+            reader.close()
+
+        self.assertEqual(
+            (metadata["duration_sec"], metadata["width"], metadata["height"], metadata["fps"]),
+            (10, 1280, 720, 25.0),
+        )
+        self.assertEqual((metadata["video_codec"], metadata["audio_codec"]), ("h264", "aac"))
+        self.assertEqual(metadata["container"], mp4_header.CONTAINER_NAME)
+        # Начало файла, заголовок moov, сам moov — mdat (250 КБ) не читается
+        self.assertEqual(reader.requests, 3)
+        self.assertLess(reader.bytes_read, mp4_header.HEAD_BYTES + 8192)
+
+    def test_faststart_file_needs_one_read(self):
+        path = self._write(build_mp4(moov_at_end=False))
+        reader = CountingReader(path)
+        try:
+            self.assertEqual(mp4_header.read_metadata(reader)["duration_sec"], 10)
+        finally:
+            reader.close()
+        self.assertEqual(reader.requests, 1)
+
+    def test_other_containers_raise(self):
+        path = self._write(b"\x1aE\xdf\xa3" + bytes(64))  # EBML (mkv)
+        reader = mp4_header.FileReader(path)
+        try:
+            with self.assertRaises(mp4_header.Mp4Error):
+                mp4_header.read_metadata(reader)
+        finally:
+            reader.close()
+
+
+class SeekIndexTest(TestCase):
+    """Индекс «время -> байт» по ключевым кадрам для возобновления с позиции"""
+
+    def test_encode_decode_lookup(self):
+        data = seek_index.encode([0, 2000, 4000], [48, 900_000, 700_000], moov_offset=1_000_000, moov_size=5000)
+        index = seek_index.SeekIndex.decode(data)
+
+        self.assertEqual(len(index), 3)
+        self.assertEqual(index.lookup(3.5), (2.0, 900_000))
+        self.assertEqual(index.lookup(10), (4.0, 700_000))  # смещение может убывать (zigzag)
+        self.assertEqual(index.lookup(0), (0.0, 48))
+        self.assertIsNone(seek_index.SeekIndex.decode(seek_index.encode([], [], moov_offset=0, moov_size=0)).lookup(5))
+
+    def test_keyframes_from_sample_tables(self):
+        data = build_mp4(frames=250, fps=25, gop=25, sample_size=1000, moov_at_end=True)
+        handle = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+        handle.write(data)
+        handle.close()
+        self.addCleanup(lambda: os.unlink(handle.name))
+
+        reader = mp4_header.FileReader(handle.name)
+        try:
+            metadata = mp4_header.read_metadata(reader)
+        finally:
+            reader.close()
+
+        index = seek_index.SeekIndex.decode(metadata["seek_index"])
+        payload = data.index(b"mdat") + 4
+        self.assertEqual(index.times_ms.tolist(), [k * 1000 for k in range(10)])
+        self.assertEqual(index.offsets.tolist(), [payload + k * 25 * 1000 for k in range(10)])
+        self.assertEqual(index.moov_offset, payload + 250 * 1000)
+        self.assertEqual(index.moov_offset + index.moov_size, len(data))
+
+    def test_stream_link_returns_resume_range(self):
+        cache.clear()
+        user = User.objects.create_user(username="seeker", password="x")
+        movie = Movie.objects.create(title="Seek", slug="seek", description="", year=2020, video="seek.mp4")
+        MovieMediaInfo.objects.create(
+            movie=movie, duration_sec=10, source="header",
+            seek_index=seek_index.encode([0, 2000, 4000], [100, 2100, 4100], moov_offset=5000, moov_size=300),
+        )
+        Watched.objects.create(user=user, movie=movie, finished=False, last_position_sec=3)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f"/api/v1/subscribe/movies/{movie.slug}/stream-link/"
+
+        with mock.patch("apps.subscribe.views.can_user_watch", return_value=(True, None, {})), \
+                mock.patch("apps.subscribe.views.generate_signed_url_for_movie", return_value=("http://blob/seek.mp4", 0)):
+            resume = client.get(url).json()["resume"]
+            self.assertEqual(
+                (resume["keyframe_sec"], resume["byte_offset"], resume["range"], resume["header_range"]),
+                (2.0, 2100, "bytes=2100-", "bytes=5000-5299"),
+            )
+            self.assertEqual(client.get(url, {"t": "4.5"}).json()["resume"]["byte_offset"], 4100)
+            self.assertIsNone(client.get(url, {"t": "0"}).json()["resume"])
+            for bad in ("nan", "inf", "abc"):
+                self.assertIsNone(client.get(url, {"t": bad}).json()["resume"])
+
+            # Позиция из буфера heartbeat'ов ещё не сброшена в Watched
+            with override_settings(PROGRESS_WRITE_BEHIND=True):
+                progress_buffer.record(user.pk, movie.pk, last_position_sec=4, duration_sec=10, progress_percent=40)
+                self.assertEqual(client.get(url).json()["resume"]["byte_offset"], 4100)
+
+
+@override_settings(HLS_LADDER=[("720p", 720, 2800, 128), ("360p", 360, 800, 96)], HLS_UPLOAD_CONCURRENCY=4)
+class HlsPackagingTest(LocalMediaMixin, TestCase):
+    """HLS-лесенка: ffmpeg на ступень, параллельная заливка, продолжение с места и прокси плейлистов"""
+
+    def setUp(self):
+        cache.clear()
+        self.use_local_media("HLS_WORK_DIR", STREAM_BACKEND="AZURE")
+        self.write_media("movies/videos/film.mp4", b"source")
+        self.movie = Movie.objects.create(
+            title="Ladder", slug="ladder", description="", year=2020, video="movies/videos/film.mp4",
+        )
+        MovieMediaInfo.objects.create(movie=self.movie, duration_sec=18, width=1920, height=1080)
+        self.encoded, self.fail = [], set()
+
+    def _ffmpeg(self, cmd, **kwargs):
+        out_dir = os.path.dirname(cmd[-1])
+        name = os.path.basename(out_dir)
+        if name in self.fail:
+            return mock.Mock(returncode=1, stderr="boom")
+        self.encoded.append(name)
+        lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:6", "#EXT-X-PLAYLIST-TYPE:VOD"]
+        for i in range(3):
+            with open(os.path.join(out_dir, f"seg_{i:05d}.ts"), "wb") as f:
+                f.write(bytes(100 + i))
+            lines += ["#EXTINF:6.000000,", f"seg_{i:05d}.ts"]
+        with open(cmd[-1], "w") as f:
+            f.write("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n")
+        return mock.Mock(returncode=0, stderr="")
+
+    def _package(self, **kwargs):
+        with mock.patch("apps.movies.services.hls.shutil.which", return_value="/usr/bin/ffmpeg"), \
+                mock.patch("apps.movies.services.hls.subprocess.run", side_effect=self._ffmpeg):
+            return hls.package(Movie.objects.get(pk=self.movie.pk), **kwargs)
+
+    def test_failed_rendition_resumes_without_reencoding_finished_ones(self):
+        self.fail = {"360p"}
+        with self.assertRaises(hls.HlsError):
+            self._package()
+        package = MovieHlsPackage.objects.get(movie=self.movie)
+        self.assertEqual(package.status, "failed")
+        self.assertEqual(
+            dict(package.renditions.values_list("name", "status")), {"720p": "ready", "360p": "failed"},
+        )
+
+        self.fail, self.encoded = set(), []
+        self.assertEqual(self._package()["status"], "ready")
+        self.assertEqual(self.encoded, ["360p"])
+
+        package.refresh_from_db()
+        self.assertTrue(package.master_key.startswith("movies/videos/film/hls/"))
+        with open(f"{self.media_root}/{package.master_key}") as f:
+            master = f.read()
+        self.assertIn('RESOLUTION=1280x720,CODECS="avc1.640028,mp4a.40.2"\n720p/index.m3u8', master)
+        self.assertIn("360p/index.m3u8", master)
+        self.assertTrue(os.path.exists(f"{self.media_root}/{package.prefix}360p/seg_00002.ts"))
+        self.assertEqual(package.renditions.get(name="720p").segments_uploaded, 3)
+
+        self.assertEqual(self._package()["status"], "skipped")
+
+    def test_stream_link_points_to_signed_manifest_proxy(self):
+        self._package()
+        url, _ = generate_signed_url_for_movie(Movie.objects.get(pk=self.movie.pk))
+        self.assertTrue(url.startswith(f"/api/v1/subscribe/hls/{self.movie.pk}/master.m3u8?exp="))
+
+        client = APIClient()
+        master = client.get(url)
+        self.assertEqual(master.status_code, 200)
+        self.assertEqual(master["Content-Type"], "application/vnd.apple.mpegurl")
+        variant = next(line for line in master.content.decode().splitlines() if line.startswith("720p/"))
+        self.assertIn("?exp=", variant)
+        variant_exp = int(variant.split("exp=")[1].split("&")[0])
+        self.assertGreaterEqual(variant_exp, time.time() + settings.HLS_SEGMENT_URL_EXP_SECONDS - 5)
+
+        with mock.patch(
+            "apps.subscribe.views.sign_storage_key", side_effect=lambda key, **kw: (f"https://blob/{key}?sas", 0),
+        ):
+            body = client.get(url.split("master.m3u8")[0] + variant).content.decode()
+        package = MovieHlsPackage.objects.get(movie=self.movie)
+        self.assertIn(f"https://blob/{package.prefix}720p/seg_00000.ts?sas", body)
+        self.assertIn("#EXT-X-ENDLIST", body)
+
+        self.assertEqual(client.get(url.replace("sig=", "sig=x")).status_code, 403)
+        self.assertEqual(client.get(url.replace("master.m3u8", "1080p/index.m3u8")).status_code, 404)
+
+    def test_hls_resume_has_no_mp4_byte_ranges(self):
+        self._package()
+        MovieMediaInfo.objects.filter(movie=self.movie).update(
+            seek_index=seek_index.encode([0, 2000, 4000], [100, 2100, 4100], moov_offset=5000, moov_size=300),
+        )
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="hls-viewer", password="x"))
+        with mock.patch("apps.subscribe.views.can_user_watch", return_value=(True, None, {})):
+            data = client.get(f"/api/v1/subscribe/movies/{self.movie.slug}/stream-link/", {"t": "3"}).json()
+        self.assertEqual(data["format"], "hls")
+        self.assertEqual(data["resume"], {"position_sec": 3.0, "keyframe_sec": 2.0})
+
+    def test_replacing_video_reingests_and_drops_old_package(self):
+        from apps.subscribe.services.signed_urls import hls_package
+
+        self._package()
+        movie = Movie.objects.get(pk=self.movie.pk)
+        self.assertIsNotNone(hls_package(movie))
+
+        with mock.patch("apps.movies.signals.ingest_movie") as ingest:
+            with self.captureOnCommitCallbacks(execute=True):
+                movie.title = "Ladder (director's cut)"
+                movie.save()
+            ingest.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                movie.video = self.write_media("movies/videos/film_v2.mp4", b"new source")
+                movie.save()
+            ingest.assert_called_once_with(movie.pk, countdown=5)
+
+        movie = Movie.objects.get(pk=self.movie.pk)
+        self.assertEqual(movie.faststart_status, "")
+        self.assertIsNone(hls_package(movie))  # лесенка прежнего файла не отдаётся
+
+
+class FaststartTest(LocalMediaMixin, TestCase):
+    """Ремукс MP4 с moov после mdat: проверка по заголовкам, атомарная замена, отметка на фильме"""
+
+    def setUp(self):
+        cache.clear()
+        self.use_local_media("FASTSTART_WORK_DIR")
+
+    def _movie(self, data):
+        self.write_media("movies/videos/film.mp4", data)
+        return Movie.objects.create(title="Fast", slug="fast", description="", year=2020, video="movies/videos/film.mp4")
+
+    def _ffmpeg(self, cmd, **kwargs):
+        with open(cmd[-1], "wb") as f:
+            f.write(build_mp4(moov_at_end=False))
+        return mock.Mock(returncode=0, stderr="")
+
+    def test_layout_is_detected_from_box_headers(self):
+        handle = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+        handle.write(build_mp4(frames=250, sample_size=1000, moov_at_end=True))
+        handle.close()
+        self.addCleanup(lambda: os.unlink(handle.name))
+
+        reader = CountingReader(handle.name)
+        try:
+            self.assertFalse(mp4_header.is_faststart(reader))
+        finally:
+            reader.close()
+        self.assertEqual(reader.requests, 1)  # заголовок mdat уже в первых HEAD_BYTES
+
+    def test_moov_at_end_is_remuxed_and_swapped(self):
+        movie = self._movie(build_mp4(moov_at_end=True))
+        with mock.patch("apps.movies.services.faststart.subprocess.run", side_effect=self._ffmpeg) as run, \
+                mock.patch("apps.movies.tasks.delete_stale_video.apply_async") as delete_later:
+            result = faststart.ensure(movie)
+            self.assertEqual(result["status"], "remuxed")
+            self.assertIn("+faststart", run.call_args.args[0])
+
+            movie.refresh_from_db()
+            self.assertEqual((movie.video.name, movie.faststart_status), ("movies/videos/film.faststart.mp4", "remuxed"))
+            self.assertTrue(movie.meta_dirty)
+            reader = mp4_header.FileReader(movie.video.path)
+            try:
+                self.assertTrue(mp4_header.is_faststart(reader))
+            finally:
+                reader.close()
+            delete_later.assert_called_once()
+            self.assertEqual(delete_later.call_args.kwargs["args"], ["movies/videos/film.mp4"])
+
+            self.assertEqual(faststart.ensure(movie)["status"], "skipped")
+            run.assert_called_once()
+
+        movie.video = "movies/videos/other.mp4"
+        movie.save()
+        movie.refresh_from_db()
+        self.assertEqual(movie.faststart_status, "")
+
+    def test_faststart_file_is_only_marked(self):
+        movie = self._movie(build_mp4(moov_at_end=False))
+        with mock.patch("apps.movies.services.faststart.subprocess.run") as run:
+            self.assertEqual(faststart.ensure(movie)["status"], "ok")
+        run.assert_not_called()
+        movie.refresh_from_db()
+        self.assertEqual(movie.faststart_status, "ok")
+
+    def test_video_replaced_during_remux_keeps_new_video(self):
+        movie = self._movie(build_mp4(moov_at_end=True))
+
+        def replace_then_remux(cmd, **kwargs):
+            Movie.objects.filter(pk=movie.pk).update(video="movies/videos/newer.mp4")
+            return self._ffmpeg(cmd)
+
+        with mock.patch("apps.movies.services.faststart.subprocess.run", side_effect=replace_then_remux):
+            self.assertEqual(faststart.ensure(movie)["status"], "replaced")
+        movie.refresh_from_db()
+        self.assertEqual(movie.video.name, "movies/videos/newer.mp4")
+        self.assertFalse(os.path.exists(f"{self.media_root}/movies/videos/film.faststart.mp4"))
+
+    def test_replaced_tail_moov_video_is_remuxed(self):
+        from .tasks import resume_faststart
+
+        movie = self._movie(build_mp4(moov_at_end=False))
+        faststart.ensure(movie)
+
+        with mock.patch("apps.movies.signals.ingest_movie") as ingest, self.captureOnCommitCallbacks(execute=True):
+            movie.video = self.write_media("movies/videos/film_v2.mp4", build_mp4(moov_at_end=True))
+            movie.save()
+        ingest.assert_called_once_with(movie.pk, countdown=5)
+        movie.refresh_from_db()
+        self.assertEqual(movie.faststart_status, "")
+
+        # Если ingest потерялся — файл подберёт периодическая задача, но только один раз за FASTSTART_TIMEOUT
+        with mock.patch("apps.movies.tasks.ingest_movie") as ingest:
+            self.assertEqual(resume_faststart()["queued"], [movie.pk])
+            self.assertEqual(resume_faststart()["queued"], [])
+        ingest.assert_called_once_with(movie.pk, countdown=0)
+
+        with mock.patch("apps.movies.services.faststart.subprocess.run", side_effect=self._ffmpeg), \
+                mock.patch("apps.movies.tasks.delete_stale_video.apply_async"):
+            self.assertEqual(faststart.ensure(movie)["status"], "remuxed")
+        movie.refresh_from_db()
+        self.assertEqual(movie.video.name, "movies/videos/film_v2.faststart.mp4")
+
+
+@override_settings(TRICKPLAY_INTERVAL=10, TRICKPLAY_WIDTH=240, TRICKPLAY_COLUMNS=5, TRICKPLAY_ROWS=2)
+class TrickplayTest(LocalMediaMixin, TestCase):
+    """Превью перемотки: листы за один проход ffmpeg, WebVTT-индекс, подписанные ссылки в stream-link"""
+
+    def setUp(self):
+        cache.clear()
+        self.use_local_media()
+        self.write_media("movies/videos/film.mp4", b"source")
+        self.movie = Movie.objects.create(
+            title="Scrub", slug="scrub", description="", year=2020, video="movies/videos/film.mp4",
+        )
+        MovieMediaInfo.objects.create(movie=self.movie, duration_sec=115, width=1920, height=800)
+
+    def _ffmpeg(self, cmd, **kwargs):
+        pattern = cmd[-1]
+        for n in (1, 2):
+            with open(pattern.replace("%04d", f"{n:04d}"), "wb") as f:
+                f.write(b"\xff\xd8jpeg")
+        return mock.Mock(returncode=0, stderr="")
+
+    def test_vtt_cues_follow_sheet_layout(self):
+        vtt = trickplay.build_vtt(
+            ["a.jpg", "b.jpg"], frames=12, interval=10, duration=115, width=240, height=100, columns=5, rows=2,
+        )
+        cues = vtt.split("\n\n")[1:]
+        self.assertEqual(cues[0], "00:00:00.000 --> 00:00:10.000\na.jpg#xywh=0,0,240,100")
+        self.assertEqual(cues[6], "00:01:00.000 --> 00:01:10.000\na.jpg#xywh=240,100,240,100")
+        self.assertEqual(cues[11].strip(), "00:01:50.000 --> 00:01:55.000\nb.jpg#xywh=240,0,240,100")
+
+    def test_sheets_built_once_and_exposed_on_stream_link(self):
+        with mock.patch("apps.movies.services.trickplay.shutil.which", return_value="/usr/bin/ffmpeg"), \
+                mock.patch("apps.movies.services.trickplay.subprocess.run", side_effect=self._ffmpeg) as run:
+            self.assertEqual(trickplay.build(self.movie)["status"], "ready")
+            self.assertEqual(trickplay.build(self.movie)["status"], "skipped")
+        run.assert_called_once()
+        self.assertIn("fps=1/10,scale=240:100,tile=5x2", run.call_args.args[0])
+
+        preview = MovieTrickplay.objects.get(movie=self.movie)
+        self.assertEqual((preview.frames, preview.sheets), (12, ["sheet_0001.jpg", "sheet_0002.jpg"]))
+        self.assertTrue(os.path.exists(f"{self.media_root}/{preview.vtt_key}"))
+
+        user = User.objects.create_user(username="scrubber", password="x")
+        client = APIClient()
+        client.force_authenticate(user)
+        sign = lambda key, **kw: (f"https://blob/{key}?sas", 0)
+        with mock.patch("apps.subscribe.views.can_user_watch", return_value=(True, None, {})), \
+                mock.patch("apps.subscribe.services.signed_urls.generate_azure_sas_url", side_effect=sign):
+            info = client.get(f"/api/v1/subscribe/movies/{self.movie.slug}/stream-link/").json()["trickplay"]
+            self.assertEqual((info["columns"], info["rows"], info["tile_height"]), (5, 2, 100))
+            self.assertEqual(info["sheets"][1], f"https://blob/{preview.prefix}sheet_0002.jpg?sas")
+
+            vtt = APIClient().get(info["vtt"])
+            self.assertEqual(vtt.status_code, 200)
+            self.assertIn(f"https://blob/{preview.prefix}sheet_0002.jpg?sas#xywh=240,0,240,100", vtt.content.decode())
+            self.assertEqual(APIClient().get(info["vtt"].replace("sig=", "sig=x")).status_code, 403)
+
+    def test_missing_source_url_does_not_leave_processing(self):
+        with mock.patch("apps.movies.services.trickplay.shutil.which", return_value="/usr/bin/ffmpeg"), \
+                mock.patch("apps.movies.services.trickplay.get_video_url_for_processing", return_value=None):
+            with self.assertRaises(trickplay.TrickplayError):
+                trickplay.build(self.movie)
+        self.assertNotEqual(MovieTrickplay.objects.get(movie=self.movie).status, "processing")
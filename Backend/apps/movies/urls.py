@@ -27,8 +27,16 @@ urlpatterns = [
     path('characters/', views.CharacterListCreateView.as_view(), name='character-list-create'),
     path('characters/<slug:slug>/', views.CharacterDetailView.as_view(), name='character-detail'),
 
+    # Search
+    path('search/', views.CatalogSearchView.as_view(), name='catalog-search'),
+    path('suggest/', views.SuggestView.as_view(), name='catalog-suggest'),
+
     # Movies CRUD
+    path('cache/stats/', views.CatalogCacheStatsView.as_view(), name='catalog-cache-stats'),
+    path('analytics/daily/', views.MovieStatsView.as_view(), name='movie-daily-stats'),
+    path('analytics/unique-viewers/', views.UniqueViewersView.as_view(), name='movie-unique-viewers'),
     path('movies/', views.MovieListCreateView.as_view(),  name='movie-list'),
+    path('movies/trending/', views.TrendingMoviesView.as_view(), name='movie-trending'),
     path('movies/<slug:slug>/', views.MovieDetailView.as_view(), name='movie-detail'),
 
     # Movie actions
@@ -36,6 +44,8 @@ urlpatterns = [
     path('movies/<slug:slug>/like/', movie_like, name='movie-like'),
     path('movies/<slug:slug>/unlike/', movie_unlike, name='movie-unlike'),
     path('movies/<slug:slug>/progress/', movie_progress, name='movie-progress'),
+    path('movies/<slug:slug>/because-you-watched/', views.BecauseYouWatchedView.as_view(), name='movie-because-you-watched'),
+    path('movies/<slug:slug>/similar/', views.SimilarMoviesView.as_view(), name='movie-similar'),
 
     # Movie cast
     path('movies/<slug:slug>/cast/', cast_list_create, name='movie-cast'),
@@ -43,4 +53,6 @@ urlpatterns = [
 
     # «Мои просмотренные»
     path('me/watched/', views.MyWatchedMoviesView.as_view(),  name='my-watched-movies'),
+    path('me/continue/', views.ContinueWatchingView.as_view(), name='my-continue-watching'),
+    path('me/recommendations/', views.MyRecommendationsView.as_view(), name='my-recommendations'),
 ]
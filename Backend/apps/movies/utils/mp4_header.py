@@ -0,0 +1,373 @@
+"""
+Разбор заголовка MP4/MOV без ffprobe.
+
+Читаются только нужные диапазоны байт: первые HEAD_BYTES (ftyp и, если файл
+faststart, сразу moov), затем заголовки боксов верхнего уровня — mdat
+перепрыгивается по размеру — и целиком бокс moov, где бы он ни лежал.
+Из moov берутся mvhd (длительность), tkhd (размер кадра), mdhd/hdlr
+(тип дорожки), stsd (кодек) и stts (частота кадров); по таблицам сэмплов
+видеодорожки строится индекс ключевых кадров (utils/seek_index).
+
+Источник байт — «читатель» с методом read(offset, length) и атрибутом size:
+локальный файл (seek), HTTP Range (например, SAS URL) или blob Azure.
+Всё, что не похоже на MP4 (mkv, ts, фрагментированный MP4 без длительности),
+даёт Mp4Error — вызывающий код откатывается на ffprobe.
+"""
+import logging
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+from . import seek_index
+
+logger = logging.getLogger(__name__)
+
+HEAD_BYTES = 64 * 1024
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+TOP_LEVEL_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pdin', b'uuid', b'moof', b'mfra', b'styp', b'sidx'}
+CONTAINER_NAME = "mov,mp4,m4a,3gp,3g2,mj2"  # как format_name у ffprobe
+
+# fourcc из stsd -> имя кодека как у ffprobe
+CODECS = {
+    b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'av01': 'av1',
+    b'vp09': 'vp9', b'mp4v': 'mpeg4', b'mp4a': 'aac', b'ac-3': 'ac3', b'ec-3': 'eac3',
+    b'Opus': 'opus', b'fLaC': 'flac', b'.mp3': 'mp3',
+}
+
+
+class Mp4Error(ValueError):
+    """Файл не MP4/MOV или заголовок не удалось разобрать."""
+
+
+# ===== Читатели =====
+
+class FileReader:
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+
+    def read(self, offset: int, length: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def close(self):
+        self._file.close()
+
+
+class HttpRangeReader:
+    """Range-запросы по URL (SAS URL Azure, S3 presigned и т.п.) в одной HTTP-сессии."""
+
+    def __init__(self, url: str, *, timeout: int = 10, session=None):
+        import requests
+
+        self.url = url
+        self.timeout = timeout
+        self.size = None
+        self._session = session or requests.Session()
+
+    def read(self, offset: int, length: int) -> bytes:
+        headers = {'Range': f"bytes={offset}-{offset + length - 1}"}
+        with self._session.get(self.url, headers=headers, timeout=self.timeout, stream=True) as response:
+            if response.status_code == 416:
+                return b''
+            if response.status_code != 206:
+                # Сервер игнорирует Range — не качаем файл целиком
+                raise Mp4Error(f"Range requests not supported (HTTP {response.status_code})")
+            if self.size is None:
+                self.size = int(response.headers['Content-Range'].rsplit('/', 1)[1])
+            return response.content
+
+    def close(self):
+        self._session.close()
+
+
+class AzureBlobReader:
+    def __init__(self, blob_client):
+        self._blob = blob_client
+        self.size = blob_client.get_blob_properties().size
+
+    def read(self, offset: int, length: int) -> bytes:
+        length = min(length, self.size - offset)
+        if length <= 0:
+            return b''
+        return self._blob.download_blob(offset=offset, length=length).readall()
+
+    def close(self):
+        pass
+
+
+def open_reader(file_field):
+    """Читатель для FileField: blob Azure, локальный файл или URL хранилища."""
+    storage = file_field.storage
+    if hasattr(storage, 'client') and hasattr(storage, '_get_valid_path'):
+        return AzureBlobReader(storage.client.get_blob_client(storage._get_valid_path(file_field.name)))  # type: ignore
+    try:
+        return FileReader(storage.path(file_field.name))
+    except NotImplementedError:
+        return HttpRangeReader(file_field.url)
+
+
+# ===== Боксы =====
+
+def _box_header(data, pos: int, end: int):
+    """(размер, тип, длина заголовка) бокса по смещению pos."""
+    if end - pos < 8:
+        raise Mp4Error("Truncated box header")
+    size, kind = struct.unpack_from('>I4s', data, pos)
+    header = 8
+    if size == 1:
+        if end - pos < 16:
+            raise Mp4Error("Truncated largesize box header")
+        size = struct.unpack_from('>Q', data, pos + 8)[0]
+        header = 16
+    elif size == 0:
+        size = end - pos  # бокс до конца файла/родителя
+    if size < header:
+        raise Mp4Error(f"Bad box size {size} for {kind!r}")
+    return size, kind, header
+
+
+def iter_boxes(data, start: int = 0, end: Optional[int] = None):
+    """(тип, начало содержимого, конец бокса) для боксов data[start:end]."""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind, header = _box_header(data, pos, end)
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def children(data, start: int, end: int) -> dict:
+    """Первый дочерний бокс каждого типа: тип -> (начало содержимого, конец)."""
+    found = {}
+    for kind, payload, box_end in iter_boxes(data, start, end):
+        found.setdefault(kind, (payload, box_end))
+    return found
+
+
+def _top_level(reader, head: bytes):
+    """(тип, смещение, размер) боксов верхнего уровня; вне head читаются только их заголовки."""
+    total = reader.size if reader.size is not None else len(head)
+    pos = 0
+    while pos + 8 <= total:
+        header = head[pos:pos + 16] if pos + 16 <= len(head) else reader.read(pos, 16)
+        size, kind, _ = _box_header(header, 0, len(header))
+        if struct.unpack_from('>I', header)[0] == 0:
+            size = total - pos  # последний бокс «до конца файла»
+        if pos == 0 and kind not in TOP_LEVEL_BOXES:
+            raise Mp4Error(f"Not an MP4/MOV file (first box {kind!r})")
+        yield kind, pos, size
+        pos += size
+
+
+def read_moov(reader) -> tuple[bytes, bytes, int]:
+    """(бокс moov целиком, major brand из ftyp, смещение moov). Читает первые HEAD_BYTES и заголовки боксов верхнего уровня."""
+    head = reader.read(0, HEAD_BYTES)
+    brand = b''
+    for kind, pos, size in _top_level(reader, head):
+        if kind == b'ftyp' and pos + 12 <= len(head):
+            brand = head[pos + 8:pos + 12]
+        if kind == b'moov':
+            if size > MAX_MOOV_BYTES:
+                raise Mp4Error(f"moov too large: {size} bytes")
+            return (head[pos:pos + size] if pos + size <= len(head) else reader.read(pos, size)), brand, pos
+    raise Mp4Error("moov box not found")
+
+
+def is_faststart(reader) -> bool:
+    """moov лежит раньше mdat — плеер начинает воспроизведение, не запрашивая хвост файла."""
+    head = reader.read(0, HEAD_BYTES)
+    for kind, _, _ in _top_level(reader, head):
+        if kind == b'moov':
+            return True
+        if kind == b'mdat':
+            return False
+    raise Mp4Error("Neither moov nor mdat found")
+
+
+# ===== Разбор moov =====
+
+def _full_box(data, start: int) -> tuple[int, int]:
+    """(version, начало полей после version/flags)."""
+    return data[start], start + 4
+
+
+def parse_mvhd(data, start: int) -> tuple[int, int]:
+    version, pos = _full_box(data, start)
+    if version == 1:
+        return struct.unpack_from('>IQ', data, pos + 16)
+    return struct.unpack_from('>II', data, pos + 8)
+
+
+parse_mdhd = parse_mvhd  # timescale и duration лежат там же
+
+
+class Track:
+    """Дорожка из trak: тип, шкала времени, кодек и границы боксов таблиц сэмплов в moov."""
+
+    def __init__(self, moov: bytes, start: int, end: int):
+        self.moov = moov
+        trak = children(moov, start, end)
+        mdia = children(moov, *trak[b'mdia'])
+        minf = children(moov, *mdia[b'minf'])
+        self.tables = children(moov, *minf[b'stbl'])  # stsd, stts, stss, stsz, stsc, stco/co64
+
+        self.timescale, self.duration = parse_mdhd(moov, mdia[b'mdhd'][0])
+        self.handler = moov[mdia[b'hdlr'][0] + 8:mdia[b'hdlr'][0] + 12]
+
+        tkhd_end = trak[b'tkhd'][1]
+        width, height = struct.unpack_from('>II', moov, tkhd_end - 8)  # 16.16 fixed point
+        self.width, self.height = width >> 16, height >> 16
+
+        self.fourcc = b''
+        if b'stsd' in self.tables:
+            entry = self.tables[b'stsd'][0] + 8
+            self.fourcc = moov[entry + 4:entry + 8]
+            if self.handler == b'vide' and not (self.width and self.height):
+                # Размер кадра из VisualSampleEntry, если tkhd пустой
+                self.width, self.height = struct.unpack_from('>HH', moov, entry + 32)
+
+    @property
+    def codec(self) -> str:
+        return CODECS.get(self.fourcc, self.fourcc.decode('latin-1').strip())
+
+    def table(self, kind: bytes) -> Optional[memoryview]:
+        bounds = self.tables.get(kind)
+        return memoryview(self.moov)[bounds[0]:bounds[1]] if bounds else None
+
+    def sample_deltas(self) -> list[tuple[int, int]]:
+        """stts: [(число сэмплов, длительность сэмпла в timescale), ...]."""
+        stts = self.table(b'stts')
+        if stts is None:
+            return []
+        count = struct.unpack_from('>I', stts, 4)[0]
+        return list(struct.iter_unpack('>II', stts[8:8 + count * 8]))
+
+    def fps(self) -> Optional[float]:
+        deltas = self.sample_deltas()
+        samples = sum(count for count, _ in deltas)
+        ticks = sum(count * delta for count, delta in deltas)
+        return round(samples * self.timescale / ticks, 3) if samples and ticks else None
+
+
+def _entries(track, kind: bytes, columns: int = 1, dtype: str = '>u4') -> np.ndarray:
+    """Записи таблицы сэмплов (после version/flags и счётчика): массив (N,) или (N, columns)."""
+    table = track.table(kind)
+    if table is None:
+        raise Mp4Error(f"No {kind.decode()} box")
+    count = struct.unpack_from('>I', table, 4)[0]
+    values = np.frombuffer(table, dtype=dtype, count=count * columns, offset=8).astype(np.int64)
+    return values.reshape(count, columns) if columns > 1 else values
+
+
+def keyframes(track) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (время в мс, байтовое смещение) ключевых кадров дорожки из stss/stts/stsz/stsc/stco(co64).
+    Время — decode time без учёта edit list/ctts: для точки входа Range-запроса этого достаточно.
+    """
+    # Длительности сэмплов -> время начала каждого сэмпла
+    stts = _entries(track, b'stts', 2)
+    deltas = np.repeat(stts[:, 1], stts[:, 0])
+    starts = np.concatenate(([0], np.cumsum(deltas)[:-1]))
+
+    # Размеры сэмплов
+    stsz = track.table(b'stsz')
+    if stsz is None:
+        raise Mp4Error("No stsz box")
+    uniform, count = struct.unpack_from('>II', stsz, 4)
+    sizes = (
+        np.full(count, uniform, dtype=np.int64) if uniform
+        else np.frombuffer(stsz, dtype='>u4', count=count, offset=12).astype(np.int64)
+    )
+
+    # Смещения чанков и число сэмплов в каждом чанке
+    if track.table(b'co64') is not None:
+        chunk_offsets = _entries(track, b'co64', dtype='>u8')
+    else:
+        chunk_offsets = _entries(track, b'stco')
+    stsc = _entries(track, b'stsc', 3)
+    runs = np.diff(np.append(stsc[:, 0] - 1, len(chunk_offsets)))
+    per_chunk = np.repeat(stsc[:, 1], runs)
+
+    # Смещение сэмпла = начало его чанка + размеры предыдущих сэмплов того же чанка
+    total = min(int(per_chunk.sum()), len(sizes), len(starts))
+    chunk_of_sample = np.repeat(np.arange(len(per_chunk)), per_chunk)[:total]
+    before = np.concatenate(([0], np.cumsum(sizes[:total])[:-1]))
+    chunk_first = np.concatenate(([0], np.cumsum(per_chunk)[:-1]))
+    offsets = chunk_offsets[chunk_of_sample] + before - before[chunk_first[chunk_of_sample]]
+
+    # Ключевые кадры: stss (номера с 1); без stss каждый сэмпл — ключевой
+    if track.table(b'stss') is not None:
+        sync = _entries(track, b'stss') - 1
+        sync = sync[sync < total]
+    else:
+        sync = np.arange(total)
+    return starts[sync] * 1000 // track.timescale, offsets[sync]
+
+
+def parse_moov(moov: bytes) -> tuple[int, int, list[Track]]:
+    """(timescale, duration из mvhd, дорожки)."""
+    _, _, header = _box_header(moov, 0, len(moov))
+    timescale, duration, tracks = 0, 0, []
+    for kind, start, end in iter_boxes(moov, header):
+        if kind == b'mvhd':
+            timescale, duration = parse_mvhd(moov, start)
+        elif kind == b'trak':
+            try:
+                tracks.append(Track(moov, start, end))
+            except KeyError:
+                continue  # дорожка без mdia/minf/stbl (например, tmcd с урезанной структурой)
+    return timescale, duration, tracks
+
+
+def read_metadata(reader) -> dict:
+    """Метаданные в формате parse_ffprobe_output (video_meta). Mp4Error — если это не MP4/MOV."""
+    moov, brand, moov_offset = read_moov(reader)
+    timescale, duration, tracks = parse_moov(moov)
+    if not timescale or not duration:
+        raise Mp4Error("No duration in mvhd (fragmented MP4?)")
+
+    video = next((t for t in tracks if t.handler == b'vide'), None)
+    audio = next((t for t in tracks if t.handler == b'soun'), None)
+    seconds = duration / timescale
+    size = reader.size
+    return {
+        'duration_sec': int(round(seconds)),
+        'width': video.width if video else None,
+        'height': video.height if video else None,
+        'bitrate': int(size * 8 / seconds) if size else None,
+        'video_codec': video.codec if video else '',
+        'audio_codec': audio.codec if audio else '',
+        'fps': video.fps() if video else None,
+        'container': CONTAINER_NAME,
+        'file_size': size,
+        'brand': brand.decode('latin-1').strip(),
+        'seek_index': _seek_index(video, moov_offset, len(moov)) if video else None,
+    }
+
+
+def _seek_index(track, moov_offset: int, moov_size: int) -> Optional[bytes]:
+    try:
+        times_ms, offsets = keyframes(track)
+    except (Mp4Error, struct.error, ValueError, IndexError) as e:
+        logger.info(f"No seek index: {e}")
+        return None
+    return seek_index.encode(times_ms, offsets, moov_offset=moov_offset, moov_size=moov_size)
+
+
+def probe_file(file_field) -> Optional[dict]:
+    """read_metadata для FileField; None — если нужно откатиться на ffprobe."""
+    reader = None
+    try:
+        reader = open_reader(file_field)
+        return read_metadata(reader)
+    except Mp4Error as e:
+        logger.info(f"MP4 header parser skipped {file_field.name}: {e}")
+    except Exception as e:
+        logger.warning(f"MP4 header parser failed for {file_field.name}: {e}")
+    finally:
+        if reader is not None:
+            reader.close()
+    return None
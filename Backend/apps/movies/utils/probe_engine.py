@@ -0,0 +1,74 @@
+"""
+Пакетный запуск блокирующих проб (ffprobe, HEAD к blob'у) в пуле потоков.
+
+subprocess и сетевой ввод-вывод отпускают GIL, поэтому N потоков дают
+до N одновременных ffprobe в одном процессе воркера. В пул отдаётся не больше
+concurrency задач сразу: на 10k элементов не создаётся 10k futures, а
+результаты отдаются по мере готовности — вызывающий код пишет их в БД
+в своём потоке (у потоков пула нет соединений с БД).
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProbeOutcome:
+    item: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _timed(work: Callable, item) -> ProbeOutcome:
+    started = time.monotonic()
+    try:
+        return ProbeOutcome(item, result=work(item), seconds=time.monotonic() - started)
+    except Exception as e:
+        return ProbeOutcome(item, error=e, seconds=time.monotonic() - started)
+
+
+def run(
+    items: Iterable,
+    work: Callable,
+    *,
+    concurrency: int = 8,
+    progress: Optional[Callable[[int, ProbeOutcome], None]] = None,
+) -> Iterator[ProbeOutcome]:
+    """
+    Выполняет work(item) для каждого элемента, не больше concurrency одновременно.
+    Отдаёт ProbeOutcome в порядке завершения; исключения work не прерывают пакет.
+    Таймаут одного элемента — забота work (например, timeout у subprocess.run).
+    progress(done, outcome) вызывается после каждого элемента.
+    """
+    items = iter(items)
+    concurrency = max(1, concurrency)
+    done = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="probe") as pool:
+        pending = set()
+        while True:
+            while len(pending) < concurrency:
+                item = next(items, StopIteration)
+                if item is StopIteration:
+                    break
+                pending.add(pool.submit(_timed, work, item))
+            if not pending:
+                return
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                outcome = future.result()
+                done += 1
+                if not outcome.ok:
+                    logger.warning(f"Probe failed for {outcome.item}: {outcome.error}")
+                if progress:
+                    progress(done, outcome)
+                yield outcome
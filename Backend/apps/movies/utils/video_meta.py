@@ -1,4 +1,5 @@
 import json
+import os
 import subprocess
 import logging
 from typing import Optional, Tuple
@@ -58,26 +59,60 @@ def probe_duration_seconds(input_url: str, *, timeout: int = 60) -> Optional[int
         return None
 
 
+def _parse_rate(value) -> Optional[float]:
+    """Частота кадров ffprobe ("30000/1001", "25/1", "0/0") -> float."""
+    try:
+        num, denom = map(int, (value or "0/0").split('/'))
+    except ValueError:
+        return None
+    return round(num / denom, 3) if num and denom else None
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_ffprobe_output(data: dict) -> dict:
+    """
+    Разбирает JSON `ffprobe -show_format -show_streams`: первый видео- и первый аудиопоток
+    плюс данные контейнера. Ключи совпадают с полями MovieMediaInfo.
+    """
+    format_data = data.get("format", {})
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+
+    duration_sec = _to_int(format_data.get("duration")) or _to_int(video.get("duration"))
+    return {
+        'duration_sec': duration_sec,
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'bitrate': _to_int(format_data.get('bit_rate')) or _to_int(video.get('bit_rate')),
+        'video_codec': video.get('codec_name', ''),
+        'audio_codec': audio.get('codec_name', ''),
+        'fps': _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate')),
+        'container': format_data.get('format_name', ''),
+        'file_size': _to_int(format_data.get('size')),
+    }
+
+
 def probe_video_metadata(input_url: str, *, timeout: int = 60) -> Optional[dict]:
     """
-    Извлекает полные метаданные видео (длительность, разрешение, битрейт и т.д.)
+    Все метаданные видео одним вызовом ffprobe (все потоки + контейнер).
     
     Returns:
-        dict: {
-            'duration': int,  # секунды
-            'duration_timedelta': timedelta,
-            'width': int,
-            'height': int,
-            'bitrate': int,
-            'codec': str,
-            'fps': float
-        }
+        dict: см. parse_ffprobe_output (+ 'duration' и 'duration_timedelta'
+        для совместимости) или None при ошибке
     """
     try:
         cmd = [
             "ffprobe",
             "-v", "error",
-            "-show_entries", "format=duration,bit_rate:stream=codec_name,width,height,r_frame_rate",
+            "-show_format",
+            "-show_streams",
             "-of", "json",
             input_url
         ]
@@ -94,39 +129,48 @@ def probe_video_metadata(input_url: str, *, timeout: int = 60) -> Optional[dict]
             logger.error(f"ffprobe failed: {result.stderr}")
             return None
         
-        data = json.loads(result.stdout)
-        
-        # Извлекаем данные
-        format_data = data.get("format", {})
-        stream_data = data.get("streams", [{}])[0]  # первый видео стрим
-        
-        duration_sec = int(round(float(format_data.get("duration", 0))))
-        
-        # Парсим frame rate (может быть в формате "30000/1001")
-        fps_str = stream_data.get("r_frame_rate", "0/1")
-        try:
-            num, denom = map(int, fps_str.split('/'))
-            fps = num / denom if denom else 0
-        except:
-            fps = 0
-        
-        metadata = {
-            'duration': duration_sec,
-            'duration_timedelta': timedelta(seconds=duration_sec),
-            'width': stream_data.get('width'),
-            'height': stream_data.get('height'),
-            'bitrate': int(format_data.get('bit_rate', 0)),
-            'codec': stream_data.get('codec_name'),
-            'fps': round(fps, 2) if fps else None
-        }
-        
+        metadata = parse_ffprobe_output(json.loads(result.stdout))
+        duration_sec = metadata['duration_sec'] or 0
+        metadata['duration'] = duration_sec
+        metadata['duration_timedelta'] = timedelta(seconds=duration_sec)
         return metadata
         
+    except subprocess.TimeoutExpired:
+        logger.error(f"ffprobe timeout ({timeout}s) for URL: {input_url[:100]}")
+        return None
+    except FileNotFoundError:
+        logger.error("ffprobe not found. Install ffmpeg: apt-get install ffmpeg")
+        return None
     except Exception as e:
         logger.exception(f"Error extracting video metadata: {e}")
         return None
 
 
+def get_video_fingerprint(file_field) -> Tuple[Optional[str], Optional[int]]:
+    """
+    (ETag, размер) видеофайла без скачивания: свойства blob'а в Azure,
+    stat() для локального хранилища. (None, None), если узнать не удалось.
+    """
+    if not file_field:
+        return None, None
+    storage = file_field.storage
+    try:
+        if hasattr(storage, 'client') and hasattr(storage, '_get_valid_path'):
+            # django-storages AzureStorage: один HEAD-запрос к blob'у
+            blob = storage.client.get_blob_client(storage._get_valid_path(file_field.name))  # type: ignore
+            properties = blob.get_blob_properties()
+            return properties.etag, properties.size
+        try:
+            path = storage.path(file_field.name)
+        except NotImplementedError:
+            return None, storage.size(file_field.name)  # хранилище без локальных путей: только размер
+        stat = os.stat(path)
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', stat.st_size
+    except Exception as e:
+        logger.warning(f"Unable to read video properties for {file_field.name}: {e}")
+        return None, None
+
+
 def get_azure_blob_sas_url(blob_name: str, expires_in: int = 300) -> Optional[str]:
     """
     Генерирует временный SAS URL для Azure Blob (для работы ffprobe).
@@ -161,12 +205,13 @@ def get_azure_blob_sas_url(blob_name: str, expires_in: int = 300) -> Optional[st
         return None
 
 
-def get_video_url_for_processing(file_field) -> Optional[str]:
+def get_video_url_for_processing(file_field, *, expires_in: int = 300) -> Optional[str]:
     """
     Получает URL видео для обработки (локальный путь или Azure SAS URL).
     
     Args:
         file_field: Django FileField/ImageField объект
+        expires_in: время жизни SAS, сек (для ffmpeg — на всё время обработки)
     
     Returns:
         str: URL или путь к файлу
@@ -179,7 +224,7 @@ def get_video_url_for_processing(file_field) -> Optional[str]:
     # Azure Storage
     if 'azure' in storage_backend.lower():
         blob_name = file_field.name
-        return get_azure_blob_sas_url(blob_name)
+        return get_azure_blob_sas_url(blob_name, expires_in=expires_in)
     
     # Локальное хранилище
     elif 'FileSystemStorage' in storage_backend:
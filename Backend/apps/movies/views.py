@@ -1,13 +1,14 @@
 from rest_framework import generics, permissions, filters, status, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Count
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 
 from .models import Movie, Genre, Author, Actor, MovieCharacter, Casting
 from apps.accounts.models import Watched, Favorite
-from apps.subscribe.services.access import can_user_watch
+from apps.subscribe.services.access import can_user_watch_cached
 from .serializers import (
     MovieSerializer,
     MovieDetailSerializer,
@@ -20,6 +21,11 @@ from .serializers import (
     CastingCreateSerializer,
 )
 from .permissions import IsAdminOrReadOnly
+from .analytics import MovieAnalytics
+from .services import (
+    catalog_cache, continue_watching, minhash_index, progress_buffer, search_index, similarity, suggest_index,
+    hll, trending,
+)
 
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAdminUser  # или IsAuthenticated
@@ -40,7 +46,7 @@ class GenreListCreateView(generics.ListCreateAPIView):
     ordering = ['name']
 
     def get_queryset(self):
-        return Genre.objects.annotate(movies_count=Count('movies')).all()
+        return Genre.objects.all()
 
 
 class GenreDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -114,15 +120,18 @@ class MovieListCreateView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['year', 'genres', 'author', 'author__slug', 'genres__slug']
     search_fields = ['title', 'description', 'author__name', 'genres__name']
+    # ?ordering=views — по сохранённому столбцу (индекс (views, id), keyset-курсор):
+    # несброшенные инкременты попадают в порядок со следующим view_counter.flush
     ordering_fields = ['title', 'year', 'views']
     ordering = ['-year']
 
     def get_queryset(self):
+        if self.request.method != 'GET':
+            return Movie.objects.all()
+        fields = MovieSerializer.get_requested_fields(self.request)
         return (
             Movie.objects
-            .select_related('author')
-            .prefetch_related('genres', 'cast__actor', 'cast__character')
-            .annotate()  # при желании можно аннотировать likes
+            .for_fields(fields, self.request.user)
             .distinct()
             .all()
         )
@@ -132,22 +141,55 @@ class MovieListCreateView(generics.ListCreateAPIView):
             return MovieCreateUpdateSerializer
         return MovieSerializer
 
+    @transaction.atomic
+    def perform_create(self, serializer):
+        # Фильм, его жанры и счётчики жанров/автора — в одной транзакции
+        serializer.save()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Анонимный просмотр каталога отдаём из кэша.
+        Ключ — нормализованная строка запроса + версия каталога,
+        версия поднимается сигналами при любом изменении (см. signals.py).
+        """
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        key = catalog_cache.make_cache_key(request)
+        data = catalog_cache.get_cached(key)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            catalog_cache.set_cached(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
 
 class MovieDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = (
-        Movie.objects
-        .select_related('author')
-        .prefetch_related('genres', 'cast__actor', 'cast__character')
-        .all()
-    )
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrReadOnly]
     lookup_field = 'slug'
 
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return Movie.objects.all()
+        fields = MovieDetailSerializer.get_requested_fields(self.request)
+        return Movie.objects.for_fields(fields, self.request.user).all()
+
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return MovieCreateUpdateSerializer
         return MovieDetailSerializer
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
@@ -189,11 +231,15 @@ class MovieActionsViewSet(viewsets.GenericViewSet):
         """
         Сохранение прогресса просмотра.
         ТРЕБУЕТ АКТИВНУЮ ПОДПИСКУ!
+
+        При PROGRESS_WRITE_BEHIND обычные heartbeat'ы копятся в буфере
+        (services/progress_buffer) и пишутся в БД периодической задачей;
+        через транзакцию идёт только heartbeat, завершающий просмотр.
         """
         movie = self.get_object()
         
         # Проверяем доступ к просмотру
-        can_watch, reason, meta = can_user_watch(request.user, movie)
+        can_watch, reason, meta = can_user_watch_cached(request.user, movie)
         
         if not can_watch:
             error_messages = {
@@ -214,11 +260,29 @@ class MovieActionsViewSet(viewsets.GenericViewSet):
 
         percent = 0 if duration == 0 else min(100, round(position * 100 / duration))
         finished = percent >= FINISH_THRESHOLD
+        write_behind = settings.PROGRESS_WRITE_BEHIND
+        trending.record_play(request.user.pk, movie.pk)
+
+        if write_behind and not finished:
+            entry = progress_buffer.record(
+                request.user.pk, movie.pk,
+                last_position_sec=position, duration_sec=duration, progress_percent=percent,
+            )
+            return Response({
+                'position_sec': entry['last_position_sec'],
+                'duration_sec': entry['duration_sec'],
+                'progress_percent': entry['progress_percent'],
+                'finished': entry['finished'],
+            })
 
         with transaction.atomic():
+            # finished=False явно: у модели default=True, и первая же запись
+            # считалась бы досмотренной без засчитанного просмотра
             obj, _ = Watched.objects.select_for_update().get_or_create(
-                user=request.user, movie=movie
+                user=request.user, movie=movie, defaults={'finished': False}
             )
+            if write_behind:
+                progress_buffer.merge(obj, progress_buffer.peek(request.user.pk, movie.pk))
 
             obj.last_position_sec = max(obj.last_position_sec, position)
             obj.duration_sec = max(obj.duration_sec, duration)
@@ -226,6 +290,9 @@ class MovieActionsViewSet(viewsets.GenericViewSet):
 
             if not obj.finished and finished:
                 obj.finished = True
+                obj.finished_at = timezone.now()
+                # Откат транзакции не должен засчитать досмотр
+                transaction.on_commit(lambda movie_id=movie.pk: trending.record(movie_id, 'finish'))
                 if movie and obj.last_position_sec >= MIN_WATCH_SECONDS_TO_COUNT_VIEW:
                     movie.increment_views()
 
@@ -234,8 +301,19 @@ class MovieActionsViewSet(viewsets.GenericViewSet):
                 'duration_sec',
                 'progress_percent',
                 'finished',
+                'finished_at',
+                'watched_at',  # auto_now обновляется, только если поле в update_fields
             ])
 
+        continue_watching.invalidate(request.user.pk)
+
+        if write_behind:
+            # Чтобы следующие heartbeat'ы этой сессии отвечали finished=True
+            progress_buffer.record(
+                request.user.pk, movie.pk, finished=obj.finished,
+                **{field: getattr(obj, field) for field in progress_buffer.FIELDS},
+            )
+
         return Response({
             'position_sec': obj.last_position_sec,
             'duration_sec': obj.duration_sec,
@@ -252,6 +330,66 @@ class MovieRefreshMetaView(APIView):
         compute_movie_duration.delay(movie.id) #type: ignore
         return Response({"status": "scheduled"}, status=status.HTTP_202_ACCEPTED)
 
+class CatalogSearchView(APIView):
+    """
+    Полнотекстовый поиск по каталогу (BM25 по индексу в памяти).
+    GET /api/v1/movies/search/?q=...&type=movie,actor&limit=20
+    """
+    permission_classes = [permissions.AllowAny]
+    MAX_LIMIT = 50
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'Query parameter "q" is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = {
+            kind.strip() for kind in request.query_params.get('type', '').split(',')
+            if kind.strip() in search_index.KINDS
+        }
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        results = search_index.search(query, kinds=kinds or None, limit=limit)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+
+class SuggestView(APIView):
+    """
+    Подсказки для строки поиска: префикс + небольшие опечатки, сортировка по просмотрам.
+    GET /api/v1/movies/suggest/?q=...&limit=8
+    """
+    permission_classes = [permissions.AllowAny]
+    MAX_LIMIT = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'query': query, 'results': []})
+
+        try:
+            limit = int(request.query_params.get('limit', 8))
+        except ValueError:
+            limit = 8
+        limit = max(1, min(limit, self.MAX_LIMIT))
+
+        return Response({'query': query, 'results': suggest_index.suggest(query, limit=limit)})
+
+
+class CatalogCacheStatsView(APIView):
+    """Счётчики кэша каталога (hits/misses) — для подбора TTL и размера кэша"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(catalog_cache.get_stats())
+
+    def delete(self, request):
+        catalog_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # ===== Casting endpoints =====
 
 class CastingViewSet(viewsets.ModelViewSet):
@@ -262,6 +400,7 @@ class CastingViewSet(viewsets.ModelViewSet):
     - DELETE /movies/<slug>/cast/<pk>/   -> удалить запись каста
     """
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAdminOrReadOnly]
+    pagination_class = None  # каст одного фильма ограничен, отдаём целиком по credit_order
 
     def get_queryset(self):
         movie_slug = self.kwargs.get('slug')
@@ -277,11 +416,16 @@ class CastingViewSet(viewsets.ModelViewSet):
             return CastingCreateSerializer
         return CastingSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         movie_slug = self.kwargs.get('slug')
         movie = generics.get_object_or_404(Movie, slug=movie_slug)
         serializer.save(movie=movie)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+
 
 class MyWatchedMoviesView(generics.ListAPIView):
     """ API endpoint для списка просмотренных фильмов пользователя """
@@ -297,10 +441,172 @@ class MyWatchedMoviesView(generics.ListAPIView):
                      .values_list('movie_id', flat=True))
 
 
+        fields = MovieSerializer.get_requested_fields(self.request)
         return (
             Movie.objects
             .filter(id__in = movie_ids)
-            .select_related('author')
-            .prefetch_related('genres')
+            .for_fields(fields, user)
             .all()
-            )
\ No newline at end of file
+            )
+
+
+class ContinueWatchingView(APIView):
+    """
+    Недосмотренные фильмы текущего пользователя с позицией для продолжения.
+    GET /api/v1/movies/me/continue/?limit=20
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 20
+        limit = max(1, min(limit, continue_watching.MAX_ITEMS))
+
+        items = continue_watching.get_items(request.user.pk, limit=limit)
+        return Response({'count': len(items), 'results': items})
+
+
+# ===== Рекомендации =====
+
+def _limit_param(request, default=20, maximum=50, name='limit'):
+    try:
+        limit = int(request.query_params.get(name, default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+class BecauseYouWatchedView(APIView):
+    """
+    Фильмы, которые смотрят вместе с этим (предрасчитанные item-item соседи).
+    GET /api/v1/movies/movies/<slug>/because-you-watched/?limit=20&fields=...
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, slug):
+        movie = get_object_or_404(Movie, slug=slug)
+        fields = MovieSerializer.get_requested_fields(request)
+        movies = similarity.neighbours(
+            movie, Movie.objects.for_fields(fields, request.user), limit=_limit_param(request)
+        )
+        serializer = MovieSerializer(movies, many=True, context={'request': request})
+        return Response({'movie': movie.slug, 'results': serializer.data})
+
+
+class TrendingMoviesView(APIView):
+    """
+    «Сейчас в тренде»: топ из services/trending (одно чтение кэша + карточки фильмов).
+    GET /api/v1/movies/movies/trending/?limit=20&fields=...
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        scores = dict(trending.top(_limit_param(request)))
+        fields = MovieSerializer.get_requested_fields(request)
+        movies = similarity.in_order(list(scores), Movie.objects.for_fields(fields, request.user))
+        data = MovieSerializer(movies, many=True, context={'request': request}).data
+        for item, movie in zip(data, movies):
+            item['trending_score'] = scores[movie.pk]
+        return Response({'results': data})
+
+
+class SimilarMoviesView(APIView):
+    """
+    Похожие по составу фильмы (жанры, актёры, персонажи, автор): MinHash LSH.
+    GET /api/v1/movies/movies/<slug>/similar/?limit=12&fields=...
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, slug):
+        movie = get_object_or_404(Movie.objects.only('pk', 'slug'), slug=slug)
+        neighbours = minhash_index.similar(movie.pk, limit=_limit_param(request, default=12))
+        scores = dict(neighbours)
+
+        fields = MovieSerializer.get_requested_fields(request)
+        movies = similarity.in_order(list(scores), Movie.objects.for_fields(fields, request.user))
+        data = MovieSerializer(movies, many=True, context={'request': request}).data
+        for item, similar_movie in zip(data, movies):
+            item['similarity'] = round(scores[similar_movie.pk], 3)
+        return Response({'movie': movie.slug, 'results': data})
+
+
+class MyRecommendationsView(APIView):
+    """
+    Персональные рекомендации: соседи последних просмотренных/лайкнутых фильмов,
+    при холодном старте — по жанрам.
+    GET /api/v1/movies/me/recommendations/?limit=20&fields=...
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        fields = MovieSerializer.get_requested_fields(request)
+        movies = MovieAnalytics.get_user_recommendations(
+            request.user,
+            limit=_limit_param(request),
+            queryset=Movie.objects.for_fields(fields, request.user),
+        )
+        serializer = MovieSerializer(movies, many=True, context={'request': request})
+        return Response({'results': serializer.data})
+
+
+# ===== Аналитика =====
+
+class MovieStatsView(APIView):
+    """
+    Дневная статистика просмотров (только rollup MovieDailyStats).
+    GET /api/v1/movies/analytics/daily/?days=30&movie=<slug>&limit=10
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        days = _limit_param(request, default=30, maximum=366, name='days')
+        movie = None
+        if request.query_params.get('movie'):
+            movie = get_object_or_404(Movie, slug=request.query_params['movie'])
+
+        totals = [
+            {
+                'date': row['date'],
+                'views_started': row['views_started'],
+                'views_finished': row['views_finished'],
+                'unique_viewers': row['unique_viewers'],
+                'avg_completion': (
+                    round(row['completion_sum'] / row['views_started'], 1) if row['views_started'] else None
+                ),
+            }
+            for row in MovieAnalytics.get_daily_totals(days=days, movie=movie)
+        ]
+        popular = [
+            {
+                'id': m.id,  # type: ignore
+                'title': m.title,
+                'slug': m.slug,
+                'recent_views': m.recent_views,  # type: ignore
+                'completion_rate': round(m.completion_rate, 1) if m.completion_rate is not None else None,  # type: ignore
+            }
+            for m in MovieAnalytics.get_popular_movies(days=days, limit=_limit_param(request, default=10))
+        ]
+        return Response({'days': days, 'totals': totals, 'popular': popular})
+
+
+class UniqueViewersView(APIView):
+    """
+    Уникальные зрители фильма (или каталога) за N дней — по HyperLogLog-скетчам.
+    GET /api/v1/movies/analytics/unique-viewers/?days=30&movie=<slug>
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        days = _limit_param(request, default=30, maximum=366, name='days')
+        movie = None
+        if request.query_params.get('movie'):
+            movie = get_object_or_404(Movie, slug=request.query_params['movie'])
+
+        return Response({
+            'movie': movie.slug if movie else None,
+            'days': days,
+            'unique_viewers': MovieAnalytics.get_unique_viewers(days=days, movie=movie),
+            'relative_error': round(hll.STANDARD_ERROR, 4),
+        })
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payment', '0002_rename_proccessed_at_payment_processed_at_and_more'),
+        ('subscribe', '0003_subscriptionhistory_subscriptio_subscri_a673da_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='payments_user_id_b0b72b_idx'),
+        ),
+    ]
@@ -108,6 +108,7 @@ class Payment(models.Model):
             models.Index(fields=['stripe_payment_intent_id']),
             models.Index(fields=['stripe_session_id']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'created_at', 'id']),  # курсор истории платежей
         ]
 
     def __str__(self):
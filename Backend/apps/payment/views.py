@@ -23,6 +23,7 @@ from .serializers import (
 )
 from .services import StripeService, PaymentService, WebhookService
 from apps.subscribe.models import SubscriptionPlan
+from netflixBack.pagination import DefaultCursorPagination, OffsetPagination
 
 
 class PaymentListView(generics.ListAPIView):
@@ -251,6 +252,7 @@ class RefundListView(generics.ListAPIView):
     """Список возвратов для администраторов"""
     serializer_class = RefundSerializer
     permission_classes = [permissions.IsAdminUser]
+    pagination_class = OffsetPagination
     
     def get_queryset(self):
         return Refund.objects.all().select_related(
@@ -410,13 +412,12 @@ def user_payment_history(request):
     """История платежей пользователя"""
     payments = Payment.objects.filter(
         user=request.user
-    ).select_related('subscription', 'subscription__plan').order_by('-created_at')
-    
-    serializer = PaymentSerializer(payments, many=True)
-    return Response({
-        'count': payments.count(),
-        'results': serializer.data
-    })
+    ).select_related('subscription', 'subscription__plan')
+
+    paginator = DefaultCursorPagination()
+    page = paginator.paginate_queryset(payments, request)
+    serializer = PaymentSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['POST'])
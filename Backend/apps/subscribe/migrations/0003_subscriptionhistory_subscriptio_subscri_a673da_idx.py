@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribe', '0002_alter_subscription_stripe_subscription_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriptionhistory',
+            index=models.Index(fields=['subscription', 'created_at', 'id'], name='subscriptio_subscri_a673da_idx'),
+        ),
+    ]
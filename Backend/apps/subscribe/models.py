@@ -150,6 +150,9 @@ class SubscriptionHistory(models.Model):
         verbose_name = "Subscription History"
         verbose_name_plural = "Subscription Histories"
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=['subscription', 'created_at', 'id']),  # курсор истории подписки
+        ]
 
     def __str__(self):
         return f"User: {self.subscription.user.username} - Action: {self.action}"
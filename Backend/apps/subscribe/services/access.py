@@ -1,5 +1,8 @@
 from datetime import datetime, timezone
 
+from django.conf import settings
+from django.core.cache import cache
+
 def can_user_watch(user, movie) -> tuple[bool, str | None, dict]:
     """
     Единая точка бизнес-логики «можно смотреть?».
@@ -21,3 +24,22 @@ def can_user_watch(user, movie) -> tuple[bool, str | None, dict]:
 
 
     return True, None, {}
+
+
+def can_user_watch_cached(user, movie) -> tuple[bool, str | None, dict]:
+    """
+    can_user_watch для частых вызовов (heartbeat'ы плеера).
+    Кэшируем только разрешение и ненадолго: отказ (нет подписки) не должен
+    «залипать» после оплаты, а истёкшая подписка живёт максимум ACCESS_CACHE_SECONDS.
+    """
+    if not user.is_authenticated:
+        return False, "auth_required", {}
+
+    key = f"access:watch:{user.pk}"
+    if cache.get(key):
+        return True, None, {}
+
+    result = can_user_watch(user, movie)
+    if result[0]:
+        cache.set(key, 1, timeout=settings.ACCESS_CACHE_SECONDS)
+    return result
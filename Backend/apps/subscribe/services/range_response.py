@@ -0,0 +1,188 @@
+# apps/subscribe/services/range_response.py
+"""
+Отдача локального файла с поддержкой HTTP Range (STREAM_BACKEND=LOCAL).
+
+  Range: bytes=a-b / a- / -n      -> 206 с Content-Range;
+  несколько диапазонов             -> 206 multipart/byteranges (пересекающиеся склеиваются);
+  If-Range не совпал с ETag/датой  -> Range игнорируется, 200 целиком;
+  ни один диапазон не попал в файл -> 416 с Content-Range: bytes */size.
+
+Один диапазон отдаётся через FileResponse с файлом, сдвинутым на начало
+диапазона: если WSGI-сервер даёт wsgi.file_wrapper (gunicorn), байты идут
+через os.sendfile без копирования в Python, длина ограничена Content-Length.
+Без file_wrapper (runserver) читается блоками, но не дальше конца диапазона.
+"""
+import mimetypes
+import os
+import re
+import secrets
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+# Больше диапазонов в одном запросе не разбираем — отдаём файл целиком (как max_ranges в nginx)
+MAX_RANGES = 16
+BLOCK_SIZE = 64 * 1024
+
+_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def content_type_for(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def parse_range(header: str | None, size: int) -> list[tuple[int, int]] | None:
+    """
+    [(start, end), ...] включительно, отсортированные и склеенные.
+    None — заголовка нет или он некорректен (отдаём файл целиком);
+    RangeNotSatisfiable — ни один диапазон не пересекается с файлом.
+    """
+    if not header:
+        return None
+    unit, sep, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not sep:
+        return None
+    parts = [part for part in spec.split(',') if part.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        match = _SPEC.match(part)
+        if not match or not (match[1] or match[2]):
+            return None
+        first, last = match[1], match[2]
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+        elif int(last) > 0 and size > 0:
+            ranges.append((max(size - int(last), 0), size - 1))
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(value: str | None, *, etag: str, mtime: float) -> bool:
+    """If-Range: ETag сравнивается строго (слабый никогда не совпадает), дата — с точностью до секунды."""
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == int(mtime)
+
+
+class BoundedFile:
+    """Файл, открытый с позиции start, который читается не дальше length байт (fileno — для sendfile)."""
+
+    def __init__(self, path: str, start: int, length: int):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = length
+        self.name = path
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def _multipart(path: str, ranges, *, size: int, content_type: str, boundary: str):
+    """Части multipart/byteranges и общая длина тела (Content-Length известен заранее)."""
+    heads = [
+        f"--{boundary}\r\nContent-Type: {content_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n".encode()
+        for start, end in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode()
+    length = sum(len(head) + end - start + 1 + 2 for head, (start, end) in zip(heads, ranges)) + len(tail)
+
+    def body():
+        with open(path, 'rb') as f:
+            for head, (start, end) in zip(heads, ranges):
+                yield head
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(BLOCK_SIZE, remaining))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+                yield b'\r\n'
+        yield tail
+
+    return body, length
+
+
+def serve(request, path: str, *, content_type: str | None = None):
+    """Ответ на GET/HEAD к файлу path: 200, 206 или 416."""
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    content_type = content_type or content_type_for(path)
+    head = request.method == 'HEAD'
+
+    ranges = None
+    if if_range_matches(request.META.get('HTTP_IF_RANGE'), etag=etag, mtime=stat.st_mtime):
+        try:
+            ranges = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+
+    if not ranges:
+        if head:
+            response = HttpResponse(content_type=content_type)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response.block_size = BLOCK_SIZE
+        response['Content-Length'] = size
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
+        if head:
+            response = HttpResponse(status=206, content_type=content_type)
+        else:
+            response = FileResponse(BoundedFile(path, start, length), status=206, content_type=content_type)
+            response.block_size = BLOCK_SIZE
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        response['Content-Length'] = length
+    else:
+        boundary = secrets.token_hex(16)
+        body, length = _multipart(path, ranges, size=size, content_type=content_type, boundary=boundary)
+        multipart_type = f"multipart/byteranges; boundary={boundary}"
+        if head:
+            response = HttpResponse(status=206, content_type=multipart_type)
+        else:
+            response = StreamingHttpResponse(body(), status=206, content_type=multipart_type)
+        response['Content-Length'] = length
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
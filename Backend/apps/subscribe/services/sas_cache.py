@@ -0,0 +1,127 @@
+# apps/subscribe/services/sas_cache.py
+"""
+Кэш подписанных SAS-ссылок Azure (чтение одного blob'а).
+
+stream-link и refresh-stream-link дёргаются постоянно, а прокси HLS
+подписывает сотни сегментов на каждый плейлист. Подпись — HMAC-SHA256 по той же
+строке, что строит generate_blob_sas из SDK, но ключ аккаунта декодируется из
+base64 один раз на процесс, а готовый токен переиспользуется:
+
+  ключ кэша — (blob, TTL): разные классы ссылок (поток 15 мин, сегменты 6 ч) не смешиваются;
+  токен отдаётся повторно, пока до его истечения не меньше
+  min(SAS_MIN_REMAINING_SECONDS, TTL) — ни одна выданная ссылка не живёт меньше минимума.
+
+Срок округляется вверх до SAS_EXPIRY_STEP_SECONDS: подписи, сделанные в разных
+процессах в пределах шага, совпадают. Кэш и счётчики — в памяти процесса
+(сходить в Redis дороже, чем посчитать HMAC); get_stats() — по текущему процессу.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.conf import settings
+
+# Версия сервиса в sv=: строка подписи ниже соответствует ей
+SAS_VERSION = '2025-11-05'
+
+_lock = threading.Lock()
+_entries: 'OrderedDict[tuple, tuple[str, int]]' = OrderedDict()
+_stats = {'hits': 0, 'signed': 0, 'evicted': 0, 'sign_seconds': 0.0}
+
+
+@lru_cache(maxsize=4)
+def _decoded_key(account_key: str) -> bytes:
+    return base64.b64decode(account_key)
+
+
+def _format_expiry(expires: int) -> str:
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(expires))
+
+
+def sign(blob_name: str, expires: int, *, account_name: str, account_key: str, container: str,
+         version: str | None = None) -> str:
+    """SAS-токен только на чтение blob'а (как generate_blob_sas с permission='r', без start/ip/protocol)."""
+    version = version or SAS_VERSION
+    expiry = _format_expiry(expires)
+    string_to_sign = '\n'.join([
+        'r',                                             # sp
+        '',                                              # st
+        expiry,                                          # se
+        f"/blob/{account_name}/{container}/{blob_name}",
+        '',                                              # si
+        '',                                              # sip
+        '',                                              # spr
+        version,                                         # sv
+        'b',                                             # sr
+        '', '', '', '', '', '', '',                      # snapshot, ses, rscc, rscd, rsce, rscl, rsct
+    ])
+    digest = hmac.new(_decoded_key(account_key), string_to_sign.encode('utf-8'), hashlib.sha256).digest()
+    signature = base64.b64encode(digest).decode()
+    return f"se={quote(expiry)}&sp=r&sv={quote(version)}&sr=b&sig={quote(signature)}"
+
+
+def get_token(blob_name: str, ttl: int, *, now: int | None = None) -> tuple[str, int]:
+    """(SAS-токен, срок в epoch) — из кэша, если ещё живёт достаточно, иначе новая подпись."""
+    now = int(time.time()) if now is None else now
+    floor = min(settings.SAS_MIN_REMAINING_SECONDS, ttl)
+    # Ротация ключа или смена контейнера не должны отдавать старые токены
+    key = (settings.AZURE_ACCOUNT_NAME, settings.AZURE_MEDIA_CONTAINER, settings.AZURE_ACCOUNT_KEY, blob_name, ttl)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[1] - now >= floor:
+            _entries.move_to_end(key)
+            _stats['hits'] += 1
+            return entry
+
+    started = time.perf_counter()
+    step = max(settings.SAS_EXPIRY_STEP_SECONDS, 1)
+    expires = -(-(now + ttl) // step) * step
+    token = sign(
+        blob_name, expires,
+        account_name=settings.AZURE_ACCOUNT_NAME,
+        account_key=settings.AZURE_ACCOUNT_KEY,
+        container=settings.AZURE_MEDIA_CONTAINER,
+    )
+    elapsed = time.perf_counter() - started
+
+    with _lock:
+        _entries[key] = (token, expires)
+        _entries.move_to_end(key)
+        _stats['signed'] += 1
+        _stats['sign_seconds'] += elapsed
+        while len(_entries) > settings.SAS_CACHE_SIZE:
+            _entries.popitem(last=False)
+            _stats['evicted'] += 1
+    return token, expires
+
+
+def get_stats() -> dict:
+    """Счётчики текущего процесса: каждый воркер gunicorn/uvicorn держит свой кэш"""
+    with _lock:
+        lookups = _stats['hits'] + _stats['signed']
+        return {
+            **_stats,
+            'pid': os.getpid(),
+            'size': len(_entries),
+            'capacity': settings.SAS_CACHE_SIZE,
+            'hit_rate': round(_stats['hits'] / lookups, 4) if lookups else None,
+            'avg_sign_us': round(_stats['sign_seconds'] / _stats['signed'] * 1e6, 1) if _stats['signed'] else None,
+        }
+
+
+def reset_stats():
+    with _lock:
+        _stats.update(hits=0, signed=0, evicted=0, sign_seconds=0.0)
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+    reset_stats()
@@ -3,10 +3,10 @@ import hmac
 import base64
 import hashlib
 import time
-from datetime import datetime, timedelta
 from urllib.parse import urlencode, quote
 from django.conf import settings
-from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+
+from . import sas_cache
 
 
 def _now_epoch() -> int:
@@ -19,7 +19,8 @@ def generate_azure_sas_url(blob_name: str, *, expires_in: int | None = None) ->
     
     Args:
         blob_name: имя blob'а в контейнере (например, 'movies/videos/transformers.mp4')
-        expires_in: время жизни ссылки в секундах (по умолчанию из настроек)
+        expires_in: время жизни ссылки в секундах (по умолчанию из настроек); токен из кэша
+            может жить меньше, но не меньше SAS_MIN_REMAINING_SECONDS
     
     Returns:
         tuple: (signed_url, expiration_timestamp)
@@ -28,20 +29,10 @@ def generate_azure_sas_url(blob_name: str, *, expires_in: int | None = None) ->
         raise ValueError("Blob name cannot be empty")
     
     ttl = expires_in or settings.STREAM_URL_EXP_SECONDS
-    expiry_time = datetime.utcnow() + timedelta(seconds=ttl)
     
     try:
-        # Генерируем SAS токен с правами только на чтение
-        sas_token = generate_blob_sas(
-            account_name=settings.AZURE_ACCOUNT_NAME,
-            account_key=settings.AZURE_ACCOUNT_KEY,
-            container_name=settings.AZURE_MEDIA_CONTAINER,
-            blob_name=blob_name,
-            permission=BlobSasPermissions(read=True),
-            expiry=expiry_time,
-            # Опционально: ограничение по IP
-            # ip=user_ip if hasattr(settings, 'ENABLE_IP_RESTRICTION') and settings.ENABLE_IP_RESTRICTION else None
-        )
+        # SAS только на чтение; повторно отдаём ещё живой токен (services/sas_cache)
+        sas_token, expires_at = sas_cache.get_token(blob_name, ttl)
         
         # Формируем полный URL
         base_url = settings.AZURE_BLOB_BASE_URL.rstrip('/')
@@ -51,7 +42,7 @@ def generate_azure_sas_url(blob_name: str, *, expires_in: int | None = None) ->
         
         signed_url = f"{base_url}/{container}/{encoded_blob}?{sas_token}"
         
-        return signed_url, int(expiry_time.timestamp())
+        return signed_url, expires_at
     
     except Exception as e:
         # Логируем ошибку
@@ -61,10 +52,145 @@ def generate_azure_sas_url(blob_name: str, *, expires_in: int | None = None) ->
         raise
 
 
+def sign_storage_key(storage_key: str, *, expires_in: int | None = None) -> tuple[str, int]:
+    """Подписанная ссылка на произвольный ключ хранилища — бэкенд выбирается по STREAM_BACKEND."""
+    backend = (getattr(settings, 'STREAM_BACKEND', 'AZURE')).upper()
+    
+    if backend == 'AZURE':
+        return generate_azure_sas_url(storage_key, expires_in=expires_in)
+    elif backend == 'S3':
+        # Если в будущем захочешь добавить S3
+        return generate_s3_presigned_url(storage_key, expires_in=expires_in)
+    elif backend == 'LOCAL':
+        return generate_local_signed_url(storage_key, expires_in=expires_in)
+    else:
+        raise ValueError(f"Unsupported storage backend: {backend}")
+
+
+def hls_package(movie):
+    """
+    Готовый HLS-пакет фильма (MovieHlsPackage) или None — тогда отдаём исходный MP4.
+    Пакет от прежнего файла (видео заменили, новый ещё кодируется) не подходит.
+    """
+    if not getattr(settings, 'HLS_ENABLED', False):
+        return None
+    from apps.movies.models import MovieHlsPackage
+    from apps.movies.services.hls import package_prefix
+
+    try:
+        package = movie.hls
+    except MovieHlsPackage.DoesNotExist:
+        return None
+    if not package.is_ready or not movie.video:
+        return None
+    return package if package.prefix == package_prefix(movie.video.name, package.source_etag) else None
+
+
+def _signature(message: str) -> str:
+    digest = hmac.new(settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def _playback_signature(movie_id: int, expires: int) -> str:
+    return _signature(f"play:{movie_id}:{expires}")
+
+
+def _local_signature(storage_key: str, expires: int) -> str:
+    return _signature(f"file:{storage_key}:{expires}")
+
+
+def _verify(sign, subject, expires, signature) -> bool:
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < _now_epoch():
+        return False
+    return hmac.compare_digest(sign(subject, expires), signature or '')
+
+
+def playback_query(movie_id: int, expires: int) -> str:
+    """exp/sig для ссылок на плейлисты HLS и VTT превью: плеер не шлёт JWT, доступ проверяется подписью"""
+    return urlencode({'exp': expires, 'sig': _playback_signature(movie_id, expires)})
+
+
+def verify_playback_token(movie_id: int, expires, signature) -> bool:
+    return _verify(_playback_signature, movie_id, expires, signature)
+
+
+def generate_local_signed_url(storage_key: str, *, expires_in: int | None = None) -> tuple[str, int]:
+    """
+    Подписанная ссылка на файл локального хранилища (STREAM_BACKEND=LOCAL):
+    отдаёт subscribe.views.local_stream с поддержкой Range. Подпись — HMAC
+    по ключу и сроку, как у ссылок на плейлисты.
+    """
+    from django.urls import reverse
+
+    if not storage_key:
+        raise ValueError("Storage key cannot be empty")
+    expires = _now_epoch() + (expires_in or settings.STREAM_URL_EXP_SECONDS)
+    path = reverse('local-stream', kwargs={'path': storage_key})
+    base_url = getattr(settings, 'HLS_PROXY_BASE_URL', '').rstrip('/')
+    query = urlencode({'exp': expires, 'sig': _local_signature(storage_key, expires)})
+    return f"{base_url}{path}?{query}", expires
+
+
+def verify_local_token(storage_key: str, expires, signature) -> bool:
+    return _verify(_local_signature, storage_key, expires, signature)
+
+
+def generate_hls_manifest_url(movie, *, expires_in: int | None = None) -> tuple[str, int]:
+    """Ссылка на master.m3u8 через прокси плейлистов (subscribe.views.hls_playlist)."""
+    from django.urls import reverse
+
+    expires = _now_epoch() + (expires_in or settings.STREAM_URL_EXP_SECONDS)
+    path = reverse('hls-playlist', kwargs={'movie_id': movie.pk, 'path': 'master.m3u8'})
+    base_url = getattr(settings, 'HLS_PROXY_BASE_URL', '').rstrip('/')
+    return f"{base_url}{path}?{playback_query(movie.pk, expires)}", expires
+
+
+def generate_trickplay_info(movie, *, expires_in: int | None = None) -> dict | None:
+    """
+    Превью перемотки (MovieTrickplay) для ответа stream-link: раскладка листов,
+    подписанные ссылки на них и ссылка на VTT через прокси. None — превью ещё нет.
+    Ссылки живут весь просмотр (HLS_SEGMENT_URL_EXP_SECONDS), как и сегменты HLS.
+    """
+    if not getattr(settings, 'TRICKPLAY_ENABLED', False):
+        return None
+    from django.urls import reverse
+    from apps.movies.models import MovieTrickplay
+
+    try:
+        trickplay = movie.trickplay
+    except MovieTrickplay.DoesNotExist:
+        return None
+    if not trickplay.is_ready:
+        return None
+
+    ttl = expires_in or settings.HLS_SEGMENT_URL_EXP_SECONDS
+    expires = _now_epoch() + ttl
+    base_url = getattr(settings, 'HLS_PROXY_BASE_URL', '').rstrip('/')
+    return {
+        'vtt': f"{base_url}{reverse('trickplay-vtt', kwargs={'movie_id': movie.pk})}?{playback_query(movie.pk, expires)}",
+        'interval_sec': trickplay.interval_sec,
+        'tile_width': trickplay.tile_width,
+        'tile_height': trickplay.tile_height,
+        'columns': trickplay.columns,
+        'rows': trickplay.rows,
+        'frames': trickplay.frames,
+        'sheets': [sign_storage_key(trickplay.prefix + name, expires_in=ttl)[0] for name in trickplay.sheets],
+    }
+
+
+def stream_format(movie) -> str:
+    return 'hls' if hls_package(movie) else 'mp4'
+
+
 def generate_signed_url_for_movie(movie, *, expires_in: int | None = None) -> tuple[str, int]:
     """
     Универсальная функция для генерации подписанных URL для видео.
-    Автоматически выбирает бэкенд на основе настроек.
+    Если HLS-лесенка фильма готова — ссылка на master-плейлист,
+    иначе на исходный файл; бэкенд выбирается на основе настроек.
     
     Args:
         movie: объект Movie с полем video (FileField)
@@ -76,6 +202,9 @@ def generate_signed_url_for_movie(movie, *, expires_in: int | None = None) -> tu
     if not movie.video:
         raise ValueError("Movie has no video file attached")
     
+    if hls_package(movie):
+        return generate_hls_manifest_url(movie, expires_in=expires_in)
+    
     # Получаем имя файла в хранилище
     # Для Azure Storage это будет путь внутри контейнера
     storage_key = movie.video.name
@@ -83,15 +212,7 @@ def generate_signed_url_for_movie(movie, *, expires_in: int | None = None) -> tu
     if not storage_key:
         raise ValueError("Movie video file has no storage key")
     
-    backend = (getattr(settings, 'STREAM_BACKEND', 'AZURE')).upper()
-    
-    if backend == 'AZURE':
-        return generate_azure_sas_url(storage_key, expires_in=expires_in)
-    elif backend == 'S3':
-        # Если в будущем захочешь добавить S3
-        return generate_s3_presigned_url(storage_key, expires_in=expires_in)
-    else:
-        raise ValueError(f"Unsupported storage backend: {backend}")
+    return sign_storage_key(storage_key, expires_in=expires_in)
 
 
 def generate_s3_presigned_url(key: str, *, expires_in: int | None = None) -> tuple[str, int]:
@@ -1,3 +1,162 @@
-from django.test import TestCase
+import base64
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from azure.storage.blob import BlobSasPermissions, generate_blob_sas
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.movies.tests import LocalMediaMixin
+
+from .services import sas_cache
+from .services.range_response import RangeNotSatisfiable, parse_range
+from .services.signed_urls import generate_azure_sas_url, sign_storage_key
+
+User = get_user_model()
+
+ACCOUNT_KEY = base64.b64encode(b"k" * 64).decode()
+
+
+@override_settings(
+    AZURE_ACCOUNT_NAME="acct", AZURE_ACCOUNT_KEY=ACCOUNT_KEY, AZURE_MEDIA_CONTAINER="media",
+    AZURE_BLOB_BASE_URL="https://acct.blob.core.windows.net",
+    SAS_MIN_REMAINING_SECONDS=600, SAS_EXPIRY_STEP_SECONDS=60, SAS_CACHE_SIZE=2,
+)
+class SasCacheTest(TestCase):
+    """Кэш SAS-подписей: совпадение с SDK, повторное использование и минимальный остаток жизни"""
+
+    def setUp(self):
+        sas_cache.clear()
+
+    def test_signature_matches_sdk(self):
+        expires = 1_900_000_000
+        sdk = generate_blob_sas(
+            account_name="acct", account_key=ACCOUNT_KEY, container_name="media",
+            blob_name="movies/videos/a b.mp4", permission=BlobSasPermissions(read=True),
+            expiry=datetime.fromtimestamp(expires, timezone.utc),
+        )
+        ours = sas_cache.sign(
+            "movies/videos/a b.mp4", expires, account_name="acct", account_key=ACCOUNT_KEY, container="media",
+            version=parse_qs(sdk)["sv"][0],
+        )
+        self.assertEqual(ours, sdk)
+
+    def test_token_reused_until_min_remaining(self):
+        now = 1_800_000_010
+        token, expires = sas_cache.get_token("a.mp4", 900, now=now)
+        self.assertEqual(expires, 1_800_000_960)  # округление вверх до минуты
+
+        self.assertEqual(sas_cache.get_token("a.mp4", 900, now=expires - 600), (token, expires))
+        fresh, fresh_expires = sas_cache.get_token("a.mp4", 900, now=expires - 599)
+        self.assertNotEqual(fresh, token)
+        self.assertGreaterEqual(fresh_expires - (expires - 599), 900)
+
+        # Другой TTL — отдельная запись
+        self.assertNotEqual(sas_cache.get_token("a.mp4", 6 * 3600, now=now)[1], fresh_expires)
+        stats = sas_cache.get_stats()
+        self.assertEqual((stats["hits"], stats["signed"], stats["size"]), (1, 3, 2))
+
+        sas_cache.get_token("b.mp4", 900, now=now)
+        self.assertEqual(sas_cache.get_stats()["evicted"], 1)
+
+    def test_handed_out_tokens_keep_min_lifetime(self):
+        for ttl, floor in ((900, 600), (120, 120)):
+            for now in range(1_800_000_000, 1_800_003_000, 7):
+                _, expires = sas_cache.get_token("a.mp4", ttl, now=now)
+                self.assertGreaterEqual(expires - now, floor)
+        self.assertGreater(sas_cache.get_stats()["hit_rate"], 0.5)
+
+    def test_stream_url_and_admin_stats(self):
+        url, _ = generate_azure_sas_url("movies/videos/film.mp4")
+        self.assertTrue(url.startswith("https://acct.blob.core.windows.net/media/movies/videos/film.mp4?se="))
+        self.assertEqual(generate_azure_sas_url("movies/videos/film.mp4")[0], url)
+
+        admin = User.objects.create_user(username="admin", email="admin@example.com", password="x", is_staff=True)
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get("/api/v1/subscribe/signing/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["hits"], response.json()["signed"]), (1, 1))
+
+        client.force_authenticate(User.objects.create_user(username="viewer", email="viewer@example.com", password="x"))
+        self.assertEqual(client.get("/api/v1/subscribe/signing/stats/").status_code, 403)
+
+
+class LocalStreamTest(LocalMediaMixin, TestCase):
+    """STREAM_BACKEND=LOCAL: подписанные ссылки на файлы и ответы на Range"""
+
+    def setUp(self):
+        self.use_local_media(STREAM_BACKEND="LOCAL", STREAM_LOCAL_OFFLOAD="", HLS_PROXY_BASE_URL="")
+        self.data = bytes(range(256)) * 4
+        self.write_media("movies/videos/a b.mp4", self.data)
+        self.url, _ = sign_storage_key("movies/videos/a b.mp4")
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, headers=headers)
+        return response, b"".join(response.streaming_content) if response.streaming else response.content
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), [(0, 9)])
+        self.assertEqual(parse_range("bytes=90-", 100), [(90, 99)])
+        self.assertEqual(parse_range("bytes=-10", 100), [(90, 99)])
+        self.assertEqual(parse_range("bytes=50-200", 100), [(50, 99)])
+        self.assertEqual(parse_range("bytes=20-29, 0-9,5-14, 100-", 100), [(0, 14), (20, 29)])
+        for header in ("items=0-1", "bytes=", "bytes=abc", "bytes=9-0", "bytes=-", ",".join(["bytes=0-0"] * 17)):
+            self.assertIsNone(parse_range(header, 100), header)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=100-,-0", 100)
+
+    def test_signed_url_and_single_range(self):
+        self.assertTrue(self.url.startswith("/api/v1/subscribe/stream/movies/videos/a%20b.mp4?exp="))
+
+        response, body = self.get()
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual((response["Accept-Ranges"], response["Content-Type"]), ("bytes", "video/mp4"))
+
+        response, body = self.get(Range="bytes=100-199")
+        self.assertEqual((response.status_code, body), (206, self.data[100:200]))
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.data)}")
+        self.assertEqual(response["Content-Length"], "100")
+
+        response, body = self.get(Range="bytes=-24")
+        self.assertEqual((response.status_code, body), (206, self.data[-24:]))
+
+        response = self.client.head(self.url, headers={"Range": "bytes=0-9"})
+        self.assertEqual((response.status_code, response["Content-Length"], response.content), (206, "10", b""))
+
+    def test_multi_range_if_range_and_416(self):
+        response, body = self.get(Range="bytes=0-3,10-13")
+        self.assertEqual(response.status_code, 206)
+        boundary = response["Content-Type"].split("boundary=")[1]
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        parts = body.split(f"--{boundary}".encode())
+        self.assertEqual(parts[-1], b"--\r\n")
+        self.assertIn(f"Content-Range: bytes 10-13/{len(self.data)}".encode(), parts[2])
+        self.assertTrue(parts[1].endswith(b"\r\n\r\n" + self.data[0:4] + b"\r\n"))
+
+        etag = self.get()[0]["ETag"]
+        self.assertEqual(self.get(Range="bytes=0-9", If_Range=etag)[0].status_code, 206)
+        response, body = self.get(Range="bytes=0-9", If_Range='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+        response, _ = self.get(Range=f"bytes={len(self.data)}-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, f"bytes */{len(self.data)}"))
+
+    def test_signature_traversal_and_offload(self):
+        path, query = urlsplit(self.url)[2:4]
+        self.assertEqual(self.get(f"{path}?{query}x")[0].status_code, 403)
+        self.assertEqual(self.get(f"{path.replace('a%20b', 'other')}?{query}")[0].status_code, 403)
+        with override_settings(STREAM_URL_EXP_SECONDS=-1):
+            self.assertEqual(self.get(sign_storage_key("movies/videos/a b.mp4")[0])[0].status_code, 403)
+
+        self.assertEqual(self.get(sign_storage_key("../secret.txt")[0])[0].status_code, 404)
+        self.assertEqual(self.get(sign_storage_key("movies/videos/missing.mp4")[0])[0].status_code, 404)
+
+        with override_settings(STREAM_LOCAL_OFFLOAD="nginx", STREAM_LOCAL_ACCEL_PREFIX="/protected-media/"):
+            response, body = self.get(Range="bytes=0-9")
+        self.assertEqual((response.status_code, body), (200, b""))
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/movies/videos/a%20b.mp4")
+
+        with override_settings(STREAM_BACKEND="AZURE"):
+            self.assertEqual(self.get()[0].status_code, 404)
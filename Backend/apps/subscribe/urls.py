@@ -15,5 +15,11 @@ urlpatterns = [
     
     path('movies/<slug:slug>/stream-link/', views.MovieWatchView.as_view(), name='movie-stream-link'),
     path('movies/<slug:slug>/refresh-stream-link/', views.refresh_stream_link, name='refresh-stream-link'),
+    # Плейлисты HLS с подписанными ссылками на сегменты (доступ по exp/sig из stream-link)
+    path('hls/<int:movie_id>/<path:path>', views.hls_playlist, name='hls-playlist'),
+    path('trickplay/<int:movie_id>/thumbnails.vtt', views.trickplay_vtt, name='trickplay-vtt'),
+    # Локальное хранилище (STREAM_BACKEND=LOCAL): файлы по подписанным ссылкам, с Range
+    path('stream/<path:path>', views.local_stream, name='local-stream'),
+    path('signing/stats/', views.SigningCacheStatsView.as_view(), name='signing-cache-stats'),
     
 ]
@@ -1,13 +1,22 @@
 import logging
+import math
+import os
+from urllib.parse import quote
+
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.throttling import UserRateThrottle
 
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.db import transaction
+from django.views.decorators.http import require_GET, require_http_methods
 
 from .models import SubscriptionPlan, Subscription, SubscriptionHistory
 from .serializers import (
@@ -19,9 +28,20 @@ from .serializers import (
     WatchMovieSerializer,
 )
 
-from apps.movies.models import Movie
+from apps.accounts.models import Watched
+from apps.movies.models import Movie, MovieHlsPackage, MovieMediaInfo, MovieTrickplay
+from apps.movies.services import hls, progress_buffer, trickplay
+from .services import range_response, sas_cache
 from .services.access import can_user_watch
-from .services.signed_urls import generate_signed_url_for_movie
+from .services.signed_urls import (
+    generate_signed_url_for_movie,
+    generate_trickplay_info,
+    playback_query,
+    sign_storage_key,
+    stream_format,
+    verify_local_token,
+    verify_playback_token,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +50,7 @@ class SubscriptionPlanListView(generics.ListAPIView):
     queryset = SubscriptionPlan.objects.filter(is_active=True)
     serializer_class = SubscriptionPlanSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = None  # планов единицы, порядок — по цене
 
 
 class SubscriptionPlanDetailView(generics.RetrieveAPIView):
@@ -98,12 +119,26 @@ class MovieWatchView(APIView):
         Response:
         {
             "url": "https://...blob.core.windows.net/media/movies/video.mp4?sas_token...",
+            "format": "mp4",  # или "hls" — тогда url ведёт на master.m3u8
             "expires_at": 1234567890,
             "expires_in": 900,
             "movie": {
                 "id": 1,
                 "title": "Movie Title",
                 "slug": "movie-title"
+            },
+            "trickplay": {  # или null — превью для перемотки
+                "vtt": "/api/v1/subscribe/trickplay/1/thumbnails.vtt?exp=...&sig=...",
+                "interval_sec": 10, "tile_width": 240, "tile_height": 136,
+                "columns": 10, "rows": 10, "frames": 540,
+                "sheets": ["https://...blob.core.windows.net/media/movies/videos/movie/trickplay/.../sheet_0001.jpg?sas..."]
+            },
+            "resume": {  # или null
+                "position_sec": 1834.0,
+                "keyframe_sec": 1832.0,
+                "byte_offset": 734003200,
+                "range": "bytes=734003200-",
+                "header_range": "bytes=32-1048607"
             }
         }
         """
@@ -140,6 +175,7 @@ class MovieWatchView(APIView):
         try:
             # Генерируем подписанную ссылку
             signed_url, expires_at = generate_signed_url_for_movie(movie)
+            fmt = stream_format(movie)
             
             # Логируем запрос  
             logger.info(
@@ -150,6 +186,7 @@ class MovieWatchView(APIView):
          
             return Response({
                 'url': signed_url,
+                'format': fmt,
                 'expires_at': expires_at,
                 'expires_in': expires_at - int(timezone.now().timestamp()),
                 'movie': {
@@ -157,6 +194,8 @@ class MovieWatchView(APIView):
                     'title': movie.title,
                     'slug': movie.slug,
                 },
+                'resume': self._resume(request, movie, fmt),
+                'trickplay': generate_trickplay_info(movie),
                 'meta': meta
             }, status=status.HTTP_200_OK)
         
@@ -175,6 +214,37 @@ class MovieWatchView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+    def _resume(self, request, movie, fmt: str):
+        """
+        Байтовое смещение ключевого кадра для возобновления (MovieMediaInfo.seek_index):
+        позиция из ?t=<сек>, иначе Watched.last_position_sec с учётом ещё не сброшенных
+        heartbeat'ов (progress_buffer). None — начинать с начала.
+        Для HLS байтовые диапазоны MP4 к ссылке не относятся — только позиция и ключевой кадр.
+        """
+        position = request.query_params.get('t')
+        if position is None:
+            watched = (
+                Watched.objects.filter(user=request.user, movie=movie, finished=False)
+                .values_list('last_position_sec', flat=True).first()
+            )
+            position = watched or 0
+            entry = progress_buffer.peek(request.user.pk, movie.pk) if settings.PROGRESS_WRITE_BEHIND else None
+            if entry and not entry.get('finished'):
+                position = max(position, entry['last_position_sec'])
+        try:
+            position = max(float(position), 0.0)
+        except ValueError:
+            return None
+        if not position or not math.isfinite(position):
+            return None
+
+        info = MovieMediaInfo.objects.filter(movie=movie).only('seek_index').first()
+        seek = info.seek(position) if info else None
+        if fmt == 'hls':
+            return {'position_sec': position, 'keyframe_sec': seek['keyframe_sec'] if seek else None}
+        return seek
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def refresh_stream_link(request, slug: str):
@@ -204,6 +274,7 @@ def refresh_stream_link(request, slug: str):
         
         return Response({
             'url': signed_url,
+            'format': stream_format(movie),
             'expires_at': expires_at,
             'expires_in': expires_at - int(timezone.now().timestamp()),
         }, status=status.HTTP_200_OK)
@@ -215,6 +286,116 @@ def refresh_stream_link(request, slug: str):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class SigningCacheStatsView(APIView):
+    """Счётчики кэша SAS-подписей (services/sas_cache) текущего процесса — hits/подписи/вытеснения"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(sas_cache.get_stats())
+
+    def delete(self, request):
+        sas_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@require_GET
+def hls_playlist(request, movie_id: int, path: str):
+    """
+    GET /api/v1/subscribe/hls/{movie_id}/{path}?exp=...&sig=...
+
+    Прокси плейлистов HLS: контейнер приватный, поэтому ссылки на сегменты
+    подписываются на лету (HLS_SEGMENT_URL_EXP_SECONDS — на весь просмотр),
+    а вложенные плейлисты получают те же exp/sig. Доступ уже проверен
+    при выдаче stream-link, здесь проверяется только подпись.
+    """
+    expires, signature = request.GET.get('exp'), request.GET.get('sig')
+    if not verify_playback_token(movie_id, expires, signature):
+        return HttpResponseForbidden('Invalid or expired link')
+
+    package = MovieHlsPackage.objects.filter(movie_id=movie_id, status='ready').first()
+    if package is None:
+        raise Http404('No HLS package')
+
+    if path == hls.MASTER:
+        key, base = package.master_key, package.prefix
+    else:
+        rendition = package.renditions.filter(status='ready', playlist_key=package.prefix + path).first()
+        if rendition is None:
+            raise Http404('No such playlist')
+        key, base = rendition.playlist_key, rendition.playlist_key.rsplit('/', 1)[0] + '/'
+
+    # Вложенные плейлисты плеер может запросить в любой момент просмотра (переключение ступени)
+    playlist_expires = int(timezone.now().timestamp()) + settings.HLS_SEGMENT_URL_EXP_SECONDS
+    query = playback_query(movie_id, max(int(expires), playlist_expires))
+    body = hls.rewrite_playlist(
+        hls.read_playlist(key),
+        playlist=lambda uri: f"{uri}?{query}",
+        segment=lambda uri: sign_storage_key(base + uri, expires_in=settings.HLS_SEGMENT_URL_EXP_SECONDS)[0],
+    )
+    response = HttpResponse(body, content_type='application/vnd.apple.mpegurl')
+    response['Cache-Control'] = 'private, no-store'  # внутри — подписанные ссылки
+    return response
+
+
+@require_GET
+def trickplay_vtt(request, movie_id: int):
+    """
+    GET /api/v1/subscribe/trickplay/{movie_id}/thumbnails.vtt?exp=...&sig=...
+
+    WebVTT превью перемотки с подписанными ссылками на листы (фрагмент #xywh сохраняется).
+    """
+    expires, signature = request.GET.get('exp'), request.GET.get('sig')
+    if not verify_playback_token(movie_id, expires, signature):
+        return HttpResponseForbidden('Invalid or expired link')
+
+    preview = MovieTrickplay.objects.filter(movie_id=movie_id, status='ready').first()
+    if preview is None or not preview.vtt_key:
+        raise Http404('No trickplay')
+
+    ttl = max(int(expires) - int(timezone.now().timestamp()), 60)
+    body = trickplay.rewrite_vtt(
+        hls.read_playlist(preview.vtt_key),
+        lambda uri: sign_storage_key(preview.prefix + uri, expires_in=ttl)[0],
+    )
+    response = HttpResponse(body, content_type='text/vtt; charset=utf-8')
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@require_http_methods(['GET', 'HEAD'])
+def local_stream(request, path: str):
+    """
+    GET /api/v1/subscribe/stream/{key}?exp=...&sig=...
+
+    Файл локального хранилища (STREAM_BACKEND=LOCAL) по подписанной ссылке:
+    Range/If-Range, 206/416. С STREAM_LOCAL_OFFLOAD сами байты отдаёт
+    фронтовый прокси (X-Accel-Redirect / X-Sendfile), Django только проверяет подпись.
+    """
+    if settings.STREAM_BACKEND.upper() != 'LOCAL':
+        raise Http404('Local streaming is disabled')
+    if not verify_local_token(path, request.GET.get('exp'), request.GET.get('sig')):
+        return HttpResponseForbidden('Invalid or expired link')
+
+    try:
+        file_path = default_storage.path(path)
+    except (NotImplementedError, SuspiciousFileOperation):
+        raise Http404('No such file')
+    if not os.path.isfile(file_path):
+        raise Http404('No such file')
+
+    offload = settings.STREAM_LOCAL_OFFLOAD.lower()
+    if offload == 'nginx':
+        response = HttpResponse(content_type=range_response.content_type_for(file_path))
+        response['X-Accel-Redirect'] = settings.STREAM_LOCAL_ACCEL_PREFIX.rstrip('/') + '/' + quote(path)
+    elif offload == 'apache':
+        response = HttpResponse(content_type=range_response.content_type_for(file_path))
+        response['X-Sendfile'] = file_path
+    else:
+        response = range_response.serve(request, file_path)
+    response['Cache-Control'] = 'private'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def subscription_status(request):
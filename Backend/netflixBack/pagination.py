@@ -0,0 +1,127 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination, _reverse_ordering
+
+
+class OffsetPagination(LimitOffsetPagination):
+    """
+    Классическая limit/offset пагинация (с общим count) —
+    подключается явно во вьюхах для админских интерфейсов.
+    """
+    default_limit = 50
+    max_limit = 500
+
+
+class DefaultCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация по умолчанию для всех списков.
+
+    Курсор — пара (поле сортировки, id), следующая страница —
+    WHERE поле < x OR (поле = x AND id < y) ORDER BY поле, id LIMIT n
+    по составному индексу (поле, id): стоимость не зависит от номера страницы.
+    Порядок берётся из OrderingFilter вьюхи (если он есть), иначе -created_at.
+
+    Курсор держится только на полях из KEYSET_FIELDS — они не меняются сами
+    по себе. views меняется только периодическим сбросом счётчика просмотров
+    (services/view_counter), а не на каждый просмотр. Прочие счётчики меняются
+    между запросами, и строки перескакивали бы через границу страницы; для таких
+    порядков (и для сортировки по нескольким полям) — limit/offset, как в OffsetPagination.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
+
+    KEYSET_FIELDS = frozenset({'created_at', 'year', 'title', 'name', 'views'})
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+
+        # Добиваем порядок уникальным id: он второй половиной входит в курсор
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            tiebreaker = '-id' if ordering[0].startswith('-') else 'id'
+            ordering = (*ordering, tiebreaker)
+        return ordering
+
+    def _is_keyset(self, ordering) -> bool:
+        field, tiebreaker = ordering[0], ordering[-1]
+        return (
+            len(ordering) == 2
+            and field.lstrip('-') in self.KEYSET_FIELDS
+            and tiebreaker.lstrip('-') in ('id', 'pk')
+            and field.startswith('-') == tiebreaker.startswith('-')
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        ordering = self.get_ordering(request, queryset, view)
+        if not self._is_keyset(ordering):
+            self.fallback = LimitOffsetPagination()
+            self.fallback.default_limit = self.get_page_size(request)
+            self.fallback.max_limit = self.max_page_size
+            return self.fallback.paginate_queryset(queryset.order_by(*ordering), request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = ordering
+        self.cursor = self.decode_cursor(request)
+        # Позиция уникальна, поэтому смещение внутри равных значений не нужно
+        reverse, current_position = (False, None) if self.cursor is None else self.cursor[1:]
+
+        queryset = queryset.order_by(*(_reverse_ordering(ordering) if reverse else ordering))
+        if current_position is not None:
+            value, pk = self._decode_position(current_position)
+            attr = ordering[0].lstrip('-')
+            lookup = 'lt' if reverse != ordering[0].startswith('-') else 'gt'
+            queryset = queryset.filter(
+                Q(**{f"{attr}__{lookup}": value}) | Q(**{attr: value, f"pk__{lookup}": pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = (
+            self._get_position_from_instance(results[-1], ordering) if len(results) > len(self.page) else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = current_position is not None, following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next, self.has_previous = following_position is not None, current_position is not None
+            self.next_position, self.previous_position = following_position, current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        field = ordering[0].lstrip('-')
+        value = instance[field] if isinstance(instance, dict) else getattr(instance, field)
+        pk = instance['id'] if isinstance(instance, dict) else instance.pk
+        return json.dumps([str(value), pk], ensure_ascii=False)
+
+    def _decode_position(self, position):
+        try:
+            value, pk = json.loads(position)
+            return value, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    # --- limit/offset для изменчивых порядков ---
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.fallback is not None:
+            return self.fallback.get_html_context()
+        return super().get_html_context()
@@ -93,6 +93,89 @@ DATABASES = {
 }
 
 
+# Кэш: Redis в проде, локальная память процесса для разработки и тестов
+REDIS_CACHE_URL = config("REDIS_CACHE_URL", default="")
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# TTL закэшированных страниц каталога (инвалидация — по версии каталога)
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", cast=int, default=300)
+# Как часто индекс подсказок перечитывает веса (просмотры) из БД — в фоне, запросы обслуживает текущий
+SUGGEST_REFRESH_SECONDS = config("SUGGEST_REFRESH_SECONDS", cast=int, default=600)
+
+# Прогресс просмотра: heartbeat'ы копятся в кэше и пишутся в БД задачей movies.flush_progress.
+# Имеет смысл только с общим кэшем (Redis) — LocMemCache у каждого процесса свой.
+PROGRESS_WRITE_BEHIND = config("PROGRESS_WRITE_BEHIND", cast=bool, default=False)
+# Сколько соседей на фильм хранит item-item матрица (movies.build_similarity)
+SIMILARITY_TOP_K = config("SIMILARITY_TOP_K", cast=int, default=30)
+# Implicit ALS для персональной ленты (movies.train_als): факторы в .npy, открываются через mmap
+ALS_MODEL_DIR = config("ALS_MODEL_DIR", default=str(BASE_DIR / "var" / "als"))
+ALS_FACTORS = config("ALS_FACTORS", cast=int, default=64)
+ALS_ITERATIONS = config("ALS_ITERATIONS", cast=int, default=10)
+ALS_REGULARIZATION = config("ALS_REGULARIZATION", cast=float, default=0.1)
+ALS_ALPHA = config("ALS_ALPHA", cast=float, default=40.0)
+# Сколько секунд помним, что у пользователя есть доступ к просмотру
+ACCESS_CACHE_SECONDS = config("ACCESS_CACHE_SECONDS", cast=int, default=30)
+# Пакетная проба видео (services/media_info.probe_many): сколько ffprobe одновременно и таймаут одного
+MEDIA_PROBE_CONCURRENCY = config("MEDIA_PROBE_CONCURRENCY", cast=int, default=16)
+MEDIA_PROBE_TIMEOUT = config("MEDIA_PROBE_TIMEOUT", cast=int, default=120)
+# «Сейчас в тренде» (movies.refresh_trending): часовые кольца за окно и период полураспада веса
+# Счётчики пишет веб-процесс, а сводит задача Celery — нужен общий кэш (Redis): с LocMemCache тренд всегда пуст
+TRENDING_WINDOW_HOURS = config("TRENDING_WINDOW_HOURS", cast=int, default=72)
+TRENDING_HALF_LIFE_HOURS = config("TRENDING_HALF_LIFE_HOURS", cast=float, default=12.0)
+TRENDING_START_WEIGHT = config("TRENDING_START_WEIGHT", cast=float, default=1.0)
+TRENDING_FINISH_WEIGHT = config("TRENDING_FINISH_WEIGHT", cast=float, default=2.0)
+TRENDING_TOP_N = config("TRENDING_TOP_N", cast=int, default=100)
+# Пауза дольше этого — следующий heartbeat считается новым запуском
+TRENDING_SESSION_SECONDS = config("TRENDING_SESSION_SECONDS", cast=int, default=60 * 60)
+# Ремукс MP4 с moov в конце (movies.ensure_faststart): -c copy -movflags +faststart
+# Непроверенные файлы (faststart_status='') подбирает movies.resume_faststart
+FASTSTART_ENABLED = config("FASTSTART_ENABLED", cast=bool, default=True)
+FASTSTART_TIMEOUT = config("FASTSTART_TIMEOUT", cast=int, default=60 * 60)
+FASTSTART_WORK_DIR = config("FASTSTART_WORK_DIR", default=str(BASE_DIR / "var" / "faststart"))
+# HLS-лесенка (movies.package_hls): (имя, высота, видео кбит/с, аудио кбит/с)
+HLS_ENABLED = config("HLS_ENABLED", cast=bool, default=True)
+HLS_LADDER = [
+    ("1080p", 1080, 5000, 192),
+    ("720p", 720, 2800, 128),
+    ("480p", 480, 1400, 128),
+    ("360p", 360, 800, 96),
+]
+HLS_SEGMENT_SECONDS = config("HLS_SEGMENT_SECONDS", cast=int, default=6)
+HLS_X264_PRESET = config("HLS_X264_PRESET", default="veryfast")
+HLS_TRANSCODE_TIMEOUT = config("HLS_TRANSCODE_TIMEOUT", cast=int, default=6 * 60 * 60)  # на одну ступень
+HLS_UPLOAD_CONCURRENCY = config("HLS_UPLOAD_CONCURRENCY", cast=int, default=8)
+HLS_WORK_DIR = config("HLS_WORK_DIR", default=str(BASE_DIR / "var" / "hls"))
+# Пакеты, застрявшие в processing дольше этого, movies.resume_hls ставит в очередь снова
+HLS_STALE_MINUTES = config("HLS_STALE_MINUTES", cast=int, default=60)
+# Ссылки на сегменты в плейлисте живут дольше ссылки на сам плейлист — на весь просмотр
+HLS_SEGMENT_URL_EXP_SECONDS = config("HLS_SEGMENT_URL_EXP_SECONDS", cast=int, default=6 * 60 * 60)
+# Внешний адрес API для ссылок на плейлисты и локальный поток (пусто — относительные ссылки)
+HLS_PROXY_BASE_URL = config("HLS_PROXY_BASE_URL", default="")
+# Превью перемотки (movies.build_trickplay): кадр каждые INTERVAL сек, листы COLUMNS×ROWS
+TRICKPLAY_ENABLED = config("TRICKPLAY_ENABLED", cast=bool, default=True)
+TRICKPLAY_INTERVAL = config("TRICKPLAY_INTERVAL", cast=int, default=10)
+TRICKPLAY_WIDTH = config("TRICKPLAY_WIDTH", cast=int, default=240)
+TRICKPLAY_COLUMNS = config("TRICKPLAY_COLUMNS", cast=int, default=10)
+TRICKPLAY_ROWS = config("TRICKPLAY_ROWS", cast=int, default=10)
+TRICKPLAY_FORMAT = config("TRICKPLAY_FORMAT", default="jpg")  # jpg | webp (нужен ffmpeg с libwebp)
+# Декодировать только ключевые кадры: в разы быстрее, превью точно до длины GOP
+TRICKPLAY_KEYFRAMES_ONLY = config("TRICKPLAY_KEYFRAMES_ONLY", cast=bool, default=True)
+TRICKPLAY_TIMEOUT = config("TRICKPLAY_TIMEOUT", cast=int, default=2 * 60 * 60)
+
+
 AUTH_USER_MODEL = "accounts.User"  # Указываем кастомную модель пользователя
 
 # Валидация паролей
@@ -160,6 +243,8 @@ REST_FRAMEWORK = {
     "DEFAULT_PARSER_CLASSES": [
         "rest_framework.parsers.JSONParser",  # Принимаем данные в формате JSON
     ],
+    "DEFAULT_PAGINATION_CLASS": "netflixBack.pagination.DefaultCursorPagination",  # Keyset-пагинация
+    "PAGE_SIZE": 24,
 }
 
 if DEBUG:
@@ -214,8 +299,16 @@ LOGGING = {
 }
 
 # --- Streaming / Play ---
-STREAM_BACKEND = config("STREAM_BACKEND", default="AZURE")          # AZURE (наш случай)
+STREAM_BACKEND = config("STREAM_BACKEND", default="AZURE")          # AZURE (наш случай) | LOCAL (FileSystemStorage)
+# LOCAL: файлы отдаёт subscribe.views.local_stream; '' — сам Django (sendfile через wsgi.file_wrapper),
+# 'nginx' — X-Accel-Redirect на internal-location STREAM_LOCAL_ACCEL_PREFIX (alias на MEDIA_ROOT), 'apache' — X-Sendfile
+STREAM_LOCAL_OFFLOAD = config("STREAM_LOCAL_OFFLOAD", default="")
+STREAM_LOCAL_ACCEL_PREFIX = config("STREAM_LOCAL_ACCEL_PREFIX", default="/protected-media/")
 STREAM_URL_EXP_SECONDS = config("STREAM_URL_EXP_SECONDS", cast=int, default=900)  # TTL SAS-ссылки, сек
+# Кэш SAS-подписей (subscribe/services/sas_cache): выданная ссылка живёт не меньше SAS_MIN_REMAINING_SECONDS
+SAS_MIN_REMAINING_SECONDS = config("SAS_MIN_REMAINING_SECONDS", cast=int, default=600)
+SAS_EXPIRY_STEP_SECONDS = config("SAS_EXPIRY_STEP_SECONDS", cast=int, default=60)
+SAS_CACHE_SIZE = config("SAS_CACHE_SIZE", cast=int, default=50_000)
 
 # --- Azure Storage (django-storages) ---
 AZURE_ACCOUNT_NAME = config("AZURE_ACCOUNT_NAME")                     
@@ -292,6 +385,38 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'apps.payment.tasks.retry_failed_webhook_events',
         'schedule': 3600.0,  # Каждый час
     },
+    "movies-flush-progress": {
+        "task": "movies.flush_progress",
+        "schedule": 15.0,                    # каждые 15 секунд
+    },
+    "movies-flush-view-counters": {
+        "task": "movies.flush_view_counters",
+        "schedule": 60.0,                    # каждую минуту
+    },
+    "movies-build-similarity": {
+        "task": "movies.build_similarity",
+        "schedule": 60 * 60 * 24,            # каждый день
+    },
+    "movies-train-als": {
+        "task": "movies.train_als",
+        "schedule": 60 * 60 * 24,            # каждый день
+    },
+    "movies-refresh-trending": {
+        "task": "movies.refresh_trending",
+        "schedule": 300.0,                   # каждые 5 минут
+    },
+    "movies-refresh-daily-stats": {
+        "task": "movies.refresh_daily_stats",
+        "schedule": 600.0,                   # каждые 10 минут
+    },
+    "movies-resume-hls": {
+        "task": "movies.resume_hls",
+        "schedule": 1800.0,                  # каждые 30 минут
+    },
+    "movies-resume-faststart": {
+        "task": "movies.resume_faststart",
+        "schedule": 1800.0,                  # непроверенные на faststart файлы — через ingest
+    },
     "movies-refresh-stale-every-10-min": {
         "task": "movies.refresh_stale_movies",
         "schedule": 600.0,                   # каждые 10 минут (в секундах)
@@ -105,7 +105,7 @@ class EndpointsSmokeTest(APITestCase):
         # Get genre ID
         glist = self.client.get(API_BASE + "genres/")
         self.assertEqual(glist.status_code, status.HTTP_200_OK)
-        genre_id = next((i["id"] for i in glist.data if i["name"] == "Action"), None)
+        genre_id = next((i["id"] for i in glist.data["results"] if i["name"] == "Action"), None)
         self.assertIsNotNone(genre_id, "Genre id not found")
 
         # Create Movie
@@ -126,7 +126,7 @@ class EndpointsSmokeTest(APITestCase):
         # Verify movie in list
         mlist = self.client.get(API_BASE + "movies/")
         self.assertEqual(mlist.status_code, status.HTTP_200_OK)
-        m_slug = next((i["slug"] for i in mlist.data if i["title"] == title), None)
+        m_slug = next((i["slug"] for i in mlist.data["results"] if i["title"] == title), None)
         self.assertIsNotNone(m_slug, "Movie slug not found in list after create")
 
         # Get movie detail
@@ -151,7 +151,7 @@ class EndpointsSmokeTest(APITestCase):
             format="json"
         ).data
 
-        glist = self.client.get(API_BASE + "genres/").data
+        glist = self.client.get(API_BASE + "genres/").data["results"]
         gid = next((i["id"] for i in glist if i["slug"] == g["slug"]), None)
         self.assertIsNotNone(gid, "Genre id not found")
 
@@ -168,7 +168,7 @@ class EndpointsSmokeTest(APITestCase):
         )
         self.assertEqual(m.status_code, status.HTTP_201_CREATED, m.data)
 
-        mlist = self.client.get(API_BASE + "movies/").data
+        mlist = self.client.get(API_BASE + "movies/").data["results"]
         slug = next((i["slug"] for i in mlist if i["title"] == "Space"), None)
         self.assertIsNotNone(slug, "Movie slug not found")
 
@@ -442,7 +442,7 @@ class PermissionsTest(APITestCase):
         self.assertEqual(a.status_code, status.HTTP_201_CREATED)
 
         # Movie
-        glist = self.client.get(API_BASE + "genres/").data
+        glist = self.client.get(API_BASE + "genres/").data["results"]
         gid = glist[0]["id"]
 
         m = self.client.post(
@@ -540,7 +540,7 @@ class EdgeCasesTest(APITestCase):
         g = self.client.post(API_BASE + "genres/", {"name": "Test"}, format="json")
         a = self.client.post(API_BASE + "authors/", {"name": "Test"}, format="json")
         
-        glist = self.client.get(API_BASE + "genres/").data
+        glist = self.client.get(API_BASE + "genres/").data["results"]
         m = self.client.post(
             API_BASE + "movies/",
             {
@@ -553,7 +553,7 @@ class EdgeCasesTest(APITestCase):
             format="json"
         )
 
-        mlist = self.client.get(API_BASE + "movies/").data
+        mlist = self.client.get(API_BASE + "movies/").data["results"]
         slug = mlist[0]["slug"]
 
         self.client.force_login(self.user)
@@ -578,7 +578,7 @@ class EdgeCasesTest(APITestCase):
         g = self.client.post(API_BASE + "genres/", {"name": "Test"}, format="json")
         a = self.client.post(API_BASE + "authors/", {"name": "Test"}, format="json")
         
-        glist = self.client.get(API_BASE + "genres/").data
+        glist = self.client.get(API_BASE + "genres/").data["results"]
         m = self.client.post(
             API_BASE + "movies/",
             {
@@ -591,7 +591,7 @@ class EdgeCasesTest(APITestCase):
             format="json"
         )
 
-        mlist = self.client.get(API_BASE + "movies/").data
+        mlist = self.client.get(API_BASE + "movies/").data["results"]
         slug = mlist[0]["slug"]
 
         self.client.force_login(self.user)
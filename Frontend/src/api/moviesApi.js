@@ -1,5 +1,8 @@
 import api from './axios';
 
+// Поля карточки фильма для рядов каталога (sparse fieldsets, см. ?fields= в API)
+export const MOVIE_CARD_FIELDS = 'id,title,slug,poster,year,genres,likes';
+
 export const moviesApi = {
   // Получить список фильмов
   getMovies: async (params = {}) => {
@@ -7,6 +10,12 @@ export const moviesApi = {
     return response.data;
   },
 
+  // Подсказки для строки поиска: [{ type, id, slug, label, weight }, ...]
+  suggest: async (q, limit = 8) => {
+    const response = await api.get('/api/v1/movies/suggest/', { params: { q, limit } });
+    return response.data.results;
+  },
+
   // Получить фильм по slug
   getMovie: async (slug) => {
     const response = await api.get(`/api/v1/movies/movies/${slug}/`);
@@ -66,9 +75,39 @@ export const moviesApi = {
     return response.data;
   },
 
+  // Продолжить просмотр: [{ movie: { id, title, slug, poster, year }, position_sec, duration_sec, ... }]
+  getContinueWatching: async (limit = 20) => {
+    const response = await api.get('/api/v1/movies/me/continue/', { params: { limit } });
+    return response.data.results;
+  },
+
+  // «Потому что вы смотрели»: похожие фильмы по истории просмотров
+  getBecauseYouWatched: async (slug, params = {}) => {
+    const response = await api.get(`/api/v1/movies/movies/${slug}/because-you-watched/`, { params });
+    return response.data.results;
+  },
+
+  // Похожие по составу (жанры, актёры, автор)
+  getSimilarMovies: async (slug, params = {}) => {
+    const response = await api.get(`/api/v1/movies/movies/${slug}/similar/`, { params });
+    return response.data.results;
+  },
+
+  // «Сейчас в тренде»
+  getTrendingMovies: async (params = {}) => {
+    const response = await api.get('/api/v1/movies/movies/trending/', { params });
+    return response.data.results;
+  },
+
+  // Персональные рекомендации
+  getRecommendations: async (params = {}) => {
+    const response = await api.get('/api/v1/movies/me/recommendations/', { params });
+    return response.data.results;
+  },
+
   // Мои просмотренные
-  getWatchedMovies: async () => {
-    const response = await api.get('/api/v1/movies/me/watched/');
+  getWatchedMovies: async (params = {}) => {
+    const response = await api.get('/api/v1/movies/me/watched/', { params });
     return response.data;
   },
 };
\ No newline at end of file
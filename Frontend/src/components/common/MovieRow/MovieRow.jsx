@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import './MovieRow.css';
-import { moviesApi } from '../../../api/moviesApi';
+import { moviesApi, MOVIE_CARD_FIELDS } from '../../../api/moviesApi';
 import MovieCard from '../MovieCard';
 
 const MovieRow = ({ title, type, onMovieClick, isLoggedIn }) => {
@@ -21,21 +21,24 @@ const MovieRow = ({ title, type, onMovieClick, isLoggedIn }) => {
 
       if (type === 'watched' && isLoggedIn) {
         // Загружаем просмотренные фильмы
-        data = await moviesApi.getWatchedMovies();
+        data = await moviesApi.getWatchedMovies({ fields: MOVIE_CARD_FIELDS });
       } else if (type === 'year') {
         // Фильмы текущего года
         const currentYear = new Date().getFullYear();
-        data = await moviesApi.getMovies({ year: currentYear, ordering: '-views' });
+        data = await moviesApi.getMovies({ year: currentYear, ordering: '-views', page_size: 10, fields: MOVIE_CARD_FIELDS });
       } else if (type === 'popular') {
         // Популярные фильмы
-        data = await moviesApi.getMovies({ ordering: '-views' });
+        data = await moviesApi.getMovies({ ordering: '-views', page_size: 10, fields: MOVIE_CARD_FIELDS });
       } else {
         // Все фильмы
-        data = await moviesApi.getMovies();
+        data = await moviesApi.getMovies({ page_size: 10, fields: MOVIE_CARD_FIELDS });
       }
 
+      // Списки пагинированы курсором: { next, previous, results }
+      const items = Array.isArray(data) ? data : (data?.results ?? []);
+
       // Ограничиваем до 10 фильмов
-      setMovies(Array.isArray(data) ? data.slice(0, 10) : []);
+      setMovies(items.slice(0, 10));
     } catch (err) {
       console.error('Error loading movies:', err);
       setError('Не удалось загрузить фильмы');
@@ -1,5 +1,5 @@
 import { useEffect, useState } from "react";
-import { moviesApi } from "../../api/moviesApi";
+import { moviesApi, MOVIE_CARD_FIELDS } from "../../api/moviesApi";
 
 export default function BrowsePage({ onMovieClick }) {
   const [rows, setRows] = useState([
@@ -11,7 +11,7 @@ export default function BrowsePage({ onMovieClick }) {
   useEffect(() => {
     rows.forEach(async (row, idx) => {
       try {
-        const data = await moviesApi.getMovies(row.params);
+        const data = await moviesApi.getMovies({ ...row.params, fields: MOVIE_CARD_FIELDS });
         setRows((old) => old.map((r, i) => i === idx ? ({ ...r, items: data.results || data, loading: false }) : r));
       } catch {
         setRows((old) => old.map((r, i) => i === idx ? ({ ...r, items: [], loading: false }) : r));